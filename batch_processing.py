@@ -0,0 +1,537 @@
+"""Process rows of music data: search all data sources for each row, decide
+which MARC record (if any) to create, and write records and log messages
+in input order.  Also the naming and merging of each batch's output files.
+"""
+
+import asyncio
+import copy
+import logging
+import os
+from collections import Counter, deque
+from contextvars import ContextVar, copy_context
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, Iterator, NamedTuple
+from pymarc import Record
+from create_marc_record import (
+    BackgroundMarcWriter,
+    add_local_fields,
+    add_worldcat_fields,
+    create_discogs_record,
+    create_musicbrainz_record,
+)
+from data_evaluator import (
+    any_record_has_clu_async,
+    get_all_publisher_numbers,
+    get_best_worldcat_record,
+    get_discogs_records_async,
+    get_fallback_worldcat_records_async,
+    get_marc_problems,
+    get_musicbrainz_records_async,
+    get_unique_titles,
+    get_usable_records,
+    get_worldcat_records_async,
+    triage_brief_records,
+)
+from journal import DECIDED, SEARCHED, WRITTEN, BatchJournal, read_entries
+from music_data import MusicDataRow
+from searchers.aio import (
+    AsyncDiscogsClient,
+    AsyncMusicbrainzClient,
+    AsyncWorldcatClient,
+)
+from searchers.barcodes import normalize_barcode
+from title_similarity import normalize
+
+logger = logging.getLogger()
+
+# Log records emitted while a row is being processed are held here until
+# the row is finished, so rows processed concurrently are logged in input order.
+row_log_records: ContextVar[list | None] = ContextVar("row_log_records", default=None)
+# Set while looking up data for several rows at once.
+batch_lookup: ContextVar[bool] = ContextVar("batch_lookup", default=False)
+
+
+class RowLogHandler(logging.Handler):
+    """Wrap another handler, holding back records emitted while processing
+    a row (see row_log_records) and passing all others straight through.
+    Records from batch lookups (see batch_lookup) belong to no row: warnings
+    and errors are passed straight through, and the rest are discarded.
+    """
+
+    def __init__(self, target: logging.Handler) -> None:
+        super().__init__()
+        self.target = target
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if batch_lookup.get():
+            if record.levelno >= logging.WARNING:
+                self.target.handle(record)
+            return
+        buffered_records = row_log_records.get()
+        if buffered_records is None:
+            self.target.handle(record)
+        else:
+            buffered_records.append(record)
+
+    def flush(self) -> None:
+        self.target.flush()
+
+    def close(self) -> None:
+        self.target.close()
+        super().close()
+
+
+class Shard(NamedTuple):
+    """A contiguous range of rows, processed by one worker process."""
+
+    number: int
+    input_filename: str
+    start_index: int
+    end_index: int
+    completed_rows: set
+    log_level: str
+    # Other keyword arguments for run_batch().
+    options: dict
+
+
+def split_range(indexes: range, count: int) -> list[range]:
+    """Split indexes into (at most) count contiguous ranges, as equal in size
+    as possible.
+    """
+    size, extra = divmod(len(indexes), count)
+    ranges = []
+    start = indexes.start
+    for number in range(count):
+        stop = start + size + (1 if number < extra else 0)
+        if stop > start:
+            ranges.append(range(start, stop))
+        start = stop
+    return ranges
+
+
+def merge_shard_output(
+    shard: Shard, marc_filenames: dict, logging_filename: str, journal: BatchJournal
+) -> None:
+    """Append a finished shard's MARC records and log messages to the batch's
+    files, and its journal entries (with offsets adjusted) to the batch journal.
+    Shard files are removed once merged.
+    """
+    shard_filenames = get_shard_filenames(shard.input_filename, shard.number)
+    # Sizes of the batch's MARC files before this shard's records are added.
+    base_offsets = {}
+    for file_type, marc_filename in marc_filenames.items():
+        shard_marc_path = Path(shard_filenames["marc"][file_type])
+        marc_path = Path(marc_filename)
+        base_offsets[file_type] = marc_path.stat().st_size if marc_path.exists() else 0
+        if shard_marc_path.exists():
+            with open(marc_path, "ab") as f:
+                f.write(shard_marc_path.read_bytes())
+                f.flush()
+                os.fsync(f.fileno())
+            shard_marc_path.unlink()
+
+    # The batch log may have messages from this process already; keep them all.
+    for handler in logger.handlers:
+        handler.flush()
+    shard_log_path = Path(shard_filenames["log"])
+    with open(logging_filename, "ab") as f:
+        f.write(shard_log_path.read_bytes())
+    shard_log_path.unlink()
+
+    shard_journal_path = Path(shard_filenames["journal"])
+    written_rows = []
+    for entry in read_entries(shard_filenames["journal"]):
+        idx = entry.pop("row")
+        state = entry.pop("state")
+        if state == WRITTEN:
+            offsets = {
+                file_type: offset + base_offsets[file_type]
+                for file_type, offset in entry["offsets"].items()
+            }
+            written_rows.append((idx, entry["file_type"], offsets))
+        else:
+            journal.record(idx, state, **entry)
+    journal.commit_rows(written_rows)
+    shard_journal_path.unlink()
+
+
+async def process_rows(
+    rows: Iterable[MusicDataRow],
+    start_index: int,
+    clients: tuple[AsyncWorldcatClient, AsyncDiscogsClient, AsyncMusicbrainzClient],
+    output: BackgroundMarcWriter,
+    no_cases: bool = False,
+    concurrency: int = 1,
+    journal: BatchJournal | None = None,
+    completed_rows: set | None = None,
+    search_batch_size: int = 1,
+    group_sizes: Counter | None = None,
+) -> None:
+    """Process rows of music data, keeping up to `concurrency` rows in flight
+    at once.  Rows may finish in any order, but their log messages and
+    MARC records are written in input order.
+
+    Rows in completed_rows (by index) are skipped.  If journal is given,
+    each row's progress is recorded there.  If search_batch_size is more
+    than 1, Worldcat and MusicBrainz are searched for the UPCs of that many
+    rows at a time.
+
+    group_sizes (from count_row_groups) gives the number of rows to be processed
+    in each group of rows with the same UPC and title; each group's first row
+    decides which record to create, and the rest of the group reuse that decision.
+    """
+    completed_rows = completed_rows or set()
+    worldcat_client, _, musicbrainz_client = clients
+    rows_to_process = (
+        (idx, row)
+        for idx, row in enumerate(rows, start=start_index)
+        if idx not in completed_rows
+    )
+    # Rows which have been started, oldest first, with their held-back log records.
+    pending: deque[tuple[int, asyncio.Task, list]] = deque()
+    # Decisions for groups of rows, until the last row of each group is started.
+    remaining_rows = Counter(group_sizes)
+    shared_decisions: dict[tuple[str, str], SharedDecision] = {}
+    for chunk in chunked(rows_to_process, search_batch_size):
+        if search_batch_size > 1:
+            # Only the first row of each group searches; the rest reuse its decision.
+            upc_codes = []
+            group_keys = set(shared_decisions)
+            for _, row in chunk:
+                key = get_row_group_key(row)
+                if group_sizes and group_sizes[key] > 1:
+                    if key in group_keys:
+                        continue
+                    group_keys.add(key)
+                upc_codes.append(get_next_data_row(row)[0])
+            upc_codes = list(dict.fromkeys(upc for upc in upc_codes if upc))
+            if upc_codes:
+                # Batch lookups serve several rows, so their log messages belong
+                # to none of them (see RowLogHandler).
+                batch_context = copy_context()
+                batch_context.run(batch_lookup.set, True)
+                batch_context.run(
+                    worldcat_client.prefetch, upc_codes, "sn", triage_brief_records
+                )
+                batch_context.run(musicbrainz_client.prefetch, upc_codes)
+        for idx, row in chunk:
+            if len(pending) >= concurrency:
+                await finish_row(*pending.popleft(), output)
+            shared_decision = None
+            key = get_row_group_key(row)
+            if group_sizes and group_sizes[key] > 1:
+                shared_decision = shared_decisions.setdefault(
+                    key,
+                    SharedDecision(idx, asyncio.get_running_loop().create_future()),
+                )
+                remaining_rows[key] -= 1
+                if remaining_rows[key] == 0:
+                    del shared_decisions[key]
+            log_records = []
+            task = asyncio.create_task(
+                process_row(
+                    idx, row, clients, no_cases, log_records, journal, shared_decision
+                )
+            )
+            pending.append((idx, task, log_records))
+    while pending:
+        await finish_row(*pending.popleft(), output)
+
+
+def get_row_group_key(row: MusicDataRow) -> tuple[str, str] | None:
+    """Return the key for grouping rows which can share one decision:
+    normalized UPC and title.  Rows without a UPC aren't grouped (None).
+    """
+    upc_code, _, _, official_title = get_next_data_row(row)
+    normalized_upc = normalize_barcode(upc_code)
+    if not normalized_upc:
+        return None
+    return normalized_upc, normalize(official_title)
+
+
+def count_row_groups(
+    rows: Iterable[MusicDataRow], start_index: int, completed_rows: set
+) -> Counter:
+    """Count the rows to be processed (those not in completed_rows)
+    in each group of rows which can share one decision.
+    """
+    keys = (
+        get_row_group_key(row)
+        for idx, row in enumerate(rows, start=start_index)
+        if idx not in completed_rows
+    )
+    return Counter(key for key in keys if key is not None)
+
+
+def chunked(items: Iterable, size: int) -> Iterator[list]:
+    """Yield lists of up to size items at a time."""
+    iterator = iter(items)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+async def finish_row(
+    idx: int,
+    task: asyncio.Task,
+    log_records: list,
+    output: BackgroundMarcWriter,
+) -> None:
+    """Wait for a row to be processed, then log its messages and queue its
+    MARC record (if any) to be written.  The row is journaled as written
+    once its record is safely on disk.
+    """
+    try:
+        marc_record, file_type = await task
+    finally:
+        # Log messages even if processing failed, to help with debugging.
+        for record in log_records:
+            logger.handle(record)
+    # Only waits if the writer has fallen far behind;
+    # keep the event loop free meanwhile.
+    await asyncio.to_thread(output.write_row, idx, marc_record, file_type)
+
+
+class RowDecision(NamedTuple):
+    """Which MARC record (if any) to create for a row, before local fields
+    are added, and why the CD should be reviewed (if it should).
+    """
+
+    marc_record: Record | None
+    # Type of file the record belongs in ("oclc" or "orig"), or None.
+    file_type: str | None
+    # Reasons for review, as logged with "Pull CD for review".
+    reviews: list[str]
+    held_by_clu: bool = False
+
+
+class SharedDecision(NamedTuple):
+    """Decision for a group of rows with the same UPC and title (see
+    get_row_group_key), made by the first row of the group.
+    """
+
+    first_idx: int
+    future: asyncio.Future
+
+
+async def process_row(
+    idx: int,
+    row: MusicDataRow,
+    clients: tuple[AsyncWorldcatClient, AsyncDiscogsClient, AsyncMusicbrainzClient],
+    no_cases: bool,
+    log_records: list,
+    journal: BatchJournal | None = None,
+    shared_decision: SharedDecision | None = None,
+) -> tuple[Record | None, str | None]:
+    """Search all data sources for one row of music data, and decide which
+    MARC record (if any) to create.  If the row is part of a group sharing a
+    decision, only the group's first row searches; the others reuse its decision,
+    each with its own local fields.
+
+    Returns the MARC record and the type of file it belongs in ("oclc" or "orig"),
+    or (None, None) if no record should be written.
+    """
+    # Hold back log messages until finish_row(); this only affects this task.
+    row_log_records.set(log_records)
+
+    logger.info(f"Starting row {idx}")
+    upc_code, call_number, barcode, official_title = get_next_data_row(row)
+    logger.info(f"{call_number}: Searching for {upc_code} ({official_title})")
+
+    if shared_decision is None:
+        decision = await decide_row(
+            idx, upc_code, call_number, official_title, clients, journal
+        )
+    elif shared_decision.first_idx == idx:
+        try:
+            decision = await decide_row(
+                idx, upc_code, call_number, official_title, clients, journal
+            )
+        except Exception as ex:
+            shared_decision.future.set_exception(ex)
+            raise
+        shared_decision.future.set_result(decision)
+    else:
+        decision = await shared_decision.future
+        logger.info(
+            f"\tSame UPC and title as row {shared_decision.first_idx}: "
+            "using its decision"
+        )
+        if journal:
+            journal.record(idx, SEARCHED, upc=upc_code)
+        for review in decision.reviews:
+            logger.info(
+                f"\tPull CD for review [{review}]: {call_number} ({official_title})"
+            )
+
+    marc_record, file_type = decision.marc_record, decision.file_type
+    # Rows sharing a decision each get their own copy of the record.
+    if marc_record and shared_decision is not None:
+        marc_record = copy.deepcopy(marc_record)
+
+    # Finally, add local fields to the record, or log a message.
+    # The record is written to file by finish_row(), in input order.
+    if marc_record:
+        marc_record = add_local_fields(marc_record, barcode, call_number, no_cases)
+    elif not decision.held_by_clu:
+        # No suitable data at all.
+        logger.info("MARC not created: no data available")
+        logger.info(
+            "\tPull CD for review [no record created]: "
+            f"{call_number} ({official_title})"
+        )
+
+    if journal:
+        journal.record(idx, DECIDED, file_type=file_type)
+
+    # End of this row of data.
+    logger.info(f"Finished row {idx}\n")
+    return marc_record, file_type
+
+
+async def decide_row(
+    idx: int,
+    upc_code: str,
+    call_number: str,
+    official_title: str,
+    clients: tuple[AsyncWorldcatClient, AsyncDiscogsClient, AsyncMusicbrainzClient],
+    journal: BatchJournal | None = None,
+) -> RowDecision:
+    """Search all data sources for a UPC, and decide which MARC record (if any)
+    to create, without local fields.
+    """
+    worldcat_client, discogs_client, musicbrainz_client = clients
+    reviews = []
+
+    def review(reason: str) -> None:
+        reviews.append(reason)
+        logger.info(
+            f"\tPull CD for review [{reason}]: {call_number} ({official_title})"
+        )
+
+    # Search Discogs, MusicBrainz and Worldcat (by UPC) at the same time,
+    # since these searches don't depend on each other.
+    # Among other data, collect music publisher number(s) from Discogs/MusicBrainz.
+    discogs_records, musicbrainz_records, worldcat_records = await asyncio.gather(
+        get_discogs_records_async(discogs_client, search_term=upc_code),
+        get_musicbrainz_records_async(musicbrainz_client, search_term=upc_code),
+        get_worldcat_records_async(
+            worldcat_client, search_terms=upc_code, search_index="sn"
+        ),
+    )
+    logger.info(f"\tFound {len(discogs_records)} Discogs records")
+    logger.info(f"\tFound {len(musicbrainz_records)} MusicBrainz records")
+    if journal:
+        journal.record(idx, SEARCHED, upc=upc_code)
+
+    # Worldcat records can only be evaluated once titles from all sources are known.
+    unique_titles = get_unique_titles(
+        discogs_records=discogs_records,
+        musicbrainz_records=musicbrainz_records,
+        official_title=official_title,
+    )
+    usable_records = get_usable_records(worldcat_records, unique_titles)
+
+    if not usable_records:
+        # If initial search on UPC didn't find anything, try searching for
+        # the music publisher numbers from Discogs/MusicBrainz, along with
+        # other forms of the UPC, all in one query.
+        publisher_numbers = get_all_publisher_numbers(
+            discogs_records, musicbrainz_records
+        )
+        logger.info(
+            "\tSearching Worldcat again for music publisher numbers: "
+            f"{publisher_numbers}"
+        )
+        worldcat_records = await get_fallback_worldcat_records_async(
+            worldcat_client, upc_code=upc_code, publisher_numbers=publisher_numbers
+        )
+        usable_records = get_usable_records(worldcat_records, unique_titles)
+
+    # If ANY WorldCat record we found is held by CLU, reject the whole set
+    # and exit this row: we don't want to add any dup, from any source.
+    if await any_record_has_clu_async(worldcat_client, usable_records):
+        # Detailed message was logged in routine; add broader info here.
+        review("held by CLU")
+        return RowDecision(None, None, reviews, held_by_clu=True)
+
+    # Select the best available Worldcat record.
+    worldcat_candidate = get_best_worldcat_record(usable_records)
+
+    # Update (or create) final MARC record where possible.
+    # If there's a Worldcat record, use it;
+    # otherwise, prefer Discogs data over MusicBrainz.
+    file_type = None
+    if worldcat_candidate:
+        logger.info(f"\tWinner: OCLC# {worldcat_candidate.oclc_number}")
+        # Only the winning candidate needs a full MARC record.
+        worldcat_record = worldcat_candidate.record
+        # Report on problems with this Worldcat record, if any;
+        # these may require cataloger review, but we'll still use the record.
+        marc_problems = get_marc_problems(worldcat_record)
+        if marc_problems:
+            review(f"{len(marc_problems)} MARC warning(s)")
+        for problem in marc_problems:
+            logger.info(f"\t\tREVIEW: {problem}")
+        marc_record = add_worldcat_fields(worldcat_record)
+        file_type = "oclc"
+    elif discogs_record := await discogs_client.get_full_data(discogs_records):
+        # Only the Discogs release used for the record needs full release data.
+        marc_record = create_discogs_record(data=discogs_record)
+        file_type = "orig"
+        review("DC original created")
+    elif musicbrainz_records:
+        marc_record = create_musicbrainz_record(data=musicbrainz_records[0])
+        file_type = "orig"
+        review("MB original created")
+    else:
+        # None of the data sources provided usable data.
+        marc_record = None
+    return RowDecision(marc_record, file_type, reviews)
+
+
+def get_next_data_row(row: MusicDataRow) -> tuple[str, str, str, str]:
+    """Clean up source data for consistency.
+    Return as individual values.
+    """
+    upc_code = row.upc.strip()
+    call_number = row.call_number.strip()
+    # Barcodes should always be uppercase.
+    barcode = row.barcode.strip().upper()
+    official_title = row.title.strip()
+    return upc_code, call_number, barcode, official_title
+
+
+def get_marc_filename(input_filename: str, file_type: str) -> str:
+    """Get the name of the file where MARC records of the given type
+    will be written, based on the input filename.
+    """
+    base = Path(input_filename).stem
+    return f"{base}_{file_type}.mrc"
+
+
+def get_journal_filename(input_filename: str) -> str:
+    """Get the name of the journal file to be used, based on the input filename."""
+    base = Path(input_filename).stem
+    return f"{base}_journal.jsonl"
+
+
+def get_shard_filenames(input_filename: str, number: int) -> dict:
+    """Get the names of the files one shard writes, before they are merged
+    into the batch's files: "marc" (a dict, like marc_filenames), "log" and "journal".
+    """
+    shard_filename = f"{Path(input_filename).stem}_shard{number:03d}"
+    return {
+        "marc": {
+            "oclc": get_marc_filename(shard_filename, "oclc"),
+            "orig": get_marc_filename(shard_filename, "orig"),
+        },
+        "log": get_logging_filename(shard_filename),
+        "journal": get_journal_filename(shard_filename),
+    }
+
+
+def get_logging_filename(input_filename: str) -> str:
+    """Get the name of the logfile to be used, based on the input filename."""
+    base = Path(input_filename).stem
+    return f"{base}.log"
@@ -0,0 +1,91 @@
+"""Compare speed of title similarity scoring using strsimpy, as previously
+done, with title_similarity, on long classical titles like those built from
+MARC 245 $a $n $p $b.
+"""
+
+import argparse
+import timeit
+from strsimpy import NormalizedLevenshtein
+import title_similarity
+
+# Pairs of (MARC full title, title from another source), as compared
+# by data_evaluator.title_is_close_enough().
+TITLE_PAIRS = [
+    (
+        "Symphonies. No. 4, op. 60, in B flat major Symphonies. No. 7, op. 92, "
+        "in A major Wiener Philharmoniker",
+        "Beethoven: Symphonies Nos. 4 & 7 - Vienna Philharmonic, Carlos Kleiber",
+    ),
+    (
+        "Der Ring des Nibelungen. Die Walküre. Erster Aufzug highlights "
+        "from the Bayreuth Festival",
+        "Wagner: Die Walküre, Act 1 (Live at Bayreuth)",
+    ),
+    (
+        "Goldberg-Variationen, BWV 988 Aria mit verschiedenen Veränderungen "
+        "vors Clavicimbal mit 2 Manualen",
+        "Bach: Goldberg Variations BWV 988",
+    ),
+    (
+        "Le nozze di Figaro. Atto secondo. Porgi amor ; Dove sono ; Voi che "
+        "sapete arias for soprano and orchestra",
+        "Mozart Arias: Le Nozze di Figaro, Don Giovanni, Così fan tutte",
+    ),
+    (
+        "Quartets, strings, no. 14, D. 810, D minor (Death and the maiden) "
+        "Quartettsatz, D. 703, C minor",
+        "Schubert: String Quartet No. 14 'Death and the Maiden'; Quartettsatz",
+    ),
+]
+
+
+def score_with_strsimpy() -> None:
+    """Score all pairs as data_evaluator originally did."""
+    for title_1, title_2 in TITLE_PAIRS:
+        comparator = NormalizedLevenshtein()
+        comparator.similarity(
+            title_similarity.normalize.__wrapped__(title_1),
+            title_similarity.normalize.__wrapped__(title_2),
+        )
+
+
+def score_uncached() -> None:
+    """Score all pairs with the bit-parallel kernel, without memoization."""
+    for title_1, title_2 in TITLE_PAIRS:
+        title_similarity.normalized_similarity.__wrapped__(
+            title_similarity.normalize.__wrapped__(title_1),
+            title_similarity.normalize.__wrapped__(title_2),
+        )
+
+
+def score_cached() -> None:
+    """Score all pairs as data_evaluator now does."""
+    for title_1, title_2 in TITLE_PAIRS:
+        title_similarity.title_similarity(title_1, title_2)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-n", "--number", type=int, default=200, help="Repetitions per timing"
+    )
+    args = parser.parse_args()
+
+    baseline = None
+    for name, function in [
+        ("strsimpy", score_with_strsimpy),
+        ("bit-parallel", score_uncached),
+        ("bit-parallel, cached", score_cached),
+    ]:
+        seconds = min(timeit.repeat(function, number=args.number, repeat=5))
+        per_pair = seconds / (args.number * len(TITLE_PAIRS)) * 1_000_000
+        if baseline is None:
+            baseline = seconds
+        print(
+            f"{name:>22}: {per_pair:9.2f} microseconds per pair "
+            f"({baseline / seconds:6.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
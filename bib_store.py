@@ -0,0 +1,153 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from pymarc import Record
+from searchers.worldcat import WorldcatCandidate, normalize_oclc_number
+
+# How long stored bibs are used before being retrieved from Worldcat again, in seconds.
+MAX_AGE = 30 * 24 * 60 * 60
+
+# Maximum number of values in one SQL "IN (...)" list.
+LOOKUP_BATCH_SIZE = 500
+
+
+class BibStore:
+    """Local store of full Worldcat MARC records, kept as binary MARC in a
+    SQLite database, so records seen in earlier runs don't need to be
+    retrieved and parsed again.
+
+    Records are stored once, keyed on a hash of their content, and looked up
+    by normalized OCLC number.  A record retrieved by one OCLC number may have
+    another in its 001 (e.g. when numbers have been merged); both numbers then
+    refer to the same stored record.  Records older than max_age are ignored.
+
+    Safe to share between threads.
+    """
+
+    def __init__(self, path: str, max_age: float = MAX_AGE) -> None:
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        # The connection is used from worker threads, always under self._lock.
+        # Other processes (see --workers) may hold the database briefly; wait for them.
+        self._connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("""CREATE TABLE IF NOT EXISTS records (
+                digest TEXT PRIMARY KEY,
+                marc BLOB NOT NULL
+            )""")
+        self._connection.execute("""CREATE TABLE IF NOT EXISTS oclc_numbers (
+                oclc_number TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                stored REAL NOT NULL
+            )""")
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, oclc_numbers: list) -> dict[str, Record]:
+        """Look up stored records for the given OCLC numbers, in any format
+        normalize_oclc_number accepts.
+
+        Return dict of records, keyed on OCLC number as given; numbers with
+        no fresh record are left out.  Each call returns new Record objects,
+        so callers may change them.
+        """
+        return {
+            oclc_number: candidate.record
+            for oclc_number, candidate in self.get_many_candidates(oclc_numbers).items()
+        }
+
+    def get_many_candidates(self, oclc_numbers: list) -> dict[str, WorldcatCandidate]:
+        """Look up stored records for the given OCLC numbers, as get_many()
+        does, but return them as candidates for evaluation: full Records
+        are only created if needed.
+        """
+        normalized_numbers = {
+            oclc_number: normalize_oclc_number(oclc_number)
+            for oclc_number in oclc_numbers
+        }
+        unique_numbers = list(set(normalized_numbers.values()))
+        oldest = time.time() - self.max_age
+        marc_by_number = {}
+        with self._lock:
+            for start in range(0, len(unique_numbers), LOOKUP_BATCH_SIZE):
+                batch = unique_numbers[start : start + LOOKUP_BATCH_SIZE]
+                placeholders = ", ".join("?" * len(batch))
+                rows = self._connection.execute(
+                    f"""SELECT oclc_number, marc FROM oclc_numbers
+                    JOIN records USING (digest)
+                    WHERE oclc_number IN ({placeholders}) AND stored > ?""",
+                    (*batch, oldest),
+                )
+                marc_by_number.update(rows)
+            candidates = {}
+            for oclc_number, normalized_number in normalized_numbers.items():
+                marc = marc_by_number.get(normalized_number)
+                if marc is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                    candidates[oclc_number] = WorldcatCandidate.from_marc(marc)
+        return candidates
+
+    def put_many(self, records: dict[str, Record | WorldcatCandidate]) -> None:
+        """Store records (or candidates), keyed on the OCLC number used to
+        retrieve them.  Each record is also stored under the OCLC number in
+        its own 001.
+        """
+        candidates = {
+            oclc_number: (
+                record
+                if isinstance(record, WorldcatCandidate)
+                else WorldcatCandidate.from_record(record)
+            )
+            for oclc_number, record in records.items()
+        }
+        now = time.time()
+        with self._lock:
+            self._connection.execute("BEGIN")
+            for oclc_number, candidate in candidates.items():
+                marc = candidate.as_marc21()
+                digest = hashlib.sha256(marc).hexdigest()
+                self._connection.execute(
+                    "INSERT OR IGNORE INTO records VALUES (?, ?)", (digest, marc)
+                )
+                for number in {
+                    normalize_oclc_number(oclc_number),
+                    candidate.oclc_number,
+                }:
+                    self._connection.execute(
+                        "INSERT OR REPLACE INTO oclc_numbers VALUES (?, ?, ?)",
+                        (number, digest, now),
+                    )
+            self._connection.execute("COMMIT")
+
+    def prune(self) -> None:
+        """Remove records which are too old, or no longer referred to
+        by any OCLC number.
+        """
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM oclc_numbers WHERE stored <= ?",
+                (time.time() - self.max_age,),
+            )
+            self._connection.execute("""DELETE FROM records WHERE digest NOT IN (
+                    SELECT digest FROM oclc_numbers
+                )""")
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            (records,) = self._connection.execute(
+                "SELECT COUNT(*) FROM records"
+            ).fetchone()
+            return {"hits": self.hits, "misses": self.misses, "records": records}
+
+    def close(self) -> None:
+        """Prune the store, then close it."""
+        self.prune()
+        with self._lock:
+            self._connection.close()
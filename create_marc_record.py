@@ -1,7 +1,16 @@
+import os
+import queue
+import threading
+import time
 from data_evaluator import normalize
 from datetime import datetime
+from journal import BatchJournal
 from pymarc import MARCWriter, Record, Field, Subfield
 
+# Size of the write buffer for each MARC output file, in bytes.
+# This is large enough that records normally reach the file only when flushed.
+OUTPUT_BUFFER_SIZE = 1024 * 1024
+
 
 def create_base_record() -> Record:
     """Create a base MARC record, to which metadata from an external
@@ -512,13 +521,224 @@ def create_musicbrainz_record(data: dict) -> Record:
     return add_musicbrainz_data(base_record, data)
 
 
-def write_marc_record(record: Record, filename: str) -> None:
-    """Write the record to a file in binary MARC format. Records are
-    appended to the file.
+class MarcOutputManager:
+    """Write MARC records for a whole run, keeping one buffered MARCWriter
+    open for each type of output file (e.g., "oclc" and "orig").
+
+    Output is flushed and synced to disk after every flush_records records,
+    or when flush_interval seconds have passed since the last flush, and when
+    closed.  If a journal is given, rows are committed to it as written only
+    once their records have been synced.
+
+    Files are opened when their first record is written, and appended to.
+    Use as a context manager, or call close(), so buffered records aren't lost.
     """
-    with open(filename, "ab") as f:
-        writer = MARCWriter(f)
-        writer.write(record)
+
+    def __init__(
+        self,
+        filenames: dict[str, str],
+        journal: BatchJournal | None = None,
+        flush_records: int = 100,
+        flush_interval: float = 5.0,
+    ) -> None:
+        self.filenames = filenames
+        self.journal = journal
+        self.flush_records = flush_records
+        self.flush_interval = flush_interval
+        self._files = {}
+        self._writers = {}
+        # Sizes of files not opened yet, for journal offsets.
+        self._sizes = {
+            file_type: os.path.getsize(filename) if os.path.exists(filename) else 0
+            for file_type, filename in filenames.items()
+        }
+        # Rows written since the last flush: (row index, file type, offsets).
+        self._pending_rows = []
+        self._unflushed_records = 0
+        self._last_flush = time.monotonic()
+        self.flushes = 0
+
+    def _get_writer(self, file_type: str) -> MARCWriter:
+        if file_type not in self._writers:
+            f = open(self.filenames[file_type], "ab", buffering=OUTPUT_BUFFER_SIZE)
+            self._files[file_type] = f
+            self._writers[file_type] = MARCWriter(f)
+        return self._writers[file_type]
+
+    def _get_offsets(self) -> dict[str, int]:
+        """Return the current size of each output file, including buffered data."""
+        return {
+            file_type: (
+                self._files[file_type].tell()
+                if file_type in self._files
+                else self._sizes[file_type]
+            )
+            for file_type in self.filenames
+        }
+
+    def write_row(self, idx: int, record: Record | None, file_type: str | None) -> None:
+        """Write the record (if any) for row idx to the file of the given type,
+        then flush if due.  Rows without a record are still committed to the journal.
+        """
+        self.add_row(idx, record, file_type)
+        self.flush_if_due()
+
+    def add_row(self, idx: int, record: Record | None, file_type: str | None) -> None:
+        """Write the record (if any) for row idx to the file of the given type,
+        without flushing.
+        """
+        if record:
+            self._get_writer(file_type).write(record)
+            self._unflushed_records += 1
+        self._pending_rows.append((idx, file_type, self._get_offsets()))
+
+    def flush_if_due(self) -> None:
+        """Flush if enough records have been written, or enough time has passed,
+        since the last flush.
+        """
+        if not self._pending_rows:
+            return
+        if (self._unflushed_records >= self.flush_records) or (
+            time.monotonic() - self._last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        """Write buffered records to disk and sync them, then commit their rows
+        to the journal.
+        """
+        for f in self._files.values():
+            f.flush()
+            os.fsync(f.fileno())
+        if self.journal and self._pending_rows:
+            self.journal.commit_rows(self._pending_rows)
+        self._pending_rows = []
+        self._unflushed_records = 0
+        self._last_flush = time.monotonic()
+        self.flushes += 1
+
+    def close(self) -> None:
+        """Flush any buffered records, then close all files."""
+        self.flush()
+        for writer in self._writers.values():
+            writer.close()
+        self._files = {}
+        self._writers = {}
+
+    def __enter__(self) -> "MarcOutputManager":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class BackgroundMarcWriter:
+    """Write rows through a MarcOutputManager in a background thread, so
+    serializing records and syncing them to disk don't hold up searching.
+
+    Rows are passed to the thread through a queue holding up to max_queue_size
+    rows; write_row() only waits if the queue is full.  Rows waiting in the
+    queue when a flush is due are written first, so one sync covers them all.
+    Errors in the thread are raised by the next call to write_row() or close().
+
+    The output manager is not closed by close(); the caller remains responsible.
+    """
+
+    # Put on the queue to tell the thread to stop.
+    _STOP = object()
+
+    def __init__(self, output: MarcOutputManager, max_queue_size: int = 1000) -> None:
+        self.output = output
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._error = None
+        self.rows_queued = 0
+        self.max_queue_depth = 0
+        # Number of times write_row() had to wait for room in the queue.
+        self.queue_full_waits = 0
+        self._thread = threading.Thread(
+            target=self._run, name="marc-writer", daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def queue_depth(self) -> int:
+        """Return the number of rows waiting to be written."""
+        return self._queue.qsize()
+
+    def write_row(self, idx: int, record: Record | None, file_type: str | None) -> None:
+        """Queue the record (if any) for row idx, to be written to the file
+        of the given type.
+        """
+        self._raise_error()
+        if self._queue.full():
+            self.queue_full_waits += 1
+        self._queue.put((idx, record, file_type))
+        self.rows_queued += 1
+        self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+
+    def _run(self) -> None:
+        try:
+            self._write_rows()
+        except Exception as ex:
+            self._error = ex
+            # Discard rows queued from now on, so write_row() never waits forever.
+            while self._queue.get() is not self._STOP:
+                pass
+
+    def _write_rows(self) -> None:
+        while True:
+            try:
+                # Wake up at least once per flush interval, to flush if due.
+                items = [self._queue.get(timeout=self.output.flush_interval)]
+            except queue.Empty:
+                items = []
+            # Take everything else already waiting, to write it in one group.
+            while items and items[-1] is not self._STOP:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            for item in items:
+                if item is self._STOP:
+                    return
+                self._call(self.output.add_row, *item)
+            self._call(self.output.flush_if_due)
+
+    def _call(self, func, *args) -> None:
+        """Call func, unless an earlier call failed; keep any exception for
+        the main thread.  After a failure, queued rows are discarded, so
+        write_row() never waits forever.
+        """
+        if self._error is None:
+            try:
+                func(*args)
+            except Exception as ex:
+                self._error = ex
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            raise RuntimeError("MARC writer thread failed") from self._error
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "rows": self.rows_queued,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "queue_full_waits": self.queue_full_waits,
+            "flushes": self.output.flushes,
+        }
+
+    def close(self) -> None:
+        """Write all queued rows, then stop the thread."""
+        self._queue.put(self._STOP)
+        self._thread.join()
+        self._raise_error()
+
+    def __enter__(self) -> "BackgroundMarcWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
 
 
 def get_yyyymmdd() -> str:
@@ -3,87 +3,205 @@ and determine which to use for generating MARC records.
 """
 
 import logging
-import string
-from strsimpy import NormalizedLevenshtein
 from pymarc import Record
-from searchers.discogs import DiscogsClient
-from searchers.musicbrainz import MusicbrainzClient
-from searchers.worldcat import WorldcatClient
+from searchers.aio import (
+    AsyncDiscogsClient,
+    AsyncMusicbrainzClient,
+    AsyncWorldcatClient,
+)
+from searchers.worldcat import (
+    SOUND_RECORDING_FORMATS,
+    WorldcatCandidate,
+    normalize_oclc_number,
+)
+from title_similarity import (
+    normalize,
+    strip_punctuation,
+    title_similarity,
+    title_similarity_upper_bound,
+)
 
 logger = logging.getLogger()
 
+# These thresholds were used in previous phase.
+# Minimum score for a single title to be considered similar.
+TITLE_SCORE_THRESHOLD = 0.4
+# Minimum average score for a record's title to be close enough.
+AVERAGE_TITLE_SCORE_THRESHOLD = 0.37
 
-def get_usable_worldcat_records(
-    client: WorldcatClient,
-    search_terms: str | list,
-    search_index: str,
-    unique_titles: set,
-) -> list[Record]:
-    """Convenience method which calls other methods to search Worldcat
-    and evaluate those records. This gets called multiple times with
-    different parameters.
-    Returns a list of MARC records.
+
+def get_fallback_search_terms(upc_code: str, publisher_numbers: set) -> dict:
+    """Return terms for the fallback Worldcat search, keyed on search index:
+    music publisher numbers, and forms of the UPC not already searched for.
+    Empty publisher numbers (from releases without one) are left out.
+    """
+    return {
+        "mn": sorted({number.strip() for number in publisher_numbers} - {""}),
+        "sn": get_upc_variants(upc_code),
+    }
+
+
+def get_upc_variants(upc_code: str) -> list:
+    """Return other forms of a UPC which Worldcat records may have:
+    as UPC-A (12 digits), as EAN-13 (13 digits, with leading zero),
+    and without leading zeroes.  UPCs which aren't all digits have no variants.
     """
-    marc_records = get_worldcat_records(client, search_terms, search_index)
-    usable_records = get_usable_records(marc_records, unique_titles)
-    return usable_records
+    if not upc_code.isdigit():
+        return []
+    number = upc_code.lstrip("0")
+    variants = [number.zfill(12), number.zfill(13), number]
+    return [
+        variant
+        for variant in dict.fromkeys(variants)
+        if variant != upc_code and variant.strip("0")
+    ]
+
+
+def check_clu_holdings(
+    records: list[WorldcatCandidate], holdings: dict[str, bool]
+) -> bool:
+    """Given a list of candidate records and a dict of holding status keyed on
+    OCLC number (as from WorldcatClient.holdings_for), determine whether
+    any record is held by CLU (UCLA).
+    """
+    for record in records:
+        oclc_number = record.oclc_number
+        if holdings.get(oclc_number):
+            logger.info(f"\tREJECTING ALL RECORDS: OCLC {oclc_number} is held by CLU")
+            logger.info(f"\tWorldcat Title -> {record.title}")
+            return True
+    # If we made it to here, no records are held by CLU.
+    return False
 
 
-def get_worldcat_records(
-    client: WorldcatClient, search_terms: str | list, search_index: str
-) -> list[Record]:
-    """Search Worldcat, returning a list of MARC records matching the search term(s)."""
+async def get_worldcat_records_async(
+    client: AsyncWorldcatClient, search_terms: str | list, search_index: str
+) -> list[WorldcatCandidate]:
+    """Search Worldcat, returning a list of candidate records matching the
+    search term(s).
+    Records are triaged using the search results first, and only retrieved
+    if they might be usable.  Full MARC records are only created for
+    candidates which need them.
+    """
     # Convert single search string into a 1-long list, for consistency
     if isinstance(search_terms, str):
         search_terms = [search_terms]
     all_records = []
+    found_count = 0
     for search_term in search_terms:
-        search_results = client.search(search_term, search_index)
-        oclc_numbers = client.get_oclc_numbers(search_results)
-        marc_records = client.get_records(oclc_numbers)
-        all_records.extend(marc_records)
-    logger.info(f"\tFound {len(all_records)} Worldcat records")
+        search_results = await client.search(search_term, search_index)
+        brief_records = client.get_brief_records(search_results)
+        found_count += len(brief_records)
+        oclc_numbers = triage_brief_records(brief_records)
+        candidates = await client.get_candidates(oclc_numbers)
+        all_records.extend(candidates)
+    logger.info(f"\tFound {found_count} Worldcat records")
     return all_records
 
 
-def get_discogs_records(client: DiscogsClient, search_term: str) -> list:
-    """Search Discogs, returning a list of data matching the search term."""
-    search_results = client.get_ids_by_upc(search_term)
-    releases = client.get_full_releases(search_results)
-    data = client.parse_data(releases)
+async def get_fallback_worldcat_records_async(
+    client: AsyncWorldcatClient, upc_code: str, publisher_numbers: set
+) -> list[WorldcatCandidate]:
+    """Search Worldcat for music publisher numbers and other forms of the UPC,
+    all with one query, returning a list of candidate records found by any of them.
+    """
+    search_results = await client.search_any(
+        get_fallback_search_terms(upc_code, publisher_numbers)
+    )
+    brief_records = client.get_brief_records(search_results)
+    oclc_numbers = triage_brief_records(brief_records)
+    candidates = await client.get_candidates(oclc_numbers)
+    logger.info(f"\tFound {len(brief_records)} Worldcat records")
+    return candidates
+
+
+async def get_discogs_records_async(
+    client: AsyncDiscogsClient, search_term: str
+) -> list:
+    """Search Discogs, returning a list of data matching the search term.
+    Data comes from the search results; use client.get_full_data() to get
+    full release data when needed.
+    """
+    search_results = await client.search_by_upc(search_term)
+    data = client.parse_data(search_results)
     return data
 
 
-def get_musicbrainz_records(client: MusicbrainzClient, search_term: str) -> list:
+async def get_musicbrainz_records_async(
+    client: AsyncMusicbrainzClient, search_term: str
+) -> list:
     """Search MusicBrainz, returning a list of data matching the search term."""
-    search_results = client.search_by_upc(search_term)
+    search_results = await client.search_by_upc(search_term)
     data = client.parse_data(search_results)
     return data
 
 
-def any_record_has_clu(client: WorldcatClient, records: list[Record]) -> bool:
-    """Check a list of MARC records against Worldcat to determine
+async def any_record_has_clu_async(
+    client: AsyncWorldcatClient, records: list[WorldcatCandidate]
+) -> bool:
+    """Check a list of candidate records against Worldcat to determine
     whether any is held by CLU (UCLA).
     """
-    for record in records:
-        oclc_number = get_oclc_number(record)
-        if client.is_held_by_us(oclc_number):
-            logger.info(f"\tREJECTING ALL RECORDS: OCLC {oclc_number} is held by CLU")
-            logger.info(f"\tWorldcat Title -> {record.title}")
-            return True
-    # If we made it to here, no records are held by CLU.
-    return False
+    oclc_numbers = [record.oclc_number for record in records]
+    holdings = await client.holdings_for(oclc_numbers)
+    return check_clu_holdings(records, holdings)
+
+
+def triage_brief_records(brief_records: list[dict]) -> list[str]:
+    """Given brief records from a Worldcat search, reject those which can't be
+    usable, judging from the brief data alone, so full records need only be
+    retrieved for the rest.  Full records are still checked by
+    get_usable_records(), as brief records don't have all the data needed.
 
+    Returns OCLC numbers of the remaining records, best encoding level first
+    (otherwise in search result order).
+    """
+    survivors = [
+        brief_record
+        for brief_record in brief_records
+        if brief_record_is_usable(brief_record)
+    ]
+    # sort() is stable, so records with the same encoding level stay in order.
+    survivors.sort(key=get_brief_encoding_level_score, reverse=True)
+    return [brief_record["oclcNumber"] for brief_record in survivors]
+
+
+def brief_record_is_usable(brief_record: dict) -> bool:
+    """Determine whether a brief record from a Worldcat search could be usable,
+    using the same criteria as record_is_usable().  Data missing from the brief
+    record is not a reason to reject it; the full record will be checked.
+    """
+    oclc_number = brief_record.get("oclcNumber")
+    # generalFormat is from record type (LDR/06), as well as other data.
+    general_format = brief_record.get("generalFormat")
+    if general_format is not None and general_format not in SOUND_RECORDING_FORMATS:
+        logger.info(f"\tREJECTED OCLC {oclc_number}: bad format '{general_format}'")
+        return False
+    # specificFormat is Digital for online resources (008/23 = 'o').
+    specific_format = brief_record.get("specificFormat")
+    if specific_format == "Digital":
+        logger.info(
+            f"\tREJECTED OCLC {oclc_number}: bad specific format '{specific_format}'"
+        )
+        return False
+    # catalogingLanguage is from 040 $b.
+    cat_lang = brief_record.get("catalogingInfo", {}).get("catalogingLanguage")
+    if cat_lang is not None and cat_lang != "eng":
+        logger.info(f"\tREJECTED OCLC {oclc_number}: cataloging language '{cat_lang}'")
+        return False
+    return True
 
-def get_usable_records(records: list[Record], unique_titles: set) -> list[Record]:
-    """Given a list of MARC records and a set of title strings,
+
+def get_usable_records(
+    records: list[WorldcatCandidate], unique_titles: set
+) -> list[WorldcatCandidate]:
+    """Given a list of candidate records and a set of title strings,
     return a list containing only those records which have sufficient quality
     and a title similar enough to those from all sources."""
     records_to_keep = []
     for record in records:
         # For debugging
-        oclc_number = get_oclc_number(record)
-        logger.info(f"\t\tChecking OCLC# {oclc_number} -> {record.title}")
+        logger.info(f"\t\tChecking OCLC# {record.oclc_number} -> {record.title}")
         if record_is_usable(record) and title_is_close_enough(record, unique_titles):
             records_to_keep.append(record)
 
@@ -128,11 +246,6 @@ def get_unique_titles(
     return titles
 
 
-def strip_punctuation(input: str) -> str:
-    """Remove all punctuation from a string."""
-    return input.translate(str.maketrans("", "", string.punctuation))
-
-
 def normalize_title(input: str) -> str:
     """Applies basic normalization to a string by stripping punctuation
     and using title case for readability.
@@ -140,60 +253,79 @@ def normalize_title(input: str) -> str:
     return strip_punctuation(input.title())
 
 
-def normalize(input: str) -> str:
-    """Fully normalize a string for comparison with other strings.
-    Strip punctuation, remove spaces, and force to upper case.
-    """
-    new_string = input.translate(str.maketrans("", "", string.whitespace))
-    return strip_punctuation(new_string.upper())
-
-
-def normalize_oclc_number(input: str) -> str:
-    """Normalize OCLC number by stripping non-digits
-    and leading zeroes.
-    Examples:
-    * ocm00123456 -> 123456
-    * on98765 -> 98765
-    * 0123456789 -> 123456789
-    """
-    digits = "".join(d for d in input if d.isdigit())
-    return digits.lstrip("0")
-
-
-def title_is_close_enough(record: Record, titles: set) -> bool:
+def title_is_close_enough(record: WorldcatCandidate, titles: set) -> bool:
     """Compare MARC title with Discogs/MusicBrainz/official title(s).
     Return true if too different, beyond threshhold.
+
+    Titles are scored in order, but scoring stops once the average is certain
+    to be above or below the threshold, using upper bounds on the scores of
+    the remaining titles; the decision is the same as if all were scored.
     """
     # For logging problems
-    oclc_number = get_oclc_number(record)
+    oclc_number = record.oclc_number
     # record.title is just 245 $a $b; we want 245 $a $n $p $b.
-    full_title = get_marc_full_title(record)
+    full_title = record.full_title
+    # Full title might not match, but primary (245 $a) title might.
+    short_title = record.short_title
+
+    titles = list(titles)
+    if not titles:
+        # No titles, no comparison, no reason to reject
+        logger.info(f"\tAVERAGE SCORE: {1.0:.2f}")
+        return True
+    # The best each title could score, whether full or short title is used.
+    full_title_bounds = [
+        get_title_similarity_upper_bound(full_title, title) for title in titles
+    ]
+    score_bounds = [
+        (
+            max(bound, get_title_similarity_upper_bound(short_title, title))
+            if short_title != full_title
+            else bound
+        )
+        for title, bound in zip(titles, full_title_bounds)
+    ]
 
     total_score: float = 0.0
-    for title in titles:
+    for idx, title in enumerate(titles):
+        # Scores are never negative, so the average can't drop below this...
+        if idx > 0 and total_score / len(titles) >= AVERAGE_TITLE_SCORE_THRESHOLD:
+            log_pruned_titles(full_title, titles[idx:], score_bounds[idx:])
+            logger.info(f"\tAVERAGE SCORE: at least {total_score / len(titles):.2f}")
+            return True
+        # ... or rise above this.  Add bounds in the same order as scores would
+        # be added, so rounding can't make this less than the real total.
+        total_bound = total_score
+        for bound in score_bounds[idx:]:
+            total_bound += bound
+        if total_bound / len(titles) < AVERAGE_TITLE_SCORE_THRESHOLD:
+            log_pruned_titles(full_title, titles[idx:], score_bounds[idx:])
+            logger.info(
+                f"\t\tREJECTED OCLC {oclc_number}: Titles are too different: "
+                f"at most {total_bound / len(titles):.2f}"
+            )
+            return False
+
         # Similarity score ranges from 0.0 (completely different) to 1.0 (identical).
-        score = get_title_similarity_score(full_title, title)
-        logger.info(f"\t\t{score:.2f}: {full_title=} -> {title=}")
-        # This threshold was used in previous phase.
-        if score < 0.4:
-            # Full title might not match, but primary (245 $a) title might.
-            short_title = get_marc_short_title(record)
+        if full_title_bounds[idx] < TITLE_SCORE_THRESHOLD and short_title != full_title:
+            # Full title can't be close enough, so don't bother scoring it.
+            score = full_title_bounds[idx]
+            logger.info(f"\t\tPruned, at most {score:.2f}: {full_title=} -> {title=}")
+        else:
+            score = get_title_similarity_score(full_title, title)
+            logger.info(f"\t\t{score:.2f}: {full_title=} -> {title=}")
+        if score < TITLE_SCORE_THRESHOLD:
             if short_title != full_title:
                 score = get_title_similarity_score(short_title, title)
                 logger.info(f"\t\t{score:.2f}: {short_title=} -> {title=}")
                 # Still too different?
-                if score < 0.4:
+                if score < TITLE_SCORE_THRESHOLD:
                     logger.info(f"\tWarning: Titles are too different: {score:.2f}")
                     logger.info(f"\t\tMARC Title : {full_title} ({oclc_number})")
                     logger.info(f"\t\tOther Title: {title}")
         total_score += score
-    if len(titles) > 0:
-        average_score = total_score / len(titles)
-    else:
-        # No titles, no comparison, no reason to reject
-        average_score = 1.0
-    # This threshold was used in previous phase.
-    if average_score < 0.37:
+    average_score = total_score / len(titles)
+    if average_score < AVERAGE_TITLE_SCORE_THRESHOLD:
         logger.info(
             f"\t\tREJECTED OCLC {oclc_number}: Titles are too different: {average_score:.2f}"
         )
@@ -204,37 +336,27 @@ def title_is_close_enough(record: Record, titles: set) -> bool:
         return True
 
 
+def log_pruned_titles(full_title: str, titles: list, bounds: list) -> None:
+    """Log titles which didn't need to be scored, with their best possible scores."""
+    for title, bound in zip(titles, bounds):
+        logger.info(f"\t\tPruned, at most {bound:.2f}: {full_title=} -> {title=}")
+
+
 def get_title_similarity_score(title_1: str, title_2: str) -> float:
     """Return similarity score for two titles.
     Similarity score ranges from 0.0 (completely different) to 1.0 (identical).
     """
-    comparator = NormalizedLevenshtein()
-    return comparator.similarity(normalize(title_1), normalize(title_2))
+    return title_similarity(title_1, title_2)
 
 
-def get_marc_full_title(record: Record) -> str:
-    """Return full (non-default) title from MARC record.
-    Default record.title is just 245 $a $b; we want 245 $a $n $p $b.
-    We can count on these records all having 245 fields.
+def get_title_similarity_upper_bound(title_1: str, title_2: str) -> float:
+    """Return the highest similarity score two titles could have,
+    calculated cheaply from their lengths.
     """
-    fld_245 = record.get("245")
-    # It's OK if some of these subfields don't exist.
-    sfd_list = fld_245.get_subfields("a", "n", "p", "b")
-    return " ".join(sfd_list)
+    return title_similarity_upper_bound(title_1, title_2)
 
 
-def get_marc_short_title(record: Record) -> str:
-    """Return short (non-default) title from MARC record.
-    Default record.title is just 245 $a $b; we want 245 $a.
-    We can count on these records all having 245 fields.
-    """
-    fld_245 = record.get("245")
-    # It's OK if some of these subfields don't exist.
-    sfd_list = fld_245.get_subfields("a")
-    return " ".join(sfd_list)
-
-
-def record_is_usable(record: Record) -> bool:
+def record_is_usable(record: WorldcatCandidate) -> bool:
     """Determine whether MARC record from Worldcat is usable for this project,
     by checking several characteristics. If any check fails, record is rejected."""
     return (
@@ -244,14 +366,14 @@ def record_is_usable(record: Record) -> bool:
     )
 
 
-def record_type_is_ok(record: Record) -> bool:
+def record_type_is_ok(record: WorldcatCandidate) -> bool:
     # Reject records with LDR/06 (record type) other than 'i' or 'j'
     # (sound recordings).
     # https://www.loc.gov/marc/bibliographic/bdleader.html
 
-    # Get OCLC number from 001, for logs.
-    oclc_number = get_oclc_number(record)
-    record_type = record.leader[6]
+    # OCLC number (from 001) for logs.
+    oclc_number = record.oclc_number
+    record_type = record.record_type
     if record_type not in "ij":
         logger.info(f"\tREJECTED OCLC {oclc_number}: bad record type '{record_type}'")
         return False
@@ -259,13 +381,13 @@ def record_type_is_ok(record: Record) -> bool:
         return True
 
 
-def form_of_item_is_ok(record: Record) -> bool:
+def form_of_item_is_ok(record: WorldcatCandidate) -> bool:
     # Reject records with 008/23 (form of item) = 'o' (Online).
     # https://www.loc.gov/marc/bibliographic/bd008m.html
 
-    # Get OCLC number from 001, for logs.
-    oclc_number = get_oclc_number(record)
-    form_of_item = record.get("008").data[23]
+    # OCLC number (from 001) for logs.
+    oclc_number = record.oclc_number
+    form_of_item = record.form_of_item
     if form_of_item == "o":
         logger.info(
             f"\tREJECTED OCLC {oclc_number}: bad 008/23 (form of item) '{form_of_item}'"
@@ -275,18 +397,17 @@ def form_of_item_is_ok(record: Record) -> bool:
         return True
 
 
-def cataloging_language_is_ok(record: Record) -> bool:
+def cataloging_language_is_ok(record: WorldcatCandidate) -> bool:
     # Reject records with 040 $b (language of cataloging) other than 'eng'.
     # https://www.loc.gov/marc/bibliographic/bd040.html
     # 040 and $b are both non-repeatable, so safe to check just the first.
 
     is_ok = True
-    # Get OCLC number from 001, for logs.
-    oclc_number = get_oclc_number(record)
+    # OCLC number (from 001) for logs.
+    oclc_number = record.oclc_number
 
-    f040 = record.get("040")
-    if f040:
-        cat_lang = f040.get("b")
+    if record.has_040:
+        cat_lang = record.cataloging_language
         if cat_lang != "eng":
             logger.info(
                 f"\tREJECTED OCLC {oclc_number}: cataloging language '{cat_lang}'"
@@ -300,8 +421,10 @@ def cataloging_language_is_ok(record: Record) -> bool:
     return is_ok
 
 
-def get_best_worldcat_record(records: list[Record]) -> Record | None:
-    """Given a list of MARC records, compare them on various criteria
+def get_best_worldcat_record(
+    records: list[WorldcatCandidate],
+) -> WorldcatCandidate | None:
+    """Given a list of candidate records, compare them on various criteria
     and return the 'best' one according to those criteria.
     """
     # If records is empty, return None.
@@ -319,7 +442,9 @@ def get_best_worldcat_record(records: list[Record]) -> Record | None:
     return best_record
 
 
-def compare_records(record1: Record, record2: Record) -> Record:
+def compare_records(
+    record1: WorldcatCandidate, record2: WorldcatCandidate
+) -> WorldcatCandidate:
     """Compare attributes of 2 records and return the 'best' one."""
     # First, compare encoding levels; best wins 5 points.
     record1_elvl_score = get_encoding_level_score(record1)
@@ -335,28 +460,43 @@ def compare_records(record1: Record, record2: Record) -> Record:
     if record1_elvl_score >= record2_elvl_score:
         logger.debug(
             (
-                f"\t\t{get_oclc_number(record1)} ({record1_elvl_score}) beats "
-                f"{get_oclc_number(record2)} ({record2_elvl_score})"
+                f"\t\t{record1.oclc_number} ({record1_elvl_score}) beats "
+                f"{record2.oclc_number} ({record2_elvl_score})"
             )
         )
         return record1
     else:
         logger.debug(
             (
-                f"\t\t{get_oclc_number(record2)} ({record1_elvl_score}) beats "
-                f"{get_oclc_number(record1)} ({record1_elvl_score})"
+                f"\t\t{record2.oclc_number} ({record1_elvl_score}) beats "
+                f"{record1.oclc_number} ({record1_elvl_score})"
             )
         )
         return record2
 
 
-def get_encoding_level_score(record: Record) -> int:
+def get_encoding_level_score(record: WorldcatCandidate) -> int:
     """Return a numerical score to represent the quality of a MARC record's
     encoding level (LDR/17).
     """
-    # First, compare encoding levels: (best to worst): Blank, 4, I, 1, 7, K, M, L, 3
+    return score_encoding_level(record.encoding_level)
+
+
+def get_brief_encoding_level_score(brief_record: dict) -> int:
+    """Return a numerical score to represent the quality of a brief record's
+    encoding level (levelOfCataloging, from LDR/17), or -1 if it's missing.
+    """
+    encoding_level = brief_record.get("catalogingInfo", {}).get("levelOfCataloging")
+    if not encoding_level:
+        return -1
+    return score_encoding_level(encoding_level)
+
+
+def score_encoding_level(encoding_level: str) -> int:
+    """Return a numerical score for an encoding level (LDR/17) value."""
+    # Best to worst: Blank, 4, I, 1, 7, K, M, L, 3
     # Convert blank to '#' for readability.
-    encoding_level = record.leader[17].replace(" ", "#")
+    encoding_level = encoding_level.replace(" ", "#")
     # str.find() returns an integer position if found, or -1 if not.
     elvl_values = "3LMK71I4#"
     return elvl_values.find(encoding_level)
@@ -0,0 +1,135 @@
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger()
+
+# Row states, in the order they are reached.
+SEARCHED = "searched"
+DECIDED = "decided"
+WRITTEN = "written"
+
+
+class JournalMismatchError(Exception):
+    """The journal refers to output which doesn't exist, so can't be used to resume."""
+
+
+class BatchJournal:
+    """Journal of progress through one batch of music data, so an interrupted
+    run can be resumed without losing or duplicating MARC records.
+
+    Each line of the journal is a JSON object for one row reaching a new state:
+    searched, decided (with the type of file its record belongs in, if any), or
+    written.  A row is only journaled as written after its MARC record has been
+    synced to disk (see create_marc_record.MarcOutputManager), and the entry
+    includes the size of every output file just after the row was written;
+    anything in those files past the last written entry is incomplete.
+
+    Safe to share between threads.
+    """
+
+    def __init__(self, filename: str, marc_filenames: dict[str, str]) -> None:
+        self.filename = filename
+        self.marc_filenames = marc_filenames
+        self._lock = threading.Lock()
+        remove_partial_entry(filename)
+        self._file = open(filename, "a", encoding="utf-8")
+
+    def record(self, idx: int, state: str, **data) -> None:
+        """Add an entry for row idx reaching state, with any other data given.
+        These entries are for information, and aren't synced to disk;
+        see commit_rows() for rows which have been written.
+        """
+        entry = {"row": idx, "state": state} | data
+        with self._lock:
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+
+    def commit_rows(self, rows: list[tuple[int, str | None, dict[str, int]]]) -> None:
+        """Journal rows as written, then sync the journal to disk.  Each row is
+        given as (row index, type of file its record was written to (if any),
+        size of each output file just after the row was written).
+
+        Call this only once the rows' MARC records have been synced to disk.
+        """
+        with self._lock:
+            for idx, file_type, offsets in rows:
+                entry = {
+                    "row": idx,
+                    "state": WRITTEN,
+                    "file_type": file_type,
+                    "offsets": offsets,
+                }
+                self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def recover(self) -> set[int]:
+        """Prepare to resume an interrupted run: remove any incomplete MARC
+        records from the output files, based on the last written entry.
+
+        Return set of row indexes which were completely written.
+        """
+        written_rows = set()
+        offsets = {}
+        for entry in read_entries(self.filename):
+            if entry["state"] == WRITTEN:
+                written_rows.add(entry["row"])
+                offsets = entry["offsets"]
+        for output_type, marc_filename in self.marc_filenames.items():
+            offset = offsets.get(output_type, 0)
+            size = (
+                os.path.getsize(marc_filename) if os.path.exists(marc_filename) else 0
+            )
+            if not written_rows and size > 0:
+                # Probably written by a run without a journal; don't guess.
+                raise JournalMismatchError(
+                    f"{marc_filename} has {size} bytes, but journal {self.filename} "
+                    "has no rows written"
+                )
+            if size < offset:
+                raise JournalMismatchError(
+                    f"{marc_filename} has {size} bytes, but journal {self.filename} "
+                    f"expects at least {offset}"
+                )
+            if size > offset:
+                logger.info(
+                    f"Removing {size - offset} bytes of incomplete output "
+                    f"from {marc_filename}"
+                )
+                with open(marc_filename, "r+b") as f:
+                    f.truncate(offset)
+                    os.fsync(f.fileno())
+        return written_rows
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def read_entries(filename: str) -> list[dict]:
+    """Return all complete entries from a journal file.  A partly-written
+    last line, left by a crash, is ignored.
+    """
+    entries = []
+    if not os.path.exists(filename):
+        return entries
+    with open(filename, encoding="utf-8") as f:
+        for line in f:
+            if not line.endswith("\n"):
+                break
+            entries.append(json.loads(line))
+    return entries
+
+
+def remove_partial_entry(filename: str) -> None:
+    """Remove a partly-written last line, left by a crash, from a journal file,
+    so new entries start on a line of their own.
+    """
+    if not os.path.exists(filename):
+        return
+    with open(filename, "r+b") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
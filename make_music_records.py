@@ -1,30 +1,40 @@
 from pathlib import Path
 import api_keys
 import argparse
+import asyncio
 import logging
-from csv import DictReader
-from data_evaluator import (
-    any_record_has_clu,
-    get_all_publisher_numbers,
-    get_best_worldcat_record,
-    get_discogs_records,
-    get_marc_problems,
-    get_musicbrainz_records,
-    get_oclc_number,
-    get_unique_titles,
-    get_usable_worldcat_records,
+import multiprocessing
+import signal
+from batch_processing import (
+    RowLogHandler,
+    Shard,
+    count_row_groups,
+    get_journal_filename,
+    get_logging_filename,
+    get_marc_filename,
+    get_shard_filenames,
+    merge_shard_output,
+    process_rows,
+    split_range,
 )
-from create_marc_record import (
-    add_local_fields,
-    add_worldcat_fields,
-    create_discogs_record,
-    create_musicbrainz_record,
-    write_marc_record,
+from bib_store import BibStore
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from create_marc_record import BackgroundMarcWriter, MarcOutputManager
+from journal import BatchJournal, JournalMismatchError
+from music_data import MusicDataFile, MusicDataRow
+from typing import Iterable
+from searchers.aio import (
+    AsyncDiscogsClient,
+    AsyncMusicbrainzClient,
+    AsyncWorldcatClient,
 )
-from searchers.discogs import DiscogsClient
+from searchers.cache import ResponseCache
+from searchers.discogs import MAX_SEARCH_RESULTS, DiscogsClient
 from searchers.musicbrainz import MusicbrainzClient
+from searchers.rate_limiter import DEFAULT_RATES, DiscogsRateLimiter, RateLimiter
+from searchers.transport import HttpTransport
 from searchers.worldcat import WorldcatClient
-from time import sleep
 
 logger = logging.getLogger()
 
@@ -51,187 +61,391 @@ def main() -> None:
         default="INFO",
         help="Set the logging level",
     )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="Number of rows of data to process at the same time",
+    )
+    parser.add_argument(
+        "--search-batch-size",
+        type=int,
+        default=1,
+        help="Number of UPCs to search Worldcat and MusicBrainz for in one query "
+        "(default 1)",
+    )
+    # Request budgets for each data source, in requests per second.
+    for source, rate in DEFAULT_RATES.items():
+        parser.add_argument(
+            f"--{source}-rate",
+            type=float,
+            default=rate,
+            help=f"Maximum {source} API requests per second (default {rate})",
+        )
+    parser.add_argument(
+        "--discogs-max-results",
+        type=int,
+        default=MAX_SEARCH_RESULTS,
+        help="Maximum number of Discogs search results to consider for each UPC "
+        f"(default {MAX_SEARCH_RESULTS})",
+    )
+    parser.add_argument(
+        "--cache-file",
+        default="response_cache.sqlite3",
+        help="Path to the cache of API responses (default response_cache.sqlite3)",
+    )
+    parser.add_argument(
+        "--no-cache", help="Do not use the cache of API responses", action="store_true"
+    )
+    parser.add_argument(
+        "--bib-store-file",
+        default="worldcat_bibs.sqlite3",
+        help="Path to the store of Worldcat MARC records "
+        "(default worldcat_bibs.sqlite3)",
+    )
+    parser.add_argument(
+        "--no-bib-store",
+        help="Do not use the store of Worldcat MARC records",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--flush-records",
+        type=int,
+        default=100,
+        help="Sync MARC output to disk after this many records (default 100)",
+    )
+    parser.add_argument(
+        "--flush-interval",
+        type=float,
+        default=5.0,
+        help="Sync MARC output to disk after this many seconds (default 5)",
+    )
+    parser.add_argument(
+        "--write-queue-size",
+        type=int,
+        default=1000,
+        help="Maximum number of rows waiting to be written to MARC files "
+        "(default 1000)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes, each processing a share of the rows",
+    )
+    parser.add_argument(
+        "--resume",
+        help="Resume an interrupted run, skipping rows already written",
+        action="store_true",
+    )
     # Optional flag to include 590 field in MARC records for CDs without cases.
     # store_true means the flag is set to True if the option is present, False otherwise.
     parser.add_argument("--no-cases", help="CDs do not have cases", action="store_true")
     args = parser.parse_args()
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if args.search_batch_size < 1:
+        parser.error("--search-batch-size must be at least 1")
+    if args.discogs_max_results < 1:
+        parser.error("--discogs-max-results must be at least 1")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.flush_records < 1:
+        parser.error("--flush-records must be at least 1")
+    if args.flush_interval <= 0:
+        parser.error("--flush-interval must be greater than 0")
+    if args.write_queue_size < 1:
+        parser.error("--write-queue-size must be at least 1")
+    rates = {source: getattr(args, f"{source}_rate") for source in DEFAULT_RATES}
+    for source, rate in rates.items():
+        if rate <= 0:
+            parser.error(f"--{source}-rate must be greater than 0")
 
     input_filename = args.music_data_file
     logging_filename = get_logging_filename(input_filename)
-    logging.basicConfig(filename=logging_filename, level=args.log_level)
-    # Suppress 3rd-party logs with lower level than WARNING
-    logging.getLogger("musicbrainzngs").setLevel(logging.WARNING)
-    logging.getLogger("urllib3").setLevel(logging.WARNING)
+    configure_logging(logging_filename, args.log_level)
 
     # Get the set of data provided by Music library to use for this process.
-    music_data = get_dicts_from_tsv(input_filename)
+    # Rows are read as needed, starting at the first selected row.
+    music_data = MusicDataFile(input_filename)
+    row_indexes = music_data.row_range(args.start_index, args.end_index)
 
     # Get the names of the files where MARC records will be written.
-    worldcat_record_filename = get_marc_filename(input_filename, "oclc")
-    original_record_filename = get_marc_filename(input_filename, "orig")
+    marc_filenames = {
+        "oclc": get_marc_filename(input_filename, "oclc"),
+        "orig": get_marc_filename(input_filename, "orig"),
+    }
 
-    # Initialize the clients used for searching various data sources.
-    worldcat_client, discogs_client, musicbrainz_client = get_clients()
-
-    for idx, row in enumerate(
-        music_data[args.start_index : args.end_index], start=args.start_index
-    ):
-        logger.info(f"Starting row {idx}")
-        upc_code, call_number, barcode, official_title = get_next_data_row(row)
-        logger.info(f"{call_number}: Searching for {upc_code} ({official_title})")
-
-        # First, search Discogs and MusicBrainz for the given term.
-        # Among other data, collect music publisher number(s) from those sources.
-        discogs_records = get_discogs_records(discogs_client, search_term=upc_code)
-        logger.info(f"\tFound {len(discogs_records)} Discogs records")
-        musicbrainz_records = get_musicbrainz_records(
-            musicbrainz_client, search_term=upc_code
-        )
-        logger.info(f"\tFound {len(musicbrainz_records)} MusicBrainz records")
+    # Progress is journaled, so an interrupted run can be resumed.
+    journal = BatchJournal(get_journal_filename(input_filename), marc_filenames)
+    completed_rows = set()
+    if args.resume:
+        try:
+            completed_rows = journal.recover()
+        except JournalMismatchError as ex:
+            parser.error(f"Can't resume: {ex}")
+        logger.info(f"Resuming: {len(completed_rows)} rows already written")
 
-        unique_titles = get_unique_titles(
-            discogs_records=discogs_records,
-            musicbrainz_records=musicbrainz_records,
-            official_title=official_title,
+    options = {
+        "concurrency": args.concurrency,
+        "search_batch_size": args.search_batch_size,
+        "no_cases": args.no_cases,
+        "discogs_max_results": args.discogs_max_results,
+        "cache_file": None if args.no_cache else args.cache_file,
+        "bib_store_file": None if args.no_bib_store else args.bib_store_file,
+        "flush_records": args.flush_records,
+        "flush_interval": args.flush_interval,
+        "write_queue_size": args.write_queue_size,
+    }
+    if args.workers == 1:
+        # Read the rows once first, to find rows which can share a decision.
+        group_sizes = count_row_groups(
+            music_data.iter_rows(row_indexes), row_indexes.start, completed_rows
         )
-
-        usable_records = get_usable_worldcat_records(
-            worldcat_client,
-            search_terms=upc_code,
-            search_index="sn",
-            unique_titles=unique_titles,
+        statistics = run_batch(
+            music_data.iter_rows(row_indexes),
+            start_index=row_indexes.start,
+            marc_filenames=marc_filenames,
+            journal=journal,
+            completed_rows=completed_rows,
+            rates=rates,
+            group_sizes=group_sizes,
+            **options,
         )
-
-        if not usable_records:
-            # If initial search on UPC didn't find anything, try searching for
-            # the music publisher numbers from Discogs/MusicBrainz.
-            publisher_numbers = get_all_publisher_numbers(
-                discogs_records, musicbrainz_records
-            )
-            logger.info(
-                f"\tSearching Worldcat again for music publisher numbers: {publisher_numbers}"
+        for name, stats in statistics.items():
+            logger.info(f"{name} statistics: {stats}")
+    else:
+        # Each worker gets an equal share of each source's request budget.
+        options["rates"] = {
+            source: rate / args.workers for source, rate in rates.items()
+        }
+        shards = [
+            Shard(
+                number=number,
+                input_filename=input_filename,
+                start_index=shard_indexes.start,
+                end_index=shard_indexes.stop,
+                completed_rows=completed_rows,
+                log_level=args.log_level,
+                options=options,
             )
-            usable_records = get_usable_worldcat_records(
-                worldcat_client,
-                search_terms=publisher_numbers,
-                search_index="mn",
-                unique_titles=unique_titles,
+            for number, shard_indexes in enumerate(
+                split_range(row_indexes, args.workers)
             )
+        ]
+        run_shards(shards, marc_filenames, logging_filename, journal)
+    journal.close()
 
-        # If ANY WorldCat record we found is held by CLU, reject the whole set
-        # and exit this iteration: we don't want to add any dup, from any source.
-        if any_record_has_clu(worldcat_client, usable_records):
-            # Detailed message was logged in routine; add broader info here.
-            logger.info(
-                f"\tPull CD for review [held by CLU]: {call_number} ({official_title})"
-            )
-            logger.info(f"Finished row {idx}\n")
-            continue
-
-        # Select the best available Worldcat record.
-        worldcat_record = get_best_worldcat_record(usable_records)
-
-        # Update (or create) final MARC record where possible.
-        # If there's a Worldcat record, use it;
-        # otherwise, prefer Discogs data over MusicBrainz.
-        if worldcat_record:
-            logger.info(f"\tWinner: OCLC# {get_oclc_number(worldcat_record)}")
-            # Report on problems with this Worldcat record, if any;
-            # these may require cataloger review, but we'll still use the record.
-            marc_problems = get_marc_problems(worldcat_record)
-            if marc_problems:
-                logger.info(
-                    f"\tPull CD for review [{len(marc_problems)} MARC warning(s)]: "
-                    f"{call_number} ({official_title})"
-                )
-            for problem in marc_problems:
-                logger.info(f"\t\tREVIEW: {problem}")
-            marc_record = add_worldcat_fields(worldcat_record)
-            marc_filename = worldcat_record_filename
-        elif discogs_records:
-            marc_record = create_discogs_record(data=discogs_records[0])
-            marc_filename = original_record_filename
-            logger.info(
-                f"\tPull CD for review [DC original created]: {call_number} ({official_title})"
-            )
-        elif musicbrainz_records:
-            marc_record = create_musicbrainz_record(data=musicbrainz_records[0])
-            marc_filename = original_record_filename
-            logger.info(
-                f"\tPull CD for review [MB original created]: {call_number} ({official_title})"
-            )
-        else:
-            # None of the data sources provided usable data.
-            marc_record = None
-
-        # Finally, add local fields and write the record to file, or log a message.
-        if marc_record:
-            marc_record = add_local_fields(
-                marc_record, barcode, call_number, args.no_cases
-            )
-            write_marc_record(marc_record, filename=marc_filename)
-        else:
-            # No suitable data at all.
-            logger.info("MARC not created: no data available")
-            logger.info(
-                f"\tPull CD for review [no record created]: {call_number} ({official_title})"
+
+def configure_logging(logging_filename: str, log_level: str) -> None:
+    """Send log messages to the given file, replacing any other handlers."""
+    logging.basicConfig(filename=logging_filename, level=log_level, force=True)
+    # Hold back log messages from rows processed concurrently,
+    # so the log file stays in input order.
+    logger.handlers = [RowLogHandler(handler) for handler in logger.handlers]
+    # Suppress 3rd-party logs with lower level than WARNING
+    logging.getLogger("musicbrainzngs").setLevel(logging.WARNING)
+    logging.getLogger("urllib3").setLevel(logging.WARNING)
+
+
+def run_batch(
+    rows: Iterable[MusicDataRow],
+    start_index: int,
+    marc_filenames: dict,
+    journal: BatchJournal,
+    completed_rows: set,
+    rates: dict,
+    concurrency: int = 1,
+    search_batch_size: int = 1,
+    no_cases: bool = False,
+    discogs_max_results: int = MAX_SEARCH_RESULTS,
+    cache_file: str | None = None,
+    bib_store_file: str | None = None,
+    flush_records: int = 100,
+    flush_interval: float = 5.0,
+    write_queue_size: int = 1000,
+    group_sizes: Counter | None = None,
+) -> dict[str, dict]:
+    """Set up clients, then process rows of music data in this process.
+    The response cache and bib store are only used if their files are given.
+    MARC output is written by a BackgroundMarcWriter, queueing up to
+    write_queue_size rows, and flushed as described for MarcOutputManager.
+    Rows are grouped to share decisions according to group_sizes, if given
+    (see process_rows).
+
+    Return statistics from the clients, keyed on what they describe.
+    """
+    # Responses from all data sources are cached between runs, unless disabled.
+    cache = ResponseCache(cache_file) if cache_file else None
+    # Full Worldcat records are also kept between runs, unless disabled.
+    bib_store = BibStore(bib_store_file) if bib_store_file else None
+
+    # Initialize the clients used for searching various data sources.
+    worldcat_client, discogs_client, musicbrainz_client = get_clients(
+        rates, cache, bib_store, discogs_max_results
+    )
+    clients = get_async_clients(worldcat_client, discogs_client, musicbrainz_client)
+
+    # Stop cleanly if terminated, so buffered output is flushed.
+    signal.signal(signal.SIGTERM, exit_on_signal)
+
+    # The Worldcat client keeps a session open until the run is finished,
+    # and output files are kept open too, written from a background thread.
+    with worldcat_client, MarcOutputManager(
+        marc_filenames, journal, flush_records, flush_interval
+    ) as marc_output, BackgroundMarcWriter(marc_output, write_queue_size) as output:
+        asyncio.run(
+            process_rows(
+                rows,
+                start_index=start_index,
+                clients=clients,
+                output=output,
+                no_cases=no_cases,
+                concurrency=concurrency,
+                search_batch_size=search_batch_size,
+                group_sizes=group_sizes,
+                journal=journal,
+                completed_rows=completed_rows,
             )
+        )
+    # Discogs and MusicBrainz clients share the same transport.
+    statistics = {
+        "MARC writer": output.stats(),
+        "HTTP transport": discogs_client.transport.stats(),
+    }
+    discogs_client.transport.close()
+    if cache is not None:
+        statistics["Response cache"] = cache.stats()
+        cache.close()
+    if bib_store is not None:
+        statistics["Worldcat bib store"] = bib_store.stats()
+        bib_store.close()
+    return statistics
 
-        # End of this row of data.
-        logger.info(f"Finished row {idx}\n")
 
-        # Some APIs have rate limits.
-        sleep(1)
+def exit_on_signal(signum: int, frame) -> None:
+    """Signal handler which exits via SystemExit, so cleanup code still runs."""
+    raise SystemExit(f"Stopped by signal {signum}")
 
 
-def get_dicts_from_tsv(filepath: str) -> list:
-    """Read tab-separated values file, with column names in first row.
-    Return a list of dicts keyed on those column names, one dict for
-    each row of data.
+def run_shards(
+    shards: list[Shard],
+    marc_filenames: dict,
+    logging_filename: str,
+    journal: BatchJournal,
+) -> None:
+    """Process shards in a pool of worker processes, one per shard.
+    As each shard finishes, in input order, its output is merged into the
+    batch's MARC files, log and journal, so they match a run in one process.
     """
-    with open(filepath, mode="r") as f:
-        dict_reader = DictReader(f, delimiter="\t")
-        full_dicts = list(dict_reader)
-    return full_dicts
+    # Stop cleanly if terminated, keeping the shards merged so far.
+    signal.signal(signal.SIGTERM, exit_on_signal)
+    all_statistics = []
+    with ProcessPoolExecutor(max_workers=len(shards)) as executor:
+        try:
+            for shard, statistics in zip(shards, executor.map(process_shard, shards)):
+                merge_shard_output(shard, marc_filenames, logging_filename, journal)
+                all_statistics.append(statistics)
+        except BaseException:
+            # Stop the workers too, rather than waiting for their shards to finish.
+            # Unmerged shard output is discarded anyway (see process_shard()).
+            executor.shutdown(wait=False, cancel_futures=True)
+            for process in multiprocessing.active_children():
+                process.kill()
+            raise
+    for shard, statistics in zip(shards, all_statistics):
+        for name, stats in statistics.items():
+            logger.info(f"Shard {shard.number} {name} statistics: {stats}")
+
 
+def process_shard(shard: Shard) -> dict[str, dict]:
+    """Process one shard, in a worker process, writing to the shard's own files.
 
-def get_clients() -> tuple[WorldcatClient, DiscogsClient, MusicbrainzClient]:
+    Return statistics from run_batch().
+    """
+    shard_filenames = get_shard_filenames(shard.input_filename, shard.number)
+    # Remove anything left by an earlier run which failed before merging.
+    for filename in shard_filenames["marc"].values():
+        Path(filename).unlink(missing_ok=True)
+    Path(shard_filenames["log"]).unlink(missing_ok=True)
+    Path(shard_filenames["journal"]).unlink(missing_ok=True)
+
+    configure_logging(shard_filenames["log"], shard.log_level)
+    music_data = MusicDataFile(shard.input_filename)
+    journal = BatchJournal(shard_filenames["journal"], shard_filenames["marc"])
+    row_indexes = range(shard.start_index, shard.end_index)
+    # Read the shard's rows once first, to find rows which can share a decision.
+    group_sizes = count_row_groups(
+        music_data.iter_rows(row_indexes), shard.start_index, shard.completed_rows
+    )
+    try:
+        return run_batch(
+            music_data.iter_rows(row_indexes),
+            start_index=shard.start_index,
+            marc_filenames=shard_filenames["marc"],
+            journal=journal,
+            completed_rows=shard.completed_rows,
+            group_sizes=group_sizes,
+            **shard.options,
+        )
+    finally:
+        journal.close()
+        for handler in logger.handlers:
+            handler.flush()
+
+
+def get_clients(
+    rates: dict | None = None,
+    cache: ResponseCache | None = None,
+    bib_store: BibStore | None = None,
+    discogs_max_results: int = MAX_SEARCH_RESULTS,
+) -> tuple[WorldcatClient, DiscogsClient, MusicbrainzClient]:
     """Convenience method to initialize and return all needed clients
     for searching the required data sources.
+
+    rates is a dict of requests per second, keyed on source name
+    (see searchers.rate_limiter.DEFAULT_RATES); missing sources use the defaults.
+    If cache is given, all clients use it for their responses.
+    If bib_store is given, the Worldcat client uses it for full records.
+    Discogs searches consider up to discogs_max_results results.
     """
+    rates = DEFAULT_RATES | (rates or {})
     worldcat_client = WorldcatClient(
         api_keys.WORLDCAT_METADATA_CLIENT_ID,
         api_keys.WORLDCAT_METADATA_CLIENT_SECRET,
+        rate_limiter=RateLimiter(rates["worldcat"]),
+        cache=cache,
+        bib_store=bib_store,
+    )
+    # Discogs and MusicBrainz share one pool of keep-alive connections;
+    # Worldcat has its own session.
+    transport = HttpTransport()
+    discogs_client = DiscogsClient(
+        api_keys.DISCOGS_USER_TOKEN,
+        rate_limiter=DiscogsRateLimiter(rates["discogs"]),
+        transport=transport,
+        cache=cache,
+        max_search_results=discogs_max_results,
+    )
+    musicbrainz_client = MusicbrainzClient(
+        rate_limiter=RateLimiter(rates["musicbrainz"]),
+        transport=transport,
+        cache=cache,
     )
-    discogs_client = DiscogsClient(api_keys.DISCOGS_USER_TOKEN)
-    musicbrainz_client = MusicbrainzClient()
     return worldcat_client, discogs_client, musicbrainz_client
 
 
-def get_next_data_row(row: dict) -> tuple[str, str, str, str]:
-    """Clean up source data for consistency.
-    Return as individual values instead of dict.
-    """
-    upc_code = row["UPC"].strip()
-    call_number = row["call number"].strip()
-    # Barcodes should always be uppercase.
-    barcode = row["barcode"].strip().upper()
-    official_title = row["title"].strip()
-    return upc_code, call_number, barcode, official_title
-
-
-def get_marc_filename(input_filename: str, file_type: str) -> str:
-    """Get the name of the file where MARC records of the given type
-    will be written, based on the input filename.
-    """
-    base = Path(input_filename).stem
-    return f"{base}_{file_type}.mrc"
-
-
-def get_logging_filename(input_filename: str) -> str:
-    """Get the name of the logfile to be used, based on the input filename."""
-    base = Path(input_filename).stem
-    return f"{base}.log"
+def get_async_clients(
+    worldcat_client: WorldcatClient,
+    discogs_client: DiscogsClient,
+    musicbrainz_client: MusicbrainzClient,
+) -> tuple[AsyncWorldcatClient, AsyncDiscogsClient, AsyncMusicbrainzClient]:
+    """Wrap the given clients for use with asyncio."""
+    return (
+        AsyncWorldcatClient(worldcat_client),
+        AsyncDiscogsClient(discogs_client),
+        AsyncMusicbrainzClient(musicbrainz_client),
+    )
 
 
 if __name__ == "__main__":
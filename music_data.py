@@ -0,0 +1,132 @@
+import csv
+import os
+import struct
+from array import array
+from pathlib import Path
+from typing import Iterator, NamedTuple
+
+# Index files start with this header: magic bytes, then the size (bytes) and
+# modification time (ns) of the TSV file, so stale indexes can be detected.
+INDEX_HEADER = struct.Struct("<8sQq")
+INDEX_MAGIC = b"MCDIDX01"
+# Each row's byte offset in the TSV file is stored as an unsigned 64-bit integer.
+OFFSET_TYPECODE = "Q"
+OFFSET_SIZE = array(OFFSET_TYPECODE).itemsize
+
+# Columns used from the TSV file, keyed on MusicDataRow field names.
+COLUMNS = {
+    "upc": "UPC",
+    "call_number": "call number",
+    "barcode": "barcode",
+    "title": "title",
+}
+
+
+class MusicDataRow(NamedTuple):
+    """One row of music data, as given in the TSV file (not cleaned up)."""
+
+    upc: str
+    call_number: str
+    barcode: str
+    title: str
+
+
+class MusicDataFile:
+    """Read rows of music data lazily from a tab-separated values file,
+    with column names in the first row.
+
+    A byte-offset index of the rows is built on first use and saved (by default
+    as {filename}.idx in the current directory, with the program's other output,
+    since the input may be on a read-only or shared drive), so reading can start
+    at any row without parsing the ones before it.  The index is rebuilt if the
+    file changes.
+
+    Blank lines are skipped, and each row must be on a single line.
+    """
+
+    def __init__(self, filepath: str, index_filepath: str | None = None) -> None:
+        self.filepath = filepath
+        if index_filepath is None:
+            index_filepath = f"{Path(filepath).name}.idx"
+        self.index_filepath = index_filepath
+        if not self._index_is_current():
+            self._build_index()
+
+    def __len__(self) -> int:
+        """Return the number of rows of data, not counting column names."""
+        index_size = os.path.getsize(self.index_filepath)
+        return (index_size - INDEX_HEADER.size) // OFFSET_SIZE
+
+    def row_range(self, start: int | None = None, stop: int | None = None) -> range:
+        """Return the indexes of the rows selected by start and stop,
+        with the same meaning as for slicing a list.
+        """
+        return range(len(self))[start:stop]
+
+    def iter_rows(self, indexes: range) -> Iterator[MusicDataRow]:
+        """Yield the rows with the given (contiguous) indexes, in order."""
+        if not indexes:
+            return
+        with open(self.filepath, "rb") as f:
+            columns = self._get_column_positions(f.readline())
+            f.seek(self._get_offset(indexes.start))
+            remaining = len(indexes)
+            for line in f:
+                if remaining == 0:
+                    break
+                line = line.rstrip(b"\r\n")
+                if not line:
+                    continue
+                values = next(csv.reader([line.decode("utf-8")], delimiter="\t"))
+                yield MusicDataRow(
+                    *(values[i] if i < len(values) else "" for i in columns)
+                )
+                remaining -= 1
+
+    def _get_column_positions(self, header_line: bytes) -> list[int]:
+        """Return the position of each needed column, in MusicDataRow order."""
+        header_text = header_line.rstrip(b"\r\n").decode("utf-8-sig")
+        column_names = next(csv.reader([header_text], delimiter="\t"))
+        return [column_names.index(name) for name in COLUMNS.values()]
+
+    def _get_offset(self, row_index: int) -> int:
+        """Return the byte offset of a row, read directly from the index file."""
+        with open(self.index_filepath, "rb") as f:
+            f.seek(INDEX_HEADER.size + row_index * OFFSET_SIZE)
+            offset = array(OFFSET_TYPECODE)
+            offset.frombytes(f.read(OFFSET_SIZE))
+        return offset[0]
+
+    def _get_file_signature(self) -> tuple[int, int]:
+        stat = os.stat(self.filepath)
+        return stat.st_size, stat.st_mtime_ns
+
+    def _index_is_current(self) -> bool:
+        try:
+            with open(self.index_filepath, "rb") as f:
+                magic, size, mtime = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+        except (OSError, struct.error):
+            return False
+        return magic == INDEX_MAGIC and (size, mtime) == self._get_file_signature()
+
+    def _build_index(self) -> None:
+        """Scan the file once, writing the offset of each row of data to the
+        index file.  Offsets are written in chunks, so memory use stays flat.
+        """
+        size, mtime = self._get_file_signature()
+        temp_filepath = f"{self.index_filepath}.tmp"
+        with open(self.filepath, "rb") as tsv, open(temp_filepath, "wb") as index:
+            index.write(INDEX_HEADER.pack(INDEX_MAGIC, size, mtime))
+            # Skip column names.
+            offset = len(tsv.readline())
+            offsets = array(OFFSET_TYPECODE)
+            for line in tsv:
+                if line.rstrip(b"\r\n"):
+                    offsets.append(offset)
+                    if len(offsets) >= 65536:
+                        offsets.tofile(index)
+                        offsets = array(OFFSET_TYPECODE)
+                offset += len(line)
+            offsets.tofile(index)
+        # Replace any old index only once the new one is complete.
+        os.replace(temp_filepath, self.index_filepath)
@@ -0,0 +1,169 @@
+"""Asyncio versions of the searcher clients.
+
+The libraries behind DiscogsClient, MusicbrainzClient and WorldcatClient
+all block on the network, so each async client wraps its synchronous
+counterpart and awaits the blocking calls in a worker thread.  This lets
+the event loop keep requests for many rows in flight at once.
+
+Search results are remembered for the rest of the run, so rows searching
+for the same terms (e.g. repeated UPCs) share one lookup.
+"""
+
+import asyncio
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+from searchers.discogs import DiscogsClient
+from searchers.musicbrainz import MusicbrainzClient
+from searchers.worldcat import WorldcatCandidate, WorldcatClient
+
+# Maximum number of lookup results to keep for later rows, per client.
+LOOKUP_MEMO_SIZE = 1000
+
+
+class AsyncSearcher:
+    """Base class for async searcher clients, wrapping a synchronous client."""
+
+    source = ""
+
+    def __init__(self, sync_client: Any) -> None:
+        self.sync_client = sync_client
+        # Lookups started in this run, keyed on what each looks up; each task
+        # returns a dict of results keyed the same way.
+        self._lookups: OrderedDict[Hashable, asyncio.Task] = OrderedDict()
+
+    async def run(self, func: Callable, *args: Any, **kwargs: Any) -> Any:
+        """Run a blocking function in a worker thread and return its result.
+        asyncio.to_thread copies the current context, so context variables
+        (used for per-row logging) are visible in the worker thread.
+        """
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+    def start_batch(self, keys: list, func: Callable, *args: Any) -> None:
+        """Start a blocking batch lookup, which returns a dict of results
+        keyed on the given keys, so later calls to from_batch() for any
+        of those keys can use its results.
+        """
+        self._remember(keys, asyncio.create_task(self.run(func, *args)))
+
+    async def from_batch(self, key: Hashable) -> tuple[bool, Any]:
+        """Wait for the lookup (if any) including key, alone or in a batch.
+        Return (True, result) if it succeeded, otherwise (False, None),
+        so the caller can look up key by itself.
+        """
+        task = self._lookups.get(key)
+        if task is None:
+            return False, None
+        try:
+            return True, (await task)[key]
+        except Exception:
+            # Logged by the caller's own lookup, if it fails too.
+            return False, None
+
+    async def memoized(self, key: Hashable, func: Callable, *args: Any) -> Any:
+        """Run a blocking lookup and return its result, unless key has already
+        been looked up successfully in this run (or is being looked up);
+        then use that result instead.
+        """
+        found, value = await self.from_batch(key)
+        if found:
+            return value
+        task = asyncio.create_task(self.run(lambda: {key: func(*args)}))
+        self._remember([key], task)
+        return (await task)[key]
+
+    def _remember(self, keys: list, task: asyncio.Task) -> None:
+        for key in keys:
+            self._lookups[key] = task
+            self._lookups.move_to_end(key)
+        while len(self._lookups) > LOOKUP_MEMO_SIZE:
+            self._lookups.popitem(last=False)
+
+
+class AsyncDiscogsClient(AsyncSearcher):
+    """Async wrapper around DiscogsClient."""
+
+    source = "Discogs"
+
+    def __init__(self, sync_client: DiscogsClient) -> None:
+        super().__init__(sync_client)
+
+    async def search_by_upc(self, upc: str) -> list:
+        return await self.memoized(upc, self.sync_client.search_by_upc, upc)
+
+    async def get_full_data(self, data_list: list) -> dict | None:
+        return await self.run(self.sync_client.get_full_data, data_list)
+
+    def parse_data(self, release_list: list) -> list:
+        # No network access, so no need for a worker thread.
+        return self.sync_client.parse_data(release_list)
+
+
+class AsyncMusicbrainzClient(AsyncSearcher):
+    """Async wrapper around MusicbrainzClient."""
+
+    source = "MusicBrainz"
+
+    def __init__(self, sync_client: MusicbrainzClient) -> None:
+        super().__init__(sync_client)
+
+    def prefetch(self, upcs: list) -> None:
+        """Start searching for several UPCs at once (see
+        MusicbrainzClient.search_by_upcs), for later calls to search_by_upc().
+        """
+        self.start_batch(upcs, self.sync_client.search_by_upcs, upcs)
+
+    async def search_by_upc(self, upc: str) -> list:
+        return await self.memoized(upc, self.sync_client.search_by_upc, upc)
+
+    def parse_data(self, data: list) -> list:
+        # No network access, so no need for a worker thread.
+        return self.sync_client.parse_data(data)
+
+
+class AsyncWorldcatClient(AsyncSearcher):
+    """Async wrapper around WorldcatClient."""
+
+    source = "Worldcat"
+
+    def __init__(self, sync_client: WorldcatClient) -> None:
+        super().__init__(sync_client)
+
+    def prefetch(
+        self,
+        search_terms: list,
+        search_index: str,
+        triage: Callable[[list[dict]], list[str]] | None = None,
+    ) -> None:
+        """Start searching for several terms at once (see WorldcatClient.search_many),
+        so later calls to search() for any of them can use the results.
+        """
+
+        def search_many() -> dict:
+            results = self.sync_client.search_many(search_terms, search_index, triage)
+            return {(search_index, term): value for term, value in results.items()}
+
+        self.start_batch(
+            [(search_index, search_term) for search_term in search_terms], search_many
+        )
+
+    async def search(self, search_term: str, search_index: str) -> dict:
+        return await self.memoized(
+            (search_index, search_term),
+            self.sync_client.search,
+            search_term,
+            search_index,
+        )
+
+    async def search_any(self, search_terms: dict[str, list]) -> dict:
+        key = tuple((index, tuple(terms)) for index, terms in search_terms.items())
+        return await self.memoized(key, self.sync_client.search_any, search_terms)
+
+    def get_brief_records(self, search_results: dict) -> list[dict]:
+        # No network access, so no need for a worker thread.
+        return self.sync_client.get_brief_records(search_results)
+
+    async def get_candidates(self, oclc_numbers: list) -> list[WorldcatCandidate]:
+        return await self.run(self.sync_client.get_candidates, oclc_numbers)
+
+    async def holdings_for(self, oclc_numbers: list) -> dict[str, bool]:
+        return await self.run(self.sync_client.holdings_for, oclc_numbers)
@@ -0,0 +1,8 @@
+def normalize_barcode(barcode: str) -> str:
+    """Normalize a barcode (UPC) for comparison: keep only letters and
+    digits, without leading zeroes, in upper case.
+    Examples:
+    * 018777260022 -> 18777260022
+    * 0 18777-26002 2 -> 18777260022
+    """
+    return "".join(c for c in barcode if c.isalnum()).lstrip("0").upper()
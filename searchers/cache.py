@@ -0,0 +1,194 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable
+
+# How long cached responses stay fresh, in seconds, keyed on "source.endpoint".
+# Catalog data changes slowly; holdings change whenever records are loaded,
+# so they are only cached long enough to cover one run.
+DAY = 24 * 60 * 60
+DEFAULT_TTLS = {
+    "discogs.search": 30 * DAY,
+    "discogs.release": 90 * DAY,
+    "musicbrainz.search": 30 * DAY,
+    "worldcat.search": 7 * DAY,
+    "worldcat.bib": 30 * DAY,
+    "worldcat.holdings": 60 * 60,
+}
+
+# Empty results (no matches, release not found) may be filled in later,
+# so they are cached for a shorter time than real data.
+EMPTY_TTL = DAY
+
+# Default maximum number of cached responses.
+MAX_ENTRIES = 100_000
+
+
+class ResponseCache:
+    """Persistent cache of API responses, stored in a SQLite database.
+
+    Responses are keyed on source, endpoint and normalized query.  Each endpoint
+    has its own time to live (see DEFAULT_TTLS); empty results use EMPTY_TTL,
+    if that's shorter.  When the cache holds more than max_entries responses,
+    the least recently used are removed.
+
+    Values must be bytes or JSON-serializable.  Safe to share between threads.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = MAX_ENTRIES,
+        ttls: dict[str, float] | None = None,
+        empty_ttl: float = EMPTY_TTL,
+    ) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.ttls = DEFAULT_TTLS | (ttls or {})
+        self.empty_ttl = empty_ttl
+        self._lock = threading.Lock()
+        # The connection is used from worker threads, always under self._lock.
+        # Other processes (see --workers) may hold the database briefly; wait for them.
+        self._connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("""CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                is_bytes INTEGER NOT NULL,
+                expires REAL NOT NULL,
+                last_used REAL NOT NULL
+            )""")
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)"
+        )
+        (self._entries,) = self._connection.execute(
+            "SELECT COUNT(*) FROM responses"
+        ).fetchone()
+        self._hits = Counter()
+        self._misses = Counter()
+        self._evictions = 0
+
+    def get(self, source: str, endpoint: str, query: Any) -> tuple[bool, Any]:
+        """Look up a cached response.
+
+        Return tuple of (found, value); value is None if not found.
+        """
+        key = make_key(source, endpoint, query)
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, is_bytes, expires FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[2] <= now:
+                if row is not None:
+                    self._connection.execute(
+                        "DELETE FROM responses WHERE key = ?", (key,)
+                    )
+                    self._entries -= 1
+                self._misses[f"{source}.{endpoint}"] += 1
+                return False, None
+            self._connection.execute(
+                "UPDATE responses SET last_used = ? WHERE key = ?", (now, key)
+            )
+            self._hits[f"{source}.{endpoint}"] += 1
+        value, is_bytes, _ = row
+        return True, (value if is_bytes else json.loads(value))
+
+    def put(self, source: str, endpoint: str, query: Any, value: Any) -> None:
+        """Store a response, replacing any already cached for the same query."""
+        key = make_key(source, endpoint, query)
+        ttl = self.ttls[f"{source}.{endpoint}"]
+        if is_empty(value):
+            ttl = min(ttl, self.empty_ttl)
+        is_bytes = isinstance(value, bytes)
+        stored_value = value if is_bytes else json.dumps(value)
+        now = time.time()
+        with self._lock:
+            exists = self._connection.execute(
+                "SELECT 1 FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if exists is None:
+                self._entries += 1
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, stored_value, is_bytes, now + ttl, now),
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        """Remove the least recently used responses, if over max_entries.
+        Must be called with self._lock held.
+        """
+        excess = self._entries - self.max_entries
+        if excess > 0:
+            self._connection.execute(
+                """DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY last_used LIMIT ?
+                )""",
+                (excess,),
+            )
+            self._entries -= excess
+            self._evictions += excess
+
+    def stats(self) -> dict:
+        """Return hit and miss counts, overall and per "source.endpoint"."""
+        with self._lock:
+            return {
+                "hits": sum(self._hits.values()),
+                "misses": sum(self._misses.values()),
+                "entries": self._entries,
+                "evictions": self._evictions,
+                "by_endpoint": {
+                    endpoint: {
+                        "hits": self._hits[endpoint],
+                        "misses": self._misses[endpoint],
+                    }
+                    for endpoint in sorted(self._hits | self._misses)
+                },
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+def make_key(source: str, endpoint: str, query: Any) -> str:
+    """Return the cache key for a query: whitespace is collapsed and case ignored,
+    since none of the APIs treat them as significant.
+    """
+    normalized_query = " ".join(str(query).split()).lower()
+    return f"{source}|{endpoint}|{normalized_query}"
+
+
+def is_empty(value: Any) -> bool:
+    """Determine whether a response has no useful data.
+    Worldcat searches return a dict even when nothing is found.
+    """
+    if isinstance(value, dict) and "numberOfRecords" in value:
+        return value["numberOfRecords"] == 0
+    return not value
+
+
+def cached_call(
+    cache: ResponseCache | None,
+    source: str,
+    endpoint: str,
+    query: Any,
+    fetch: Callable[[], Any],
+) -> Any:
+    """Return the cached response for query if there is one; otherwise,
+    call fetch() and cache its result.  With no cache, just call fetch().
+    Exceptions from fetch() are not cached.
+    """
+    if cache is None:
+        return fetch()
+    found, value = cache.get(source, endpoint, query)
+    if not found:
+        value = fetch()
+        cache.put(source, endpoint, query, value)
+    return value
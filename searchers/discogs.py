@@ -1,5 +1,49 @@
+from itertools import islice
 from discogs_client import Client
 from discogs_client.exceptions import HTTPError
+from discogs_client.fetchers import UserTokenRequestsFetcher
+from discogs_client.utils import backoff
+from searchers.barcodes import normalize_barcode
+from searchers.cache import ResponseCache, cached_call
+from searchers.rate_limiter import DEFAULT_RATES, DiscogsRateLimiter
+from searchers.transport import HttpTransport
+
+# Number of search results per request (the most Discogs allows).
+SEARCH_PAGE_SIZE = 100
+# Default maximum number of search results to consider for one UPC.
+MAX_SEARCH_RESULTS = 100
+
+
+class DiscogsFetcher(UserTokenRequestsFetcher):
+    """Fetcher which sends every request made by discogs_client through the
+    shared HTTP transport.  Each request waits for the rate limiter first,
+    and the limiter adapts to the rate limit headers Discogs returns.
+    """
+
+    def __init__(
+        self,
+        user_token: str,
+        rate_limiter: DiscogsRateLimiter,
+        transport: HttpTransport,
+    ) -> None:
+        super().__init__(user_token)
+        self.rate_limiter = rate_limiter
+        self.transport = transport
+
+    def fetch(self, client, method, url, data=None, headers=None, json_format=True):
+        self.rate_limiter.wait()
+        result = super().fetch(client, method, url, data, headers, json_format)
+        self.rate_limiter.update_from_headers(
+            self.rate_limit, self.rate_limit_remaining
+        )
+        return result
+
+    # Keep discogs_client's exponential backoff when Discogs returns 429.
+    @backoff
+    def request(self, method, url, data, headers, params=None):
+        return self.transport.request(
+            method, url, data=data, headers=headers, params=params
+        )
 
 
 class DiscogsClient:
@@ -8,9 +52,29 @@ class DiscogsClient:
     UCLA's batch music CD cataloging project.
     """
 
-    def __init__(self, user_token: str) -> None:
+    def __init__(
+        self,
+        user_token: str,
+        rate_limiter: DiscogsRateLimiter | None = None,
+        transport: HttpTransport | None = None,
+        cache: ResponseCache | None = None,
+        max_search_results: int = MAX_SEARCH_RESULTS,
+    ) -> None:
         # user_token is required for many API requests.
         self._token = user_token
+        # Search results beyond this many are ignored, so noisy searches
+        # don't need many pages of requests.
+        self.max_search_results = max_search_results
+        # All requests, including pages of search results, go through this.
+        if rate_limiter is None:
+            rate_limiter = DiscogsRateLimiter(DEFAULT_RATES["discogs"])
+        self.rate_limiter = rate_limiter
+        # Connections may be shared with other clients.
+        if transport is None:
+            transport = HttpTransport()
+        self.transport = transport
+        # Responses are cached here, if set.
+        self.cache = cache
         # user_agent is defined locally, to identify our application.
         self._user_agent = (
             "music-cd-batch/0.1 +https://github.com/UCLALibrary/music-cd-batch"
@@ -23,51 +87,121 @@ class DiscogsClient:
         """Return configured Client ready for use, on demand."""
         if self._client is None:
             self._client = Client(user_agent=self._user_agent, user_token=self._token)
+            # discogs_client has no public way to configure its fetcher;
+            # replace the default user token fetcher with our own.
+            self._client._fetcher = DiscogsFetcher(
+                self._token, self.rate_limiter, self.transport
+            )
         return self._client
 
+    def search_by_upc(self, upc: str) -> list:
+        """Search Discogs for CD releases by UPC, using Discogs' barcode search.
+        Only the first max_search_results results are considered, and only
+        those with a barcode matching the UPC are kept.
+        Returns a list of search results: summaries of releases, with title
+        ("Artist - Title"), catno, id and more, but not full release data.
+        """
+        return cached_call(
+            self.cache,
+            "discogs",
+            "search",
+            f"summaries barcode={upc} limit={self.max_search_results}",
+            lambda: self._search(upc),
+        )
+
+    def _search(self, upc: str) -> list:
+        search_results = self.client.search(type="release", format="CD", barcode=upc)
+        search_results.per_page = SEARCH_PAGE_SIZE
+        # Pages are only requested as needed, so stop iterating at the cap.
+        return [
+            result.data
+            for result in islice(search_results, self.max_search_results)
+            if barcode_matches(upc, result.data.get("barcode", []))
+        ]
+
     def get_ids_by_upc(self, upc: str) -> list:
-        """Search Discogs for releases by UPC.
+        """Search Discogs for releases by UPC, as search_by_upc() does.
         Returns a list of IDs to use to get full release data.
         """
-        search_results = self.client.search(upc, type="release", format="CD")
-        release_ids = [result.id for result in search_results]
-        return release_ids
-
-    def get_full_releases(self, release_ids: list) -> list:
-        """Get full release data from Discogs by release ID."""
-        output_list = []
-        for release_id in release_ids:
-            # Some release_id values return 404 "Release not found",
-            # even though they were just "found" by search.
-            # Example: release_id 8418329 from upc 4988006789890.
-            try:
-                release = self.client.release(release_id)
-                # force the release to refresh to get full data
-                release.refresh()
-                output_list.append(release.data)
-            except HTTPError:
-                # We don't care...
-                pass
-
-        return output_list
+        return [release["id"] for release in self.search_by_upc(upc)]
+
+    def get_full_release(self, release_id: int) -> dict | None:
+        """Get full release data from Discogs by release ID.
+        Returns None if Discogs can't provide the release.
+        """
+        return cached_call(
+            self.cache,
+            "discogs",
+            "release",
+            release_id,
+            lambda: self._fetch_release(release_id),
+        )
+
+    def _fetch_release(self, release_id: int) -> dict | None:
+        # Some release_id values return 404 "Release not found",
+        # even though they were just "found" by search.
+        # Example: release_id 8418329 from upc 4988006789890.
+        try:
+            release = self.client.release(release_id)
+            # force the release to refresh to get full data
+            release.refresh()
+            return release.data
+        except HTTPError:
+            # We don't care...
+            return None
+
+    def get_full_data(self, data_list: list) -> dict | None:
+        """Get full release data for the first release in data_list (as returned
+        by parse_data) which Discogs can provide, skipping any it can't.
+        Returns that release's data, parsed from the full release, or None
+        if no release can be retrieved.
+        """
+        for data in data_list:
+            if data["full_json"] is not None:
+                return data
+            release = self.get_full_release(data["id"])
+            if release is not None:
+                return self.parse_data([release])[0]
+        return None
 
     def parse_data(self, release_list: list) -> list:
         """Parse Discogs list of releases to pull out data for future use.
-        Each dictionary contains title, artist, publisher_number, and full_json of the
-        original response.
+        Each dictionary contains id, title, artist, publisher_number, and full_json
+        of the original response.
+
+        Releases may be full releases or search results; for search results,
+        full_json is None (see get_full_data), and title and artist come from
+        the combined "Artist - Title" in the search result.
         """
         output_dict_list = []
         for release in release_list:
-            title = release["title"]
-            publisher_number = release["labels"][0]["catno"]
-            artist = ", ".join([artist["name"] for artist in release["artists"]])
+            if "artists" in release:
+                title = release["title"]
+                publisher_number = release["labels"][0]["catno"]
+                artist = ", ".join([artist["name"] for artist in release["artists"]])
+                full_json = release
+            else:
+                artist, _, title = release["title"].partition(" - ")
+                if not title:
+                    artist, title = "", artist
+                publisher_number = release.get("catno", "")
+                full_json = None
 
             release_dict = {
+                "id": release["id"],
                 "title": title,
                 "artist": artist,
                 "publisher_number": publisher_number,
-                "full_json": release,
+                "full_json": full_json,
             }
 
             output_dict_list.append(release_dict)
         return output_dict_list
+
+
+def barcode_matches(upc: str, barcodes: list) -> bool:
+    """Return True if any of a Discogs search result's barcodes (which
+    may include other identifiers) is the same as the UPC, once normalized.
+    """
+    normalized_upc = normalize_barcode(upc)
+    return any(normalize_barcode(barcode) == normalized_upc for barcode in barcodes)
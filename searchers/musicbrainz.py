@@ -1,37 +1,149 @@
-import musicbrainzngs
+import re
+from musicbrainzngs import mbxml
+from musicbrainzngs.musicbrainz import LUCENE_SPECIAL
+from searchers.barcodes import normalize_barcode
+from searchers.cache import ResponseCache, cached_call
+from searchers.rate_limiter import DEFAULT_RATES, RateLimiter
+from searchers.transport import HttpTransport
+
+# MusicBrainz web service endpoint for release searches.
+SEARCH_URL = "https://musicbrainz.org/ws/2/release/"
+# Number of results returned by a search for one UPC (MusicBrainz's default).
+RESULTS_PER_UPC = 25
+# Maximum number of results MusicBrainz returns per request.
+SEARCH_LIMIT = 100
 
 
 class MusicbrainzClient:
     """Provide a wrapper around specific functionality for musicbrainzngs
-    (https://pypi.org/project/python3-discogs-client/) to support
+    (https://pypi.org/project/musicbrainzngs/) to support
     UCLA's batch music CD cataloging project.
+
+    Requests are sent through an HttpTransport, which can be shared with
+    other clients; musicbrainzngs is used only to parse the XML responses,
+    so results have the same structure as musicbrainzngs.search_releases().
     """
 
-    def __init__(self) -> None:
-        # Client will be set on first use.
-        self._client = None
-
-    @property
-    def client(self) -> musicbrainzngs:
-        """Return configured client ready for use, on demand."""
-        if self._client is None:
-            # musicbrainzngs has no explicit "client" attribute like Discogs & Worldcat;
-            # create one to make our custom classes similar.
-            self._client = musicbrainzngs
-            self._client.set_useragent(
-                app="music-cd-batch",
-                version="0.1",
-                contact="https://github.com/UCLALibrary/music-cd-batch/",
-            )
-        return self._client
+    def __init__(
+        self,
+        rate_limiter: RateLimiter | None = None,
+        transport: HttpTransport | None = None,
+        cache: ResponseCache | None = None,
+    ) -> None:
+        if rate_limiter is None:
+            rate_limiter = RateLimiter(DEFAULT_RATES["musicbrainz"])
+        self.rate_limiter = rate_limiter
+        # Connections may be shared with other clients.
+        if transport is None:
+            transport = HttpTransport()
+        self.transport = transport
+        # Responses are cached here, if set.
+        self.cache = cache
+        # MusicBrainz requires a meaningful user agent to identify our application.
+        self._user_agent = (
+            "music-cd-batch/0.1 ( https://github.com/UCLALibrary/music-cd-batch/ )"
+        )
+
+    def search_releases(
+        self, query: str, limit: int | None = None, offset: int = 0
+    ) -> dict:
+        """Search MusicBrainz releases with a Lucene query string, optionally
+        requesting a specific page of results.
+        Returns the parsed response, as a dict.
+        """
+        params = {"query": query}
+        if limit is not None:
+            params.update(limit=limit, offset=offset)
+        self.rate_limiter.wait()
+        response = self.transport.get(
+            SEARCH_URL,
+            params=params,
+            headers={"User-Agent": self._user_agent},
+        )
+        response.raise_for_status()
+        return mbxml.parse_message(response.content)
 
     def search_by_upc(self, upc: str) -> list:
         """Search MusicBrainz for releases by UPC. Returns a list of release dictionaries.
-        To match both CDs and UPCs precisely, use strict=True
+        To match both CDs and UPCs precisely, search for exact (quoted) values,
+        as musicbrainzngs does with strict=True.
         MusicBrainz calls UPCs "barcode"s.
         """
-        result = self.client.search_releases(barcode=upc, format="CD", strict=True)
-        return result["release-list"]
+        query = get_upc_query(upc)
+        return cached_call(
+            self.cache,
+            "musicbrainz",
+            "search",
+            query,
+            lambda: self.search_releases(query)["release-list"],
+        )
+
+    def search_by_upcs(self, upcs: list) -> dict[str, list]:
+        """Search MusicBrainz for releases by several UPCs at once, with one
+        query (and as few requests as possible), instead of one search per UPC.
+
+        Return dict of lists of release dictionaries, as search_by_upc() returns
+        them, keyed on UPC.  Releases are assigned to UPCs by their normalized
+        barcodes.  If the query finds more releases than it retrieves, or any
+        release can't be assigned, each UPC is searched for separately instead.
+        Cached results are used where available, and results for each UPC are
+        cached as if searched for separately.
+        """
+        results = {}
+        uncached_upcs = []
+        for upc in dict.fromkeys(upcs):
+            found = False
+            if self.cache is not None:
+                found, value = self.cache.get(
+                    "musicbrainz", "search", get_upc_query(upc)
+                )
+            if found:
+                results[upc] = value
+            else:
+                uncached_upcs.append(upc)
+        if len(uncached_upcs) < 2:
+            for upc in uncached_upcs:
+                results[upc] = self.search_by_upc(upc)
+            return results
+
+        barcodes = " OR ".join(
+            strict_term("barcode", upc).removeprefix("barcode:")
+            for upc in uncached_upcs
+        )
+        query = f"barcode:({barcodes}) AND {strict_term('format', 'CD')}"
+        response = self._search_all(query, RESULTS_PER_UPC * len(uncached_upcs))
+        releases = response["release-list"]
+        releases_by_upc = None
+        if len(releases) >= response["release-count"]:
+            releases_by_upc = split_releases(releases, uncached_upcs)
+        if releases_by_upc is None:
+            for upc in uncached_upcs:
+                results[upc] = self.search_by_upc(upc)
+            return results
+        for upc, upc_releases in releases_by_upc.items():
+            value = upc_releases[:RESULTS_PER_UPC]
+            results[upc] = value
+            if self.cache is not None:
+                self.cache.put("musicbrainz", "search", get_upc_query(upc), value)
+        return results
+
+    def _search_all(self, query: str, max_results: int) -> dict:
+        """Search MusicBrainz releases, requesting more pages of results
+        as needed, up to max_results.  Return dict with the total number
+        of releases found and (up to max_results of) the releases.
+        """
+        releases = []
+        release_count = 0
+        while len(releases) < max_results:
+            response = self.search_releases(
+                query, limit=SEARCH_LIMIT, offset=len(releases)
+            )
+            release_count = response.get("release-count", 0)
+            page = response["release-list"]
+            releases.extend(page)
+            if not page or len(releases) >= release_count:
+                break
+        return {"release-count": release_count, "release-list": releases[:max_results]}
 
     def parse_data(self, data: list) -> list:
         """Parse MusicBrainz list of releases to pull out data for future use.
@@ -65,3 +177,43 @@ class MusicbrainzClient:
             return catalog_numbers[0]
         else:
             return ""
+
+
+def get_upc_query(upc: str) -> str:
+    """Return the query for releases by UPC.
+    To match both CDs and UPCs precisely, search for exact (quoted) values,
+    as musicbrainzngs does with strict=True.
+    """
+    return f"{strict_term('barcode', upc)} AND {strict_term('format', 'CD')}"
+
+
+def split_releases(releases: list, upcs: list) -> dict[str, list] | None:
+    """Assign releases from a search for several UPCs to the UPC(s) matching
+    each release's barcode, keeping them in order.
+
+    Return dict of lists of releases keyed on UPC, or None if any release
+    doesn't match any of the UPCs.
+    """
+    if len(upcs) == 1:
+        return {upcs[0]: releases}
+    releases_by_upc = {upc: [] for upc in upcs}
+    upcs_by_barcode = {}
+    for upc in upcs:
+        upcs_by_barcode.setdefault(normalize_barcode(upc), []).append(upc)
+    for release in releases:
+        matching_upcs = upcs_by_barcode.get(
+            normalize_barcode(release.get("barcode", ""))
+        )
+        if not matching_upcs:
+            return None
+        for upc in matching_upcs:
+            releases_by_upc[upc].append(release)
+    return releases_by_upc
+
+
+def strict_term(field: str, value: str) -> str:
+    """Return a Lucene query term matching value exactly in the given field,
+    escaping Lucene's special characters.
+    """
+    escaped_value = re.sub(LUCENE_SPECIAL, r"\\\1", value)
+    return f'{field}:"{escaped_value}"'
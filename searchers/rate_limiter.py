@@ -0,0 +1,78 @@
+import threading
+import time
+
+# Default request budgets for each data source, in requests per second.
+# MusicBrainz allows 1 request per second per application.
+# Discogs allows 60 requests per minute for authenticated requests.
+# OCLC does not publish a fixed limit for the Worldcat Metadata API;
+# this stays well below the point where it starts refusing requests.
+DEFAULT_RATES = {
+    "discogs": 1.0,
+    "musicbrainz": 1.0,
+    "worldcat": 5.0,
+}
+
+
+class RateLimiter:
+    """Space requests to a single API evenly, at no more than the given rate.
+    Safe to share between threads: each caller reserves the next free time slot,
+    then sleeps until that slot arrives.
+    """
+
+    def __init__(self, requests_per_second: float) -> None:
+        self._lock = threading.Lock()
+        # Earliest time (per time.monotonic()) the next request may be sent.
+        self._next_slot = 0.0
+        self.set_rate(requests_per_second)
+
+    @property
+    def requests_per_second(self) -> float:
+        return 1.0 / self._interval
+
+    def set_rate(self, requests_per_second: float) -> None:
+        """Change the rate; this applies to requests not yet scheduled."""
+        if requests_per_second <= 0:
+            raise ValueError("requests_per_second must be greater than 0")
+        with self._lock:
+            self._interval = 1.0 / requests_per_second
+
+    def wait(self) -> None:
+        """Block until the caller may send its next request."""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self._interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class DiscogsRateLimiter(RateLimiter):
+    """Rate limiter which also adapts to the X-Discogs-Ratelimit headers
+    returned with each Discogs response.  Discogs counts requests over
+    a moving 60 second window.
+    """
+
+    WINDOW_SECONDS = 60
+
+    def __init__(self, requests_per_second: float) -> None:
+        super().__init__(requests_per_second)
+        # Never go faster than the configured rate, whatever Discogs reports.
+        self._max_rate = requests_per_second
+
+    def update_from_headers(self, rate_limit: str | None, remaining: str | None):
+        """Adjust the rate based on Discogs' reported limit and the number of
+        requests remaining in the current window.
+        """
+        if rate_limit is None or remaining is None:
+            return
+        rate_limit = int(rate_limit)
+        remaining = int(remaining)
+        if remaining >= rate_limit / 2:
+            # Plenty left: run at the full advertised rate.
+            rate = rate_limit / self.WINDOW_SECONDS
+        else:
+            # Running low, probably from other use of the same token:
+            # spread what's left over the next window.
+            rate = max(remaining, 1) / self.WINDOW_SECONDS
+        self.set_rate(min(rate, self._max_rate))
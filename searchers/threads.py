@@ -0,0 +1,21 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable
+
+
+def thread_map(func: Callable, items: Iterable, max_workers: int) -> list[Any]:
+    """Call func on each item, using up to max_workers threads at once.
+    Returns the results in the same order as items.
+
+    Each call runs in a copy of the caller's context, so context variables
+    (like batch_processing.row_log_records) still apply.
+    """
+    items = list(items)
+    if max_workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        futures = [
+            executor.submit(contextvars.copy_context().run, func, item)
+            for item in items
+        ]
+        return [future.result() for future in futures]
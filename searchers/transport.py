@@ -0,0 +1,90 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+# Default (connect, read) timeouts for each request, in seconds.
+DEFAULT_TIMEOUT = (5, 30)
+
+# Maximum number of idle connections kept open for reuse, per host.
+# This should cover the requests in flight across all rows being processed.
+POOL_SIZE = 16
+
+# Number of hosts to keep connection pools for.  Connection counts are taken
+# from the pools, so this should be at least the number of hosts contacted.
+POOL_HOSTS = 8
+
+
+class HttpTransport:
+    """Shared HTTP transport for the searcher clients which don't manage
+    their own connections (Discogs and MusicBrainz).
+
+    One requests.Session pools keep-alive connections for each host, asks for
+    gzip-compressed responses, and applies a timeout to every request.
+    Counters (see stats()) show how well connections are being reused.
+    """
+
+    def __init__(
+        self,
+        timeout: tuple[float, float] = DEFAULT_TIMEOUT,
+        max_retries: int = 3,
+    ) -> None:
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({"Accept-Encoding": "gzip"})
+        # Retry transient server errors; rate limiting (429) is handled by callers.
+        retries = Retry(
+            total=max_retries,
+            backoff_factor=1,
+            status_forcelist=[500, 502, 503, 504],
+            allowed_methods=["GET"],
+        )
+        self._adapter = HTTPAdapter(
+            pool_connections=POOL_HOSTS, pool_maxsize=POOL_SIZE, max_retries=retries
+        )
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+        self._lock = threading.Lock()
+        self._requests = 0
+        # Body bytes as sent over the network (compressed), and after decompression.
+        self._bytes_received = 0
+        self._bytes_decoded = 0
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Send a request, using the transport's timeout unless one is given.
+        The full response body is read before returning, so the connection
+        goes straight back to the pool.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        response = self.session.request(method, url, **kwargs)
+        content = response.content
+        with self._lock:
+            self._requests += 1
+            self._bytes_received += response.raw.tell()
+            self._bytes_decoded += len(content)
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def stats(self) -> dict[str, int]:
+        """Return counters for all requests sent through this transport."""
+        pools = self._adapter.poolmanager.pools
+        connections_opened = 0
+        http_requests = 0
+        for key in pools.keys():
+            pool = pools[key]
+            connections_opened += pool.num_connections
+            http_requests += pool.num_requests
+        with self._lock:
+            return {
+                "requests": self._requests,
+                "connections_opened": connections_opened,
+                # Includes retries, which also go through the pool.
+                "connections_reused": http_requests - connections_opened,
+                "bytes_received": self._bytes_received,
+                "bytes_decoded": self._bytes_decoded,
+            }
+
+    def close(self) -> None:
+        self.session.close()
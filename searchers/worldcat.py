@@ -1,20 +1,326 @@
+import logging
+import threading
+from collections import OrderedDict
 from io import BytesIO
+from typing import TYPE_CHECKING, Callable
+from xml.etree import ElementTree
 from bookops_worldcat import WorldcatAccessToken, MetadataSession
 from pymarc import parse_xml_to_array, Record
+from pymarc.constants import (
+    DIRECTORY_ENTRY_LEN,
+    END_OF_FIELD,
+    END_OF_RECORD,
+    LEADER_LEN,
+    SUBFIELD_INDICATOR,
+)
+from requests.adapters import HTTPAdapter
+from searchers.cache import ResponseCache, cached_call
+from searchers.rate_limiter import DEFAULT_RATES, RateLimiter
+from searchers.threads import thread_map
+
+if TYPE_CHECKING:
+    # Only for type hints: bib_store imports this module.
+    from bib_store import BibStore
+
+logger = logging.getLogger()
+
+# Only sound recordings (LDR/06 i or j) are usable, so search results in other
+# formats are rejected.  These are OCLC's format names, as in generalFormat in
+# search results.
+SOUND_RECORDING_FORMATS = ("Music", "Snd", "AudioBook")
+
+# Number of search results used for each search term (the API's default).
+SEARCH_LIMIT = 10
+
+# Number of search results requested per page when paging through results
+# for several terms (the most the API allows).
+SEARCH_PAGE_SIZE = 50
+
+# Maximum number of OCLC numbers the holdings API accepts in one request.
+HOLDINGS_BATCH_SIZE = 10
+
+# Maximum number of recently retrieved full records kept in memory for reuse.
+RECENT_BIBS_SIZE = 1000
+
+# Maximum number of idle connections the session keeps open for reuse.
+# This should cover the requests in flight across all rows being processed.
+SESSION_POOL_SIZE = 16
+
+
+# Fields needed to evaluate a candidate record.  Only the first of each is used,
+# except for 024 (standard numbers, including UPCs).
+CANDIDATE_TAGS = ("001", "008", "024", "040", "245")
+
+
+class WorldcatCandidate:
+    """A Worldcat record being evaluated for use, with just the data needed to
+    evaluate it, extracted once.  Most candidates are rejected, so the full
+    pymarc Record is only created (from binary MARC) when asked for, which is
+    usually just for the best candidate.
+
+    Create with from_xml(), from_marc() or from_record().
+    """
+
+    __slots__ = (
+        "oclc_number",
+        "record_type",
+        "encoding_level",
+        "form_of_item",
+        "has_040",
+        "cataloging_language",
+        "standard_numbers",
+        "title",
+        "full_title",
+        "short_title",
+        "_marc",
+        "_record",
+    )
+
+    def __init__(
+        self,
+        leader: str,
+        fields: dict,
+        marc: bytes | None = None,
+        record: Record | None = None,
+    ) -> None:
+        """Extract evaluation data from leader and fields, a dict of the fields
+        for each of CANDIDATE_TAGS present in the record, in order: control
+        field data, or lists of (code, value) subfields.  Either marc or record
+        must be given; the other is created from it when needed.
+        """
+        self._marc = marc
+        self._record = record
+        self.record_type = leader[6]
+        self.encoding_level = leader[17]
+        self.oclc_number = normalize_oclc_number(fields["001"][0])
+        data_008 = fields.get("008", [""])[0]
+        self.form_of_item = data_008[23] if len(data_008) > 23 else None
+        self.has_040 = "040" in fields
+        self.cataloging_language = get_subfield(fields.get("040", [[]])[0], "b")
+        # 024 $a, from all 024 fields.
+        self.standard_numbers = [
+            value
+            for subfields in fields.get("024", [])
+            for code, value in subfields
+            if code == "a"
+        ]
+        subfields_245 = fields.get("245", [None])[0]
+        # Same as pymarc's Record.title: 245 $a $b.
+        self.title = None
+        if subfields_245 is not None:
+            self.title = get_subfield(subfields_245, "a")
+            subtitle = get_subfield(subfields_245, "b")
+            if self.title and subtitle:
+                self.title += f" {subtitle}"
+        # Record.title is just 245 $a $b; we want 245 $a $n $p $b, and 245 $a.
+        subfields_245 = subfields_245 or []
+        self.full_title = " ".join(
+            value for code, value in subfields_245 if code in ("a", "n", "p", "b")
+        )
+        self.short_title = " ".join(
+            value for code, value in subfields_245 if code == "a"
+        )
+
+    @classmethod
+    def from_record(cls, record: Record) -> "WorldcatCandidate":
+        """Create a candidate from an existing pymarc Record."""
+        fields = {}
+        for field in record.get_fields(*CANDIDATE_TAGS):
+            if field.is_control_field():
+                value = field.data
+            else:
+                value = [(sf.code, sf.value) for sf in field.subfields]
+            fields.setdefault(field.tag, []).append(value)
+        return cls(str(record.leader), fields, record=record)
+
+    @classmethod
+    def from_marc(cls, marc: bytes) -> "WorldcatCandidate":
+        """Create a candidate from binary MARC (UTF-8), reading only the
+        fields needed, rather than parsing the whole record.
+        """
+        leader = marc[:LEADER_LEN].decode("ascii")
+        base_address = int(leader[12:17])
+        directory = marc[LEADER_LEN : base_address - 1].decode("ascii")
+        fields = {}
+        for start in range(0, len(directory), DIRECTORY_ENTRY_LEN):
+            entry = directory[start : start + DIRECTORY_ENTRY_LEN]
+            tag = entry[0:3]
+            if tag not in CANDIDATE_TAGS:
+                continue
+            offset = base_address + int(entry[7:12])
+            data = marc[offset : offset + int(entry[3:7]) - 1]
+            if tag < "010":
+                value = data.decode("utf-8")
+            else:
+                value = [
+                    (subfield[0:1].decode("ascii"), subfield[1:].decode("utf-8"))
+                    for subfield in data.split(SUBFIELD_INDICATOR.encode("ascii"))[1:]
+                    if subfield
+                ]
+            fields.setdefault(tag, []).append(value)
+        return cls(leader, fields, marc=marc)
+
+    @classmethod
+    def from_xml(cls, xml: bytes) -> "WorldcatCandidate":
+        """Create a candidate from MARC XML as returned by Worldcat,
+        converting it directly to binary MARC: the same bytes as pymarc's
+        parse_xml_to_array() then as_marc21(), at a fraction of the cost.
+        """
+        root = ElementTree.fromstring(xml)
+        # Like pymarc, ignore namespaces: the first record element is the MARC record.
+        marc_record = next(
+            element for element in root.iter() if local_name(element) == "record"
+        )
+        leader = " " * LEADER_LEN
+        fields = {}
+        directory = []
+        field_data = []
+        offset = 0
+        for element in marc_record:
+            element_name = local_name(element)
+            if element_name == "leader":
+                leader = element.text or ""
+                continue
+            if element_name not in ("controlfield", "datafield"):
+                continue
+            tag = element.get("tag")
+            if tag.isdigit():
+                tag = f"{int(tag):03}"
+            if tag < "010" and tag.isdigit():
+                value = element.text or ""
+                data = value
+            else:
+                value = [
+                    (subfield.get("code"), subfield.text or "")
+                    for subfield in element
+                    if local_name(subfield) == "subfield"
+                ]
+                data = element.get("ind1", " ") + element.get("ind2", " ")
+                data += "".join(
+                    f"{SUBFIELD_INDICATOR}{code}{text}" for code, text in value
+                )
+            if tag in CANDIDATE_TAGS:
+                fields.setdefault(tag, []).append(value)
+            encoded = f"{data}{END_OF_FIELD}".encode("utf-8")
+            field_data.append(encoded)
+            directory.append(f"{tag:>3}{len(encoded):04d}{offset:05d}")
+            offset += len(encoded)
+        # As pymarc does, mark the record as UTF-8 and fill in lengths.
+        leader = leader[0:9] + "a" + leader[10:]
+        directory.append(END_OF_FIELD)
+        field_data.append(END_OF_RECORD.encode("utf-8"))
+        directory_bytes = "".join(directory).encode("utf-8")
+        base_address = LEADER_LEN + len(directory_bytes)
+        record_length = base_address + offset + 1
+        leader = f"{record_length:0>5}{leader[5:12]}{base_address:0>5}{leader[17:]}"
+        marc = leader.encode("utf-8") + directory_bytes + b"".join(field_data)
+        return cls(leader, fields, marc=marc)
+
+    @property
+    def record(self) -> Record:
+        """The full pymarc Record, created on first use."""
+        if self._record is None:
+            self._record = Record(data=self._marc, force_utf8=True)
+        return self._record
+
+    def as_marc21(self) -> bytes:
+        """Return the record as binary MARC."""
+        if self._marc is None:
+            self._marc = self._record.as_marc21()
+        return self._marc
+
+
+def get_subfield(subfields: list, code: str) -> str | None:
+    """Return value of the first subfield with the given code, or None."""
+    for subfield_code, value in subfields:
+        if subfield_code == code:
+            return value
+    return None
+
+
+def local_name(element: ElementTree.Element) -> str:
+    """Return an XML element's name without its namespace."""
+    return element.tag.rpartition("}")[2]
+
+
+def get_search_cache_key(query: str, triaged: bool = False) -> str:
+    """Return the key for caching results of a search query.
+    Results depend on the number of results requested as well as the query.
+    Results with only the records which passed triage (see
+    WorldcatClient.search_many) are cached separately, so search() never
+    gets them.
+    """
+    key = f"{query} limit={SEARCH_LIMIT}"
+    return f"{key} triaged" if triaged else key
+
+
+def normalize_standard_number(input: str) -> str:
+    """Normalize a standard number (like a UPC) for comparison, keeping
+    only the digits before any qualifier, without leading zeroes.
+    Examples:
+    * 602527567730 -> 602527567730
+    * 0602527567730 -> 602527567730
+    * 0 93624-74862 5 (Warner) -> 93624748625
+    """
+    number = input.split("(")[0]
+    return "".join(d for d in number if d.isdigit()).lstrip("0")
+
+
+def normalize_oclc_number(input: str) -> str:
+    """Normalize OCLC number by stripping non-digits
+    and leading zeroes.
+    Examples:
+    * ocm00123456 -> 123456
+    * on98765 -> 98765
+    * 0123456789 -> 123456789
+    """
+    digits = "".join(d for d in input if d.isdigit())
+    return digits.lstrip("0")
 
 
 class WorldcatClient:
+    """Provide a wrapper around specific functionality for bookops-worldcat
+    (https://pypi.org/project/bookops-worldcat/) to support
+    UCLA's batch music CD cataloging project.
+
+    The client keeps one MetadataSession open for all requests; use it as a
+    context manager, or call close(), to release the session's connections.
+    """
+
     def __init__(
         self,
         key: str,
         secret: str,
         scopes: str = "WorldCatMetadataAPI",
+        rate_limiter: RateLimiter | None = None,
+        max_workers: int = 4,
+        cache: ResponseCache | None = None,
+        bib_store: "BibStore | None" = None,
     ) -> None:
         self._KEY = key
         self._SECRET = secret
         self._SCOPES = scopes
         # Token will be set on first use.
         self._token = None
+        # Several threads may need a token at once; only one should request it.
+        self._token_lock = threading.Lock()
+        # Maximum number of records to retrieve at the same time.
+        self.max_workers = max_workers
+        # Session will be set on first use, and kept open for reuse.
+        self._session = None
+        self._session_lock = threading.Lock()
+        # All Metadata API requests wait for this first.
+        if rate_limiter is None:
+            rate_limiter = RateLimiter(DEFAULT_RATES["worldcat"])
+        self.rate_limiter = rate_limiter
+        # Responses are cached here, if set.
+        self.cache = cache
+        # Full records are kept here, if set, and used instead of retrieving them again.
+        self.bib_store = bib_store
+        # Recently retrieved full records (as binary MARC), keyed on OCLC number,
+        # so records retrieved to split search results aren't retrieved again.
+        self._recent_bibs: OrderedDict[str, bytes] = OrderedDict()
+        self._recent_bibs_lock = threading.Lock()
 
     def _set_authentication_token(self):
         """Initialize authorization token needed for all Worldcat interactions."""
@@ -30,12 +336,41 @@ class WorldcatClient:
         """Return existing token if set and still valid;
         otherwise, obtain and set new token.
         """
-        if (self._token is not None) and (not self._token.is_expired()):
-            # Do nothing, return at end
-            pass
-        else:
-            self._set_authentication_token()
-        return self._token
+        with self._token_lock:
+            if (self._token is not None) and (not self._token.is_expired()):
+                # Do nothing, return at end
+                pass
+            else:
+                self._set_authentication_token()
+            return self._token
+
+    @property
+    def session(self) -> MetadataSession:
+        """Return the persistent MetadataSession, creating it on first use.
+        Connections are kept alive and reused between requests.  The session
+        requests a new token itself when its token expires.
+        """
+        with self._session_lock:
+            if self._session is None:
+                self._session = MetadataSession(authorization=self.token)
+                adapter = HTTPAdapter(
+                    pool_connections=1, pool_maxsize=SESSION_POOL_SIZE
+                )
+                self._session.mount("https://", adapter)
+            return self._session
+
+    def close(self) -> None:
+        """Close the persistent session, if any."""
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def __enter__(self) -> "WorldcatClient":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
 
     def search(self, search_term: str, search_index: str) -> dict:
         """Search Worldcat via Bookops implementation of OCLC's Metadata API /search/brief-bibs.
@@ -43,10 +378,201 @@ class WorldcatClient:
         Return dict with search results.
         """
         query = f"{search_index}:{search_term}"
-        with MetadataSession(authorization=self.token) as session:
-            response = session.brief_bibs_search(q=query)
-            # TODO: Handle failures / errors
-            return response.json()
+        return cached_call(
+            self.cache,
+            "worldcat",
+            "search",
+            get_search_cache_key(query),
+            lambda: self._search(query),
+        )
+
+    def search_any(self, search_terms: dict[str, list]) -> dict:
+        """Search Worldcat for records matching any of several terms, in one or
+        more indexes, with one boolean ("OR") query, paging through up to
+        SEARCH_LIMIT results per term.  search_terms is a dict of lists of terms,
+        keyed on search index.
+
+        Return dict with search results, as search() does, with each record
+        included only once.  Empty terms are ignored.
+        """
+        clauses = [
+            f"{search_index}:{search_term.strip()}"
+            for search_index, terms in search_terms.items()
+            for search_term in terms
+            if search_term.strip()
+        ]
+        if not clauses:
+            return {"numberOfRecords": 0, "briefRecords": []}
+        query = " OR ".join(clauses)
+        return cached_call(
+            self.cache,
+            "worldcat",
+            "search",
+            get_search_cache_key(query),
+            lambda: self._search_any(query, SEARCH_LIMIT * len(clauses)),
+        )
+
+    def _search_any(self, query: str, max_results: int) -> dict:
+        brief_records = {}
+        search_results = self._search_all(query, max_results)
+        for brief_record in search_results["briefRecords"]:
+            brief_records.setdefault(brief_record["oclcNumber"], brief_record)
+        return {
+            "numberOfRecords": len(brief_records),
+            "briefRecords": list(brief_records.values()),
+        }
+
+    def _search(self, query: str, offset: int = 1, limit: int = SEARCH_LIMIT) -> dict:
+        self.rate_limiter.wait()
+        response = self.session.brief_bibs_search(q=query, offset=offset, limit=limit)
+        # TODO: Handle failures / errors
+        return response.json()
+
+    def _search_all(self, query: str, max_results: int) -> dict:
+        """Search Worldcat, requesting more pages of results as needed, up to
+        max_results.  Return dict with the total number of records found
+        and (up to max_results of) their brief records.
+        """
+        brief_records = []
+        number_of_records = 0
+        page_size = min(SEARCH_PAGE_SIZE, max_results)
+        offset = 1
+        while offset <= max_results:
+            search_results = self._search(query, offset, page_size)
+            number_of_records = search_results.get("numberOfRecords", 0)
+            page = self.get_brief_records(search_results)
+            brief_records.extend(page)
+            offset += page_size
+            if not page or offset > number_of_records:
+                break
+        return {
+            "numberOfRecords": number_of_records,
+            "briefRecords": brief_records[:max_results],
+        }
+
+    def search_many(
+        self,
+        search_terms: list,
+        search_index: str,
+        triage: Callable[[list[dict]], list[str]] | None = None,
+    ) -> dict[str, dict]:
+        """Search Worldcat for several terms at once, with one boolean
+        ("OR") query, instead of one search per term.
+
+        Return dict of search results for each term, as search() returns them.
+        Each record found is assigned to the term(s) it matches (see
+        _split_brief_records()).  If triage is given, it's called with the brief
+        records found, as data_evaluator.triage_brief_records() is, and records
+        it rejects are left out rather than assigned.  If the query finds more
+        records than it retrieves, or any record can't be assigned, each term is
+        searched for separately.
+        Cached results are used where available.  Results for each term are
+        cached as if searched for separately, or, if triaged, under their own key.
+        """
+        triaged = triage is not None
+        results = {}
+        uncached_terms = []
+        for search_term in dict.fromkeys(search_terms):
+            found = False
+            query = f"{search_index}:{search_term}"
+            # Untriaged results will do as well, if triage is wanted.
+            for cache_key in dict.fromkeys(
+                [get_search_cache_key(query, triaged), get_search_cache_key(query)]
+            ):
+                if self.cache is not None and not found:
+                    found, value = self.cache.get("worldcat", "search", cache_key)
+            if found:
+                results[search_term] = value
+            else:
+                uncached_terms.append(search_term)
+        if len(uncached_terms) < 2:
+            for search_term in uncached_terms:
+                results[search_term] = self.search(search_term, search_index)
+            return results
+
+        query = " OR ".join(f"{search_index}:{term}" for term in uncached_terms)
+        search_results = self._search_all(query, SEARCH_LIMIT * len(uncached_terms))
+        brief_records = search_results["briefRecords"]
+        brief_records_by_term = None
+        if len(brief_records) >= search_results["numberOfRecords"]:
+            if triaged:
+                usable_numbers = set(triage(brief_records))
+                brief_records = [
+                    brief_record
+                    for brief_record in brief_records
+                    if brief_record["oclcNumber"] in usable_numbers
+                ]
+            brief_records_by_term = self._split_brief_records(
+                brief_records, uncached_terms
+            )
+        if brief_records_by_term is None:
+            logger.debug(
+                f"\tCould not split results of {query}; searching for each term"
+            )
+            for search_term in uncached_terms:
+                results[search_term] = self.search(search_term, search_index)
+            return results
+        for search_term, term_records in brief_records_by_term.items():
+            value = {"numberOfRecords": len(term_records), "briefRecords": term_records}
+            results[search_term] = value
+            if self.cache is not None:
+                query = f"{search_index}:{search_term}"
+                cache_key = get_search_cache_key(query, triaged)
+                self.cache.put("worldcat", "search", cache_key, value)
+        return results
+
+    def _split_brief_records(
+        self, brief_records: list[dict], search_terms: list
+    ) -> dict[str, list[dict]] | None:
+        """Assign brief records from a search for several standard numbers to
+        the number(s) each matches, keeping them in order, and up to
+        SEARCH_LIMIT per number, as a search for that number alone returns.
+        Brief records have no UPCs, so full records are retrieved for their
+        standard numbers (024 $a); they're kept (see _get_candidates_by_number)
+        for evaluating later.
+
+        Return dict of brief records keyed on search term, or None if any
+        record doesn't match any of the terms.
+        """
+        normalized_terms = {
+            term: normalize_standard_number(term) for term in search_terms
+        }
+
+        def get_matching_terms(numbers: list) -> list:
+            standard_numbers = {normalize_standard_number(n) for n in numbers}
+            return [
+                term
+                for term, normalized_term in normalized_terms.items()
+                if normalized_term in standard_numbers
+            ]
+
+        oclc_numbers = list(dict.fromkeys(r["oclcNumber"] for r in brief_records))
+        candidates = self._get_candidates_by_number(oclc_numbers)
+        matching_terms = {}
+        for oclc_number in oclc_numbers:
+            candidate = candidates.get(oclc_number)
+            if candidate is None:
+                return None
+            matching_terms[oclc_number] = get_matching_terms(candidate.standard_numbers)
+            if not matching_terms[oclc_number]:
+                return None
+        brief_records_by_term = {term: [] for term in search_terms}
+        for brief_record in brief_records:
+            for term in matching_terms[brief_record["oclcNumber"]]:
+                brief_records_by_term[term].append(brief_record)
+        return {
+            term: term_records[:SEARCH_LIMIT]
+            for term, term_records in brief_records_by_term.items()
+        }
+
+    def get_brief_records(self, search_results: dict) -> list[dict]:
+        """Return list of brief records (dicts, with OCLC number, format,
+        cataloging info and title) from search results, or empty list if
+        no records found.
+        """
+        if search_results.get("numberOfRecords") == 0:
+            return []
+        return search_results.get("briefRecords", [])
 
     def get_oclc_numbers(self, search_results: dict) -> list:
         """Return list of OCLC numbers matching the search, or empty list if no records found."""
@@ -64,14 +590,26 @@ class WorldcatClient:
         """Retrieve full MARC XML record from Worldcat, using Bookops implementation of OCLC's
         Metadata (1.0) API /bib/data.
 
-        Return bytes (containing XML) as that's what the API returns
+        Return bytes (containing XML) as that's what the API returns.
+        The XML isn't cached if there's a bib store, which keeps the records itself.
         """
-        with MetadataSession(authorization=self.token) as session:
-            response = session.bib_get(oclc_number)
-            # TEMPORARY: Dump XML to file for manual review.
-            # with open(f"{oclc_number}.xml", "wb") as f:
-            #     f.write(response.content)
-            return response.content
+        if self.bib_store is not None:
+            return self._get_xml(oclc_number)
+        return cached_call(
+            self.cache,
+            "worldcat",
+            "bib",
+            oclc_number,
+            lambda: self._get_xml(oclc_number),
+        )
+
+    def _get_xml(self, oclc_number: str) -> bytes:
+        self.rate_limiter.wait()
+        response = self.session.bib_get(oclc_number)
+        # TEMPORARY: Dump XML to file for manual review.
+        # with open(f"{oclc_number}.xml", "wb") as f:
+        #     f.write(response.content)
+        return response.content
 
     def convert_xml_to_marc(self, xml: bytes) -> Record:
         """Convert MARC XML from Worldcat to a pymarc Record object.
@@ -84,32 +622,138 @@ class WorldcatClient:
         # return only the first record, though there should only be one from Worldcat anyhow.
         return parse_xml_to_array(data)[0]
 
-    def get_records(self, oclc_numbers: list) -> list[Record]:
-        """Retrieve full MARC records from Worldcat, using Bookops implementation of OCLC's
-        Metadata (1.0) API /bib/data and pymarc's XML -> MARC conversion.
+    def get_record(self, oclc_number: str) -> Record:
+        """Retrieve one full MARC record from Worldcat, using get_xml and
+        pymarc's XML -> MARC conversion.
+        """
+        xml = self.get_xml(oclc_number)
+        bib = self.convert_xml_to_marc(xml)
+        # TEMPORARY: Dump binary marc record to file for manual review.
+        # with open(f"{oclc_number}.mrc", "wb") as f:
+        #     f.write(bib.as_marc21())
+        return bib
+
+    def get_candidate(self, oclc_number: str) -> WorldcatCandidate:
+        """Retrieve one record from Worldcat, for evaluation."""
+        return WorldcatCandidate.from_xml(self.get_xml(oclc_number))
+
+    def get_candidates(
+        self, oclc_numbers: list, max_workers: int | None = None
+    ) -> list[WorldcatCandidate]:
+        """Retrieve records from Worldcat for evaluation, using Bookops implementation
+        of OCLC's Metadata (1.0) API /bib/data.  Up to max_workers (default:
+        self.max_workers) records are retrieved at the same time.
 
-        Return list of MARC records, or empty list if no records found.
+        Records already in the bib store (if any) are taken from there, and
+        newly retrieved records are added to it.  The last RECENT_BIBS_SIZE
+        records retrieved are also kept in memory, and reused.
+
+        Return list of candidates in the same order as oclc_numbers, or empty list
+        if no records found.  Records which can't be retrieved are logged and left out,
+        rather than stopping retrieval of the others.
         """
-        records = []
-        for oclc_number in oclc_numbers:
-            xml = self.get_xml(oclc_number)
-            bib = self.convert_xml_to_marc(xml)
-            # TEMPORARY: Dump binary marc record to file for manual review.
-            # with open(f"{oclc_number}.mrc", "wb") as f:
-            #     f.write(bib.as_marc21())
-            records.append(bib)
-        return records
+        candidates = self._get_candidates_by_number(oclc_numbers, max_workers)
+        return [candidates[n] for n in oclc_numbers if n in candidates]
+
+    def _get_candidates_by_number(
+        self, oclc_numbers: list, max_workers: int | None = None
+    ) -> dict[str, WorldcatCandidate]:
+        """Retrieve records as get_candidates() does, returning a dict keyed on
+        the OCLC numbers requested.
+        """
+        if max_workers is None:
+            max_workers = self.max_workers
+        # Each caller gets its own candidates, as callers may change their records.
+        with self._recent_bibs_lock:
+            stored_candidates = {
+                n: WorldcatCandidate.from_marc(self._recent_bibs[n])
+                for n in oclc_numbers
+                if n in self._recent_bibs
+            }
+        if self.bib_store is not None:
+            stored_candidates |= self.bib_store.get_many_candidates(
+                [n for n in oclc_numbers if n not in stored_candidates]
+            )
+        missing_numbers = [n for n in oclc_numbers if n not in stored_candidates]
+        retrieved_candidates = {
+            oclc_number: candidate
+            for oclc_number, candidate in zip(
+                missing_numbers,
+                thread_map(self._get_candidate_or_none, missing_numbers, max_workers),
+            )
+            if candidate is not None
+        }
+        if self.bib_store is not None and retrieved_candidates:
+            self.bib_store.put_many(retrieved_candidates)
+        with self._recent_bibs_lock:
+            for oclc_number, candidate in retrieved_candidates.items():
+                self._recent_bibs[oclc_number] = candidate.as_marc21()
+            while len(self._recent_bibs) > RECENT_BIBS_SIZE:
+                self._recent_bibs.popitem(last=False)
+        return stored_candidates | retrieved_candidates
+
+    def get_records(
+        self, oclc_numbers: list, max_workers: int | None = None
+    ) -> list[Record]:
+        """Retrieve full MARC records from Worldcat, as get_candidates() does.
+
+        Return list of MARC records in the same order as oclc_numbers, or empty list
+        if no records found.
+        """
+        return [
+            candidate.record
+            for candidate in self.get_candidates(oclc_numbers, max_workers)
+        ]
+
+    def _get_candidate_or_none(self, oclc_number: str) -> WorldcatCandidate | None:
+        """Return the candidate for oclc_number, or None (with a logged
+        warning) if it can't be retrieved or converted.
+        """
+        try:
+            return self.get_candidate(oclc_number)
+        except Exception as ex:
+            logger.warning(f"\tCould not retrieve OCLC# {oclc_number}: {ex!r}")
+            return None
 
     def is_held_by_us(self, oclc_number: str) -> bool:
         """Determine whether the given OCLC number is held by the institution(s)
         associated with the authorization token.
         """
-        with MetadataSession(authorization=self.token) as session:
-            response = session.holdings_get_current(oclc_number)
+        return self.holdings_for([oclc_number]).get(oclc_number, False)
+
+    def holdings_for(self, oclc_numbers: list) -> dict[str, bool]:
+        """Determine which of the given OCLC numbers are held by the institution(s)
+        associated with the authorization token, using as few requests as
+        the API allows.
+
+        Return dict of holding status (True if held), keyed on OCLC number.
+        Cached holdings are used where available; only the rest are requested.
+        """
+        holdings = {}
+        uncached_numbers = []
+        for oclc_number in oclc_numbers:
+            found = False
+            if self.cache is not None:
+                found, held = self.cache.get("worldcat", "holdings", oclc_number)
+            if found:
+                holdings[oclc_number] = held
+            else:
+                uncached_numbers.append(oclc_number)
+        for start in range(0, len(uncached_numbers), HOLDINGS_BATCH_SIZE):
+            batch = uncached_numbers[start : start + HOLDINGS_BATCH_SIZE]
+            self.rate_limiter.wait()
+            response = self.session.holdings_get_current(batch)
             data = response.json().get("holdings")
-            # This is a list of dictionaries - 1 per requestedControlNumber?
+            # This is a list of dictionaries, 1 per requestedControlNumber:
             # [{'requestedControlNumber': '56713778', 'currentControlNumber': '56713778',
             # 'institutionSymbol': 'CLU', 'holdingSet': False}]
             for entry in data:
-                if entry["requestedControlNumber"] == oclc_number:
-                    return entry["holdingSet"]
+                holdings[entry["requestedControlNumber"]] = entry["holdingSet"]
+                if self.cache is not None:
+                    self.cache.put(
+                        "worldcat",
+                        "holdings",
+                        entry["requestedControlNumber"],
+                        entry["holdingSet"],
+                    )
+        return holdings
@@ -0,0 +1,61 @@
+import asyncio
+import unittest
+from searchers.aio import AsyncMusicbrainzClient
+
+
+class FakeMusicbrainzClient:
+    """Count searches instead of calling MusicBrainz."""
+
+    def __init__(self) -> None:
+        self.searches = []
+
+    def search_by_upc(self, upc: str) -> list:
+        self.searches.append(upc)
+        if upc == "666":
+            raise ConnectionError("Simulated network failure")
+        return [{"barcode": upc}]
+
+    def search_by_upcs(self, upcs: list) -> dict[str, list]:
+        self.searches.append(tuple(upcs))
+        return {upc: [{"barcode": upc}] for upc in upcs}
+
+
+class TestLookupMemo(unittest.TestCase):
+    def setUp(self):
+        self.sync_client = FakeMusicbrainzClient()
+
+    def test_repeated_searches_share_one_lookup(self):
+        async def search_all() -> list:
+            client = AsyncMusicbrainzClient(self.sync_client)
+            return await asyncio.gather(
+                client.search_by_upc("123"),
+                client.search_by_upc("123"),
+                client.search_by_upc("456"),
+            )
+
+        results = asyncio.run(search_all())
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(self.sync_client.searches, ["123", "456"])
+
+    def test_prefetched_searches_are_used(self):
+        async def search_all() -> list:
+            client = AsyncMusicbrainzClient(self.sync_client)
+            client.prefetch(["123", "456"])
+            return [
+                await client.search_by_upc("456"),
+                await client.search_by_upc("789"),
+            ]
+
+        results = asyncio.run(search_all())
+        self.assertEqual(results, [[{"barcode": "456"}], [{"barcode": "789"}]])
+        self.assertEqual(self.sync_client.searches, [("123", "456"), "789"])
+
+    def test_failed_searches_are_retried(self):
+        async def search_twice() -> None:
+            client = AsyncMusicbrainzClient(self.sync_client)
+            for _ in range(2):
+                with self.assertRaises(ConnectionError):
+                    await client.search_by_upc("666")
+
+        asyncio.run(search_twice())
+        self.assertEqual(self.sync_client.searches, ["666", "666"])
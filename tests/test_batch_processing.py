@@ -0,0 +1,236 @@
+import asyncio
+import logging
+import os
+import tempfile
+import unittest
+import unittest.mock
+from pathlib import Path
+from pymarc import Field, Record, Subfield
+from batch_processing import (
+    RowDecision,
+    RowLogHandler,
+    Shard,
+    count_row_groups,
+    get_row_group_key,
+    get_shard_filenames,
+    merge_shard_output,
+    process_rows,
+    split_range,
+)
+from journal import SEARCHED, BatchJournal, read_entries
+from music_data import MusicDataRow
+
+logger = logging.getLogger()
+
+
+class ListHandler(logging.Handler):
+    """Keep log messages in a list."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.messages.append(record.getMessage())
+
+
+class FakeWriter:
+    """Keep rows in the order written, instead of writing MARC files."""
+
+    def __init__(self) -> None:
+        self.rows = []
+
+    def write_row(self, idx: int, marc_record: Record | None, file_type: str | None):
+        self.rows.append((idx, marc_record, file_type))
+
+
+class FakePrefetchClient:
+    """Keep the UPCs of each batch lookup, and log as a lookup would."""
+
+    def __init__(self) -> None:
+        self.batches = []
+
+    def prefetch(self, upc_codes: list, *args) -> None:
+        self.batches.append(upc_codes)
+        logger.info("Searching for a batch")
+        logger.warning("Could not retrieve a record")
+
+
+class TestRowGroups(unittest.TestCase):
+    def test_get_row_group_key(self):
+        row = MusicDataRow("0602527567730", "CDA 1", "L001", "Pretty hate machine")
+        same_row = MusicDataRow(
+            " 602527567730 ", "CDA 2", "L002", "Pretty Hate Machine"
+        )
+        self.assertEqual(get_row_group_key(row), get_row_group_key(same_row))
+        other_title = MusicDataRow("602527567730", "CDA 3", "L003", "Broken")
+        self.assertNotEqual(get_row_group_key(row), get_row_group_key(other_title))
+        no_upc = MusicDataRow(" ", "CDA 4", "L004", "Pretty hate machine")
+        self.assertIsNone(get_row_group_key(no_upc))
+
+    def test_count_row_groups(self):
+        rows = [
+            MusicDataRow("602527567730", "CDA 1", "L001", "Pretty hate machine"),
+            MusicDataRow("0602527567730", "CDA 2", "L002", "Pretty hate machine"),
+            MusicDataRow("", "CDA 3", "L003", "Flood"),
+            MusicDataRow("602527567730", "CDA 4", "L004", "Pretty hate machine"),
+        ]
+        group_sizes = count_row_groups(rows, start_index=10, completed_rows={13})
+        self.assertEqual(dict(group_sizes), {get_row_group_key(rows[0]): 2})
+
+
+class TestProcessRows(unittest.TestCase):
+    def setUp(self):
+        # Hold back row log messages, as configure_logging() does.
+        self.log = ListHandler()
+        self.handler = RowLogHandler(self.log)
+        self.old_level = logger.level
+        logger.addHandler(self.handler)
+        logger.setLevel(logging.INFO)
+        # Rows decided, in the order they were started.
+        self.decided = []
+        # Seconds each row takes to decide, keyed on row index.
+        self.delays = {}
+        patcher = unittest.mock.patch("batch_processing.decide_row", self.decide_row)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        logger.removeHandler(self.handler)
+        logger.setLevel(self.old_level)
+
+    async def decide_row(
+        self, idx, upc_code, call_number, official_title, clients, journal=None
+    ) -> RowDecision:
+        self.decided.append(idx)
+        await asyncio.sleep(self.delays.get(idx, 0))
+        logger.info(f"Decided row {idx}")
+        record = Record()
+        record.add_field(
+            Field(
+                tag="245",
+                indicators=["0", "0"],
+                subfields=[Subfield("a", official_title)],
+            )
+        )
+        return RowDecision(record, "oclc", [])
+
+    def process(self, rows: list, clients=(None, None, None), **kwargs) -> list:
+        output = FakeWriter()
+        asyncio.run(process_rows(rows, 0, clients, output, **kwargs))
+        return output.rows
+
+    def test_output_in_input_order(self):
+        rows = [
+            MusicDataRow(f"12345{i}", f"CDA {i}", f"L{i}", "Title") for i in range(4)
+        ]
+        # Later rows finish first.
+        self.delays = {0: 0.03, 1: 0.02, 2: 0.01}
+        output_rows = self.process(rows, concurrency=4)
+        self.assertEqual([idx for idx, _, _ in output_rows], [0, 1, 2, 3])
+        self.assertEqual(
+            [m for m in self.log.messages if m.startswith("Decided")],
+            [f"Decided row {i}" for i in range(4)],
+        )
+
+    def test_completed_rows_are_skipped(self):
+        rows = [
+            MusicDataRow(f"12345{i}", f"CDA {i}", f"L{i}", "Title") for i in range(3)
+        ]
+        output_rows = self.process(rows, concurrency=2, completed_rows={1})
+        self.assertEqual([idx for idx, _, _ in output_rows], [0, 2])
+
+    def test_batch_lookups(self):
+        rows = [
+            MusicDataRow("602527567730", "CDA 1", "L001", "Pretty hate machine"),
+            MusicDataRow("881626300329", "CDA 2", "L002", "Flood"),
+            MusicDataRow("0602527567730", "CDA 3", "L003", "Pretty Hate Machine"),
+            MusicDataRow("0602527567730", "CDA 4", "L004", "Pretty Hate Machine"),
+        ]
+        client = FakePrefetchClient()
+        self.process(
+            rows,
+            clients=(client, None, client),
+            search_batch_size=2,
+            group_sizes=count_row_groups(rows, 0, set()),
+        )
+        # One batch for each client (Worldcat and MusicBrainz): rows 2 and 3
+        # reuse row 0's decision, so aren't searched for.
+        self.assertEqual(client.batches, [["602527567730", "881626300329"]] * 2)
+        # Only warnings from batch lookups are logged.
+        self.assertNotIn("Searching for a batch", self.log.messages)
+        self.assertEqual(self.log.messages.count("Could not retrieve a record"), 2)
+
+    def test_rows_share_decision(self):
+        rows = [
+            MusicDataRow("602527567730", "CDA 1", "L001", "Pretty hate machine"),
+            MusicDataRow("881626300329", "CDA 2", "L002", "Flood"),
+            MusicDataRow("0602527567730", "CDA 3", "l003", "Pretty Hate Machine"),
+        ]
+        group_sizes = count_row_groups(rows, 0, set())
+        output_rows = self.process(rows, concurrency=3, group_sizes=group_sizes)
+        self.assertEqual(self.decided, [0, 1])
+        self.assertIn(
+            "\tSame UPC and title as row 0: using its decision", self.log.messages
+        )
+        # Each row has its own copy of the record, with its own local fields.
+        records = [record for _, record, _ in output_rows]
+        self.assertIsNot(records[0], records[2])
+        self.assertEqual(records[2].title, "Pretty hate machine")
+        self.assertEqual(
+            [record.get("099")["a"] for record in records], ["CDA 1", "CDA 2", "CDA 3"]
+        )
+        self.assertEqual(
+            [record.get("049")["l"] for record in records], ["L001", "L002", "L003"]
+        )
+
+
+class TestShards(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.old_cwd = os.getcwd()
+        os.chdir(self.temp_dir.name)
+
+    def tearDown(self):
+        os.chdir(self.old_cwd)
+        self.temp_dir.cleanup()
+
+    def test_split_range(self):
+        self.assertEqual(
+            split_range(range(2, 12), 3), [range(2, 6), range(6, 9), range(9, 12)]
+        )
+        # No empty ranges.
+        self.assertEqual(split_range(range(0, 2), 4), [range(0, 1), range(1, 2)])
+
+    def test_merge_shard_output(self):
+        marc_filenames = {"oclc": "batch_oclc.mrc", "orig": "batch_orig.mrc"}
+        Path("batch_oclc.mrc").write_bytes(b"record 0")
+        Path("batch.log").write_text("row 0\n")
+        journal = BatchJournal("batch_journal.jsonl", marc_filenames)
+        journal.commit_rows([(0, "oclc", {"oclc": 8, "orig": 0})])
+
+        # Shard 1 wrote row 1 to its own files.
+        shard = Shard(1, "batch.tsv", 1, 2, set(), "INFO", {})
+        shard_filenames = get_shard_filenames("batch.tsv", 1)
+        Path(shard_filenames["marc"]["oclc"]).write_bytes(b"record 1")
+        Path(shard_filenames["log"]).write_text("row 1\n")
+        shard_journal = BatchJournal(
+            shard_filenames["journal"], shard_filenames["marc"]
+        )
+        shard_journal.record(1, SEARCHED, upc="123")
+        shard_journal.commit_rows([(1, "oclc", {"oclc": 8, "orig": 0})])
+        shard_journal.close()
+
+        merge_shard_output(shard, marc_filenames, "batch.log", journal)
+        journal.close()
+        self.assertEqual(Path("batch_oclc.mrc").read_bytes(), b"record 0record 1")
+        self.assertFalse(Path("batch_orig.mrc").exists())
+        self.assertEqual(Path("batch.log").read_text(), "row 0\nrow 1\n")
+        entries = read_entries("batch_journal.jsonl")
+        self.assertEqual(entries[1], {"row": 1, "state": SEARCHED, "upc": "123"})
+        # Offsets are adjusted for the batch's files.
+        self.assertEqual(entries[2]["offsets"], {"oclc": 16, "orig": 0})
+        # Shard files are removed once merged.
+        self.assertEqual(
+            sorted(os.listdir()), ["batch.log", "batch_journal.jsonl", "batch_oclc.mrc"]
+        )
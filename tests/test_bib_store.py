@@ -0,0 +1,106 @@
+import tempfile
+import unittest
+from pathlib import Path
+from bib_store import BibStore
+from pymarc import MARCReader
+from searchers.cache import ResponseCache
+from searchers.worldcat import WorldcatClient
+
+
+def get_sample_record():
+    with open("tests/sample_data/1011080915.mrc", "rb") as f:
+        return next(MARCReader(f))
+
+
+class TestBibStore(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = str(Path(self.temp_dir.name, "bibs.sqlite3"))
+        self.bib_store = BibStore(self.path)
+
+    def tearDown(self):
+        self.bib_store.close()
+        self.temp_dir.cleanup()
+
+    def test_lookup_by_normalized_number(self):
+        self.bib_store.put_many({"1011080915": get_sample_record()})
+        records = self.bib_store.get_many(["on1011080915", "123"])
+        self.assertEqual(list(records), ["on1011080915"])
+        self.assertEqual(records["on1011080915"].title, "Pretty hate machine /")
+
+    def test_record_stored_under_its_own_number(self):
+        # Requested by a merged number; the 001 has the current number.
+        self.bib_store.put_many({"123": get_sample_record()})
+        records = self.bib_store.get_many(["123", "1011080915"])
+        self.assertEqual(len(records), 2)
+        self.assertEqual(self.bib_store.stats()["records"], 1)
+
+    def test_records_persist(self):
+        self.bib_store.put_many({"1011080915": get_sample_record()})
+        self.bib_store.close()
+        self.bib_store = BibStore(self.path)
+        self.assertEqual(len(self.bib_store.get_many(["1011080915"])), 1)
+
+    def test_old_records_are_ignored(self):
+        self.bib_store.close()
+        self.bib_store = BibStore(self.path, max_age=0)
+        self.bib_store.put_many({"1011080915": get_sample_record()})
+        self.assertEqual(self.bib_store.get_many(["1011080915"]), {})
+        self.bib_store.prune()
+        self.assertEqual(self.bib_store.stats()["records"], 0)
+
+
+class CountingXmlWorldcatClient(WorldcatClient):
+    """Return sample MARC XML instead of calling Worldcat, counting requests."""
+
+    requested_numbers = []
+
+    def get_xml(self, oclc_number: str) -> bytes:
+        self.requested_numbers.append(oclc_number)
+        with open("tests/sample_data/1011080915.xml", "rb") as f:
+            return f.read()
+
+
+class TestGetRecordsWithBibStore(unittest.TestCase):
+    def test_stored_records_are_not_retrieved(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            bib_store = BibStore(str(Path(temp_dir, "bibs.sqlite3")))
+            client = CountingXmlWorldcatClient(
+                "fake_client_id", "fake_client_secret", bib_store=bib_store
+            )
+            client.requested_numbers = []
+            client.get_records(["1011080915"])
+            records = client.get_records(["123", "1011080915"])
+            bib_store.close()
+        self.assertEqual(client.requested_numbers, ["1011080915", "123"])
+        self.assertEqual(
+            [record.title for record in records], ["Pretty hate machine /"] * 2
+        )
+
+
+class FakeSessionXmlWorldcatClient(WorldcatClient):
+    """Return sample XML instead of retrieving it from Worldcat."""
+
+    def _get_xml(self, oclc_number: str) -> bytes:
+        with open("tests/sample_data/1011080915.xml", "rb") as f:
+            return f.read()
+
+
+class TestBibStoreWithCache(unittest.TestCase):
+    def test_stored_records_are_not_cached(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            bib_store = BibStore(str(Path(temp_dir, "bibs.sqlite3")))
+            cache = ResponseCache(str(Path(temp_dir, "cache.sqlite3")))
+            client = FakeSessionXmlWorldcatClient(
+                "fake_client_id",
+                "fake_client_secret",
+                cache=cache,
+                bib_store=bib_store,
+            )
+            client.get_candidates(["1011080915"])
+            found, _ = cache.get("worldcat", "bib", "1011080915")
+            stored = bib_store.get_many(["1011080915"])
+            cache.close()
+            bib_store.close()
+        self.assertFalse(found)
+        self.assertEqual(list(stored), ["1011080915"])
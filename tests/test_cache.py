@@ -0,0 +1,119 @@
+import tempfile
+import unittest
+from pathlib import Path
+from searchers.cache import ResponseCache, cached_call
+from searchers.worldcat import WorldcatClient
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = str(Path(self.temp_dir.name, "cache.sqlite3"))
+        self.cache = ResponseCache(self.path)
+
+    def tearDown(self):
+        self.cache.close()
+        self.temp_dir.cleanup()
+
+    def test_miss_then_hit(self):
+        calls = []
+        for _ in range(2):
+            value = cached_call(
+                self.cache, "discogs", "search", "123", lambda: calls.append(1) or [1]
+            )
+            self.assertEqual(value, [1])
+        self.assertEqual(len(calls), 1)
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+    def test_query_is_normalized(self):
+        self.cache.put("worldcat", "search", "sn: ABC  123", {"numberOfRecords": 1})
+        found, _ = self.cache.get("worldcat", "search", " sn: abc 123")
+        self.assertTrue(found)
+
+    def test_bytes_round_trip(self):
+        self.cache.put("worldcat", "bib", "1011080915", b"<record/>")
+        self.assertEqual(
+            self.cache.get("worldcat", "bib", "1011080915"), (True, b"<record/>")
+        )
+
+    def test_responses_persist(self):
+        self.cache.put("musicbrainz", "search", "barcode", [{"title": "X"}])
+        self.cache.close()
+        self.cache = ResponseCache(self.path)
+        self.assertEqual(
+            self.cache.get("musicbrainz", "search", "barcode"), (True, [{"title": "X"}])
+        )
+
+    def test_expired_responses_are_misses(self):
+        self.cache.close()
+        self.cache = ResponseCache(self.path, ttls={"discogs.search": 0})
+        self.cache.put("discogs", "search", "123", [1])
+        self.assertEqual(self.cache.get("discogs", "search", "123"), (False, None))
+
+    def test_empty_results_use_empty_ttl(self):
+        self.cache.close()
+        self.cache = ResponseCache(self.path, empty_ttl=0)
+        self.cache.put("worldcat", "search", "empty", {"numberOfRecords": 0})
+        self.cache.put("worldcat", "search", "full", {"numberOfRecords": 2})
+        self.assertFalse(self.cache.get("worldcat", "search", "empty")[0])
+        self.assertTrue(self.cache.get("worldcat", "search", "full")[0])
+
+    def test_least_recently_used_are_evicted(self):
+        self.cache.close()
+        self.cache = ResponseCache(self.path, max_entries=2)
+        self.cache.put("discogs", "release", 1, {"id": 1})
+        self.cache.put("discogs", "release", 2, {"id": 2})
+        # Use 1, so 2 is now the least recently used.
+        self.cache.get("discogs", "release", 1)
+        self.cache.put("discogs", "release", 3, {"id": 3})
+        self.assertTrue(self.cache.get("discogs", "release", 1)[0])
+        self.assertFalse(self.cache.get("discogs", "release", 2)[0])
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+
+class FakeHoldingsSession:
+    """Record holdings requests, reporting every number as held."""
+
+    def __init__(self):
+        self.requests = []
+
+    def holdings_get_current(self, oclc_numbers):
+        self.requests.append(oclc_numbers)
+        return FakeResponse(
+            {
+                "holdings": [
+                    {"requestedControlNumber": number, "holdingSet": True}
+                    for number in oclc_numbers
+                ]
+            }
+        )
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+class FakeSessionWorldcatClient(WorldcatClient):
+    """Use a fake session instead of calling Worldcat."""
+
+    @property
+    def session(self):
+        return self._fake_session
+
+
+class TestCachedHoldings(unittest.TestCase):
+    def test_only_uncached_holdings_are_requested(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = ResponseCache(str(Path(temp_dir, "cache.sqlite3")))
+            client = FakeSessionWorldcatClient("fake_id", "fake_secret", cache=cache)
+            client._fake_session = FakeHoldingsSession()
+            client.holdings_for(["1", "2"])
+            holdings = client.holdings_for(["1", "2", "3"])
+            cache.close()
+        self.assertEqual(holdings, {"1": True, "2": True, "3": True})
+        self.assertEqual(client._fake_session.requests, [["1", "2"], ["3"]])
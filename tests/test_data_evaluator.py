@@ -1,19 +1,33 @@
+import asyncio
+import copy
+import json
+import random
 import unittest
+import unittest.mock
 
-from pymarc import Field, MARCReader, Record
+from pymarc import Field, MARCReader, Record, Subfield
 from data_evaluator import (
+    any_record_has_clu_async,
     cataloging_language_is_ok,
+    check_clu_holdings,
     form_of_item_is_ok,
     get_encoding_level_score,
+    get_fallback_search_terms,
     get_oclc_number,
+    get_title_similarity_score,
+    get_upc_variants,
     normalize,
     normalize_oclc_number,
     normalize_title,
     record_is_usable,
     record_type_is_ok,
     strip_punctuation,
+    title_is_close_enough,
+    triage_brief_records,
 )
 from create_marc_record import create_base_record
+from searchers.aio import AsyncWorldcatClient
+from searchers.worldcat import WorldcatCandidate
 
 
 class NormalizationTests(unittest.TestCase):
@@ -46,6 +60,28 @@ class NormalizationTests(unittest.TestCase):
         normalized_input = normalize_oclc_number(input)
         self.assertEqual(normalized_input, "12345")
 
+    def test_get_upc_variants(self):
+        self.assertEqual(get_upc_variants("602527567730"), ["0602527567730"])
+        self.assertEqual(get_upc_variants("0602527567730"), ["602527567730"])
+        self.assertEqual(
+            get_upc_variants("093624748625"),
+            ["0093624748625", "93624748625"],
+        )
+        self.assertEqual(get_upc_variants("D111089"), [])
+        self.assertEqual(get_upc_variants(""), [])
+
+    def test_get_fallback_search_terms(self):
+        self.assertEqual(
+            get_fallback_search_terms("602527567730", {"B002", "A001"}),
+            {"mn": ["A001", "B002"], "sn": ["0602527567730"]},
+        )
+
+    def test_get_fallback_search_terms_without_publisher_numbers(self):
+        self.assertEqual(
+            get_fallback_search_terms("602527567730", {"", " ", "A001 "}),
+            {"mn": ["A001"], "sn": ["0602527567730"]},
+        )
+
 
 class RecordQualityTests(unittest.TestCase):
     def get_base_record(self) -> Record:
@@ -62,7 +98,7 @@ class RecordQualityTests(unittest.TestCase):
         # change it to an unacceptable value.
         # Type (Leader/06) - a (Language material, like a book)
         base_record.leader.type_of_record = "a"
-        self.assertFalse(record_type_is_ok(base_record))
+        self.assertFalse(record_type_is_ok(WorldcatCandidate.from_record(base_record)))
 
     def test_form_of_item_is_ok(self):
         base_record = self.get_base_record()
@@ -71,7 +107,7 @@ class RecordQualityTests(unittest.TestCase):
         fld008 = base_record.get("008")
         # Hacky since Python doesn't have targeted index string replacement...
         fld008.data = fld008.data[0:23] + "o" + fld008.data[24:]
-        self.assertFalse(form_of_item_is_ok(base_record))
+        self.assertFalse(form_of_item_is_ok(WorldcatCandidate.from_record(base_record)))
 
     def test_cataloging_language_is_ok(self):
         base_record = self.get_base_record()
@@ -79,19 +115,141 @@ class RecordQualityTests(unittest.TestCase):
         # Change it to an unacceptable value: 040 $b = "fre" (French)
         fld040 = base_record.get("040")
         fld040["b"] = "fre"
-        self.assertFalse(cataloging_language_is_ok(base_record))
+        self.assertFalse(
+            cataloging_language_is_ok(WorldcatCandidate.from_record(base_record))
+        )
 
     def test_get_encoding_level_score(self):
         base_record = self.get_base_record()
         # Default encoding level is "3" (lowest score of 0)
-        self.assertEqual(get_encoding_level_score(base_record), 0)
+        self.assertEqual(
+            get_encoding_level_score(WorldcatCandidate.from_record(base_record)), 0
+        )
         # Change it to blank, which scores 8
         base_record.leader.encoding_level = " "
-        self.assertEqual(get_encoding_level_score(base_record), 8)
+        self.assertEqual(
+            get_encoding_level_score(WorldcatCandidate.from_record(base_record)), 8
+        )
         # Change it to unacceptable "z", which scores -1
         base_record.leader.encoding_level = "z"
-        self.assertEqual(get_encoding_level_score(base_record), -1)
+        self.assertEqual(
+            get_encoding_level_score(WorldcatCandidate.from_record(base_record)), -1
+        )
 
     def test_record_is_usable(self):
         base_record = self.get_base_record()
-        self.assertTrue(record_is_usable(base_record))
+        self.assertTrue(record_is_usable(WorldcatCandidate.from_record(base_record)))
+
+
+class HoldingsTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open("tests/sample_data/1011080915.mrc", "rb") as marc:
+            reader = MARCReader(marc)
+            cls.candidate = WorldcatCandidate.from_record(reader.__next__())
+
+    def test_check_clu_holdings_held(self):
+        holdings = {"1011080915": True}
+        self.assertTrue(check_clu_holdings([self.candidate], holdings))
+
+    def test_check_clu_holdings_not_held(self):
+        holdings = {"1011080915": False}
+        self.assertFalse(check_clu_holdings([self.candidate], holdings))
+
+    def test_check_clu_holdings_missing(self):
+        # Records without holdings data are treated as not held.
+        self.assertFalse(check_clu_holdings([self.candidate], {}))
+
+    def test_any_record_has_clu(self):
+        client = unittest.mock.Mock()
+        client.holdings_for.return_value = {"1011080915": True}
+        with self.assertLogs(level="INFO"):
+            has_clu = asyncio.run(
+                any_record_has_clu_async(AsyncWorldcatClient(client), [self.candidate])
+            )
+        self.assertTrue(has_clu)
+        client.holdings_for.assert_called_once_with(["1011080915"])
+
+
+class TitleComparisonTests(unittest.TestCase):
+    def get_record(self, title_a: str, title_p: str) -> Record:
+        record = create_base_record()
+        record.add_field(Field(tag="001", data="fake_oclc_number"))
+        subfields = [Subfield("a", title_a)]
+        if title_p:
+            subfields.append(Subfield("p", title_p))
+        record.add_field(Field(tag="245", indicators=["1", "0"], subfields=subfields))
+        return record
+
+    def get_expected_decision(self, record: Record, titles: list) -> bool:
+        # Score every title, as title_is_close_enough did before pruning.
+        full_title = " ".join(record["245"].get_subfields("a", "n", "p", "b"))
+        short_title = record["245"]["a"]
+        total_score = 0.0
+        for title in titles:
+            score = get_title_similarity_score(full_title, title)
+            if score < 0.4 and short_title != full_title:
+                score = get_title_similarity_score(short_title, title)
+            total_score += score
+        return not titles or total_score / len(titles) >= 0.37
+
+    def test_title_is_close_enough(self):
+        record = self.get_record("Symphonies", "No. 4 in B flat major")
+        self.assertTrue(
+            title_is_close_enough(
+                WorldcatCandidate.from_record(record),
+                {"Symphonies no. 4", "Symphonies"},
+            )
+        )
+        candidate = WorldcatCandidate.from_record(record)
+        self.assertFalse(title_is_close_enough(candidate, {"Greatest hits of 1985"}))
+        self.assertTrue(title_is_close_enough(candidate, set()))
+
+    def test_pruning_keeps_decisions(self):
+        rng = random.Random(17)
+        words = ["Symphony", "No.", "4", "Walküre", "Act", "I", "live", "Goldberg"]
+        for _ in range(500):
+            title_a = " ".join(rng.choices(words, k=rng.randint(1, 4)))
+            title_p = " ".join(rng.choices(words, k=rng.randint(0, 6)))
+            record = self.get_record(title_a, title_p)
+            titles = [
+                " ".join(rng.choices(words, k=rng.randint(1, 10)))
+                for _ in range(rng.randint(0, 6))
+            ]
+            self.assertEqual(
+                title_is_close_enough(WorldcatCandidate.from_record(record), titles),
+                self.get_expected_decision(record, titles),
+                (title_a, title_p, titles),
+            )
+
+
+class TriageTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open("tests/sample_data/worldcat_search_results.data") as f:
+            cls.data = json.load(f)
+
+    def get_brief_records(self, upc: str) -> list[dict]:
+        # Some tests change the data.
+        return copy.deepcopy(self.data[upc]["briefRecords"])
+
+    def test_ordered_by_encoding_level(self):
+        brief_records = self.get_brief_records("602527567730")
+        brief_records.reverse()
+        # Level M (worse) first, then blank (full level), each in original order.
+        self.assertEqual(
+            triage_brief_records(brief_records),
+            ["690162569", "676780755", "1011080915", "1257975710", "727128304"],
+        )
+
+    def test_unusable_records_rejected(self):
+        brief_records = self.get_brief_records("602527567730")
+        brief_records[0]["generalFormat"] = "MsScr"
+        brief_records[1]["specificFormat"] = "Digital"
+        brief_records[2]["catalogingInfo"]["catalogingLanguage"] = "fre"
+        # Missing data isn't a reason to reject, but missing level sorts last.
+        del brief_records[3]["catalogingInfo"]
+        with self.assertLogs(level="INFO") as logs:
+            oclc_numbers = triage_brief_records(brief_records)
+        self.assertEqual(oclc_numbers, ["1011080915", "1257975710"])
+        self.assertEqual(len(logs.output), 3)
@@ -0,0 +1,84 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from journal import (
+    DECIDED,
+    SEARCHED,
+    BatchJournal,
+    JournalMismatchError,
+    read_entries,
+)
+
+
+class TestBatchJournal(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.journal_filename = str(Path(self.temp_dir.name, "batch_journal.jsonl"))
+        self.marc_filenames = {
+            "oclc": str(Path(self.temp_dir.name, "batch_oclc.mrc")),
+            "orig": str(Path(self.temp_dir.name, "batch_orig.mrc")),
+        }
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write_row(self, journal, idx, file_type, data):
+        journal.record(idx, SEARCHED, upc="123")
+        journal.record(idx, DECIDED, file_type=file_type)
+        if file_type:
+            with open(self.marc_filenames[file_type], "ab") as f:
+                f.write(data)
+        offsets = {
+            output_type: os.path.getsize(filename) if os.path.exists(filename) else 0
+            for output_type, filename in self.marc_filenames.items()
+        }
+        journal.commit_rows([(idx, file_type, offsets)])
+
+    def test_rows_are_journaled(self):
+        journal = BatchJournal(self.journal_filename, self.marc_filenames)
+        self.write_row(journal, 0, "oclc", b"record 0")
+        self.write_row(journal, 1, None, b"")
+        journal.close()
+        written = [e for e in read_entries(self.journal_filename) if e["row"] == 0]
+        self.assertEqual(
+            [entry["state"] for entry in written], ["searched", "decided", "written"]
+        )
+        self.assertEqual(written[-1]["offsets"], {"oclc": 8, "orig": 0})
+
+    def test_recover_removes_incomplete_output(self):
+        journal = BatchJournal(self.journal_filename, self.marc_filenames)
+        self.write_row(journal, 0, "oclc", b"record 0")
+        self.write_row(journal, 1, "orig", b"record 1")
+        # Simulate a crash part way through writing row 2.
+        with open(self.marc_filenames["oclc"], "ab") as f:
+            f.write(b"rec")
+        journal.close()
+
+        journal = BatchJournal(self.journal_filename, self.marc_filenames)
+        completed_rows = journal.recover()
+        journal.close()
+        self.assertEqual(completed_rows, {0, 1})
+        self.assertEqual(os.path.getsize(self.marc_filenames["oclc"]), 8)
+        self.assertEqual(os.path.getsize(self.marc_filenames["orig"]), 8)
+
+    def test_partial_entry_is_ignored(self):
+        journal = BatchJournal(self.journal_filename, self.marc_filenames)
+        self.write_row(journal, 0, "oclc", b"record 0")
+        journal.close()
+        with open(self.journal_filename, "a") as f:
+            f.write('{"row": 1, "sta')
+
+        journal = BatchJournal(self.journal_filename, self.marc_filenames)
+        self.assertEqual(journal.recover(), {0})
+        journal.record(1, SEARCHED)
+        journal.close()
+        self.assertEqual(len(read_entries(self.journal_filename)), 4)
+
+    def test_recover_with_missing_output(self):
+        journal = BatchJournal(self.journal_filename, self.marc_filenames)
+        self.write_row(journal, 0, "oclc", b"record 0")
+        os.remove(self.marc_filenames["oclc"])
+        with self.assertRaises(JournalMismatchError):
+            journal.recover()
+        journal.close()
@@ -1,6 +1,9 @@
 from datetime import datetime
+import os
+import tempfile
 import unittest
 import json
+from pathlib import Path
 
 from pymarc import MARCReader, Subfield, Record
 from create_marc_record import (
@@ -10,7 +13,10 @@ from create_marc_record import (
     add_discogs_data,
     add_musicbrainz_data,
     get_yymmdd,
+    BackgroundMarcWriter,
+    MarcOutputManager,
 )
+from journal import BatchJournal, read_entries
 
 
 class TestBaseRecord(unittest.TestCase):
@@ -406,3 +412,98 @@ class TestMusicBrainzFields(unittest.TestCase):
     def test_field_966_does_not_exist(self):
         fld966 = self.record.get("966")
         self.assertIsNone(fld966)
+
+
+class TestMarcOutputManager(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.filenames = {
+            "oclc": str(Path(self.temp_dir.name, "batch_oclc.mrc")),
+            "orig": str(Path(self.temp_dir.name, "batch_orig.mrc")),
+        }
+        with open("tests/sample_data/1011080915.mrc", "rb") as f:
+            self.record = next(MARCReader(f))
+        self.record_size = len(self.record.as_marc21())
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_records_are_buffered_until_flushed(self):
+        output = MarcOutputManager(self.filenames, flush_records=2, flush_interval=60)
+        output.write_row(0, self.record, "oclc")
+        self.assertEqual(os.path.getsize(self.filenames["oclc"]), 0)
+        output.write_row(1, self.record, "oclc")
+        self.assertEqual(os.path.getsize(self.filenames["oclc"]), 2 * self.record_size)
+        output.close()
+        # No record was written to this file, so it was never created.
+        self.assertFalse(os.path.exists(self.filenames["orig"]))
+
+    def test_close_flushes_and_commits_rows(self):
+        journal_filename = str(Path(self.temp_dir.name, "batch_journal.jsonl"))
+        journal = BatchJournal(journal_filename, self.filenames)
+        with MarcOutputManager(self.filenames, journal, flush_records=100) as output:
+            output.write_row(0, self.record, "orig")
+            output.write_row(1, None, None)
+            output.write_row(2, self.record, "oclc")
+        journal.close()
+        with open(self.filenames["orig"], "rb") as f:
+            self.assertEqual(len(list(MARCReader(f))), 1)
+        entries = read_entries(journal_filename)
+        self.assertEqual([entry["row"] for entry in entries], [0, 1, 2])
+        self.assertEqual(
+            entries[2]["offsets"],
+            {"oclc": self.record_size, "orig": self.record_size},
+        )
+
+
+class FailingOutputManager(MarcOutputManager):
+    """Simulate a full disk."""
+
+    def add_row(self, idx, record, file_type):
+        raise OSError("No space left on device")
+
+
+class TestBackgroundMarcWriter(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.filenames = {"oclc": str(Path(self.temp_dir.name, "batch_oclc.mrc"))}
+        with open("tests/sample_data/1011080915.mrc", "rb") as f:
+            self.record = next(MARCReader(f))
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_rows_are_written_in_order(self):
+        journal_filename = str(Path(self.temp_dir.name, "batch_journal.jsonl"))
+        journal = BatchJournal(journal_filename, self.filenames)
+        with MarcOutputManager(self.filenames, journal, flush_records=3) as output:
+            with BackgroundMarcWriter(output, max_queue_size=2) as writer:
+                for idx in range(10):
+                    writer.write_row(idx, self.record, "oclc")
+        journal.close()
+        entries = read_entries(journal_filename)
+        self.assertEqual([entry["row"] for entry in entries], list(range(10)))
+        self.assertEqual(writer.stats()["rows"], 10)
+        self.assertLessEqual(writer.stats()["max_queue_depth"], 2)
+        with open(self.filenames["oclc"], "rb") as f:
+            self.assertEqual(len(list(MARCReader(f))), 10)
+
+    def test_errors_are_raised(self):
+        output = FailingOutputManager(self.filenames)
+        writer = BackgroundMarcWriter(output)
+        writer.write_row(0, self.record, "oclc")
+        with self.assertRaises(RuntimeError):
+            writer.close()
+
+    def test_thread_errors_are_raised(self):
+        # An invalid interval fails outside of writing any one row.
+        output = MarcOutputManager(self.filenames, flush_interval=-1)
+        writer = BackgroundMarcWriter(output, max_queue_size=1)
+        # Rows are discarded rather than left in the queue, so this doesn't hang.
+        try:
+            for idx in range(5):
+                writer.write_row(idx, self.record, "oclc")
+        except RuntimeError:
+            pass
+        with self.assertRaises(RuntimeError):
+            writer.close()
@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+import unittest
+from csv import DictReader
+from pathlib import Path
+from music_data import MusicDataFile, MusicDataRow
+
+
+class TestMusicDataFile(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.filepath = str(Path(self.temp_dir.name, "batch_016_sample.tsv"))
+        self.index_filepath = f"{self.filepath}.idx"
+        shutil.copy("tests/sample_data/batch_016_sample.tsv", self.filepath)
+        with open(self.filepath) as f:
+            self.dicts = list(DictReader(f, delimiter="\t"))
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def get_expected_row(self, idx: int) -> MusicDataRow:
+        row = self.dicts[idx]
+        return MusicDataRow(
+            row["UPC"], row["call number"], row["barcode"], row["title"]
+        )
+
+    def test_all_rows_match_dict_reader(self):
+        music_data = MusicDataFile(self.filepath, self.index_filepath)
+        rows = list(music_data.iter_rows(music_data.row_range()))
+        self.assertEqual(len(music_data), len(self.dicts))
+        self.assertEqual(rows, [self.get_expected_row(i) for i in range(len(rows))])
+
+    def test_rows_from_middle(self):
+        music_data = MusicDataFile(self.filepath, self.index_filepath)
+        rows = list(music_data.iter_rows(music_data.row_range(3, 5)))
+        self.assertEqual(rows, [self.get_expected_row(3), self.get_expected_row(4)])
+
+    def test_range_like_slice(self):
+        music_data = MusicDataFile(self.filepath, self.index_filepath)
+        self.assertEqual(music_data.row_range(-2), range(8, 10))
+        self.assertEqual(music_data.row_range(20), range(10, 10))
+
+    def test_index_in_current_directory(self):
+        current_directory = os.getcwd()
+        output_directory = Path(self.temp_dir.name, "output")
+        output_directory.mkdir()
+        os.chdir(output_directory)
+        try:
+            music_data = MusicDataFile(self.filepath)
+            self.assertEqual(music_data.index_filepath, "batch_016_sample.tsv.idx")
+            self.assertTrue(Path(output_directory, music_data.index_filepath).exists())
+        finally:
+            os.chdir(current_directory)
+
+    def test_index_is_reused(self):
+        MusicDataFile(self.filepath, self.index_filepath)
+        index_mtime = os.stat(self.index_filepath).st_mtime_ns
+        MusicDataFile(self.filepath, self.index_filepath)
+        self.assertEqual(os.stat(self.index_filepath).st_mtime_ns, index_mtime)
+
+    def test_index_is_rebuilt_when_file_changes(self):
+        music_data = MusicDataFile(self.filepath, self.index_filepath)
+        with open(self.filepath, "a", newline="") as f:
+            f.write("\r\n123\tCDA 1\tL01\tNew title\t\r\n")
+        music_data = MusicDataFile(self.filepath, self.index_filepath)
+        self.assertEqual(len(music_data), len(self.dicts) + 1)
+        rows = list(music_data.iter_rows(music_data.row_range(-1)))
+        self.assertEqual(rows, [MusicDataRow("123", "CDA 1", "L01", "New title")])
@@ -0,0 +1,46 @@
+import time
+import unittest
+from searchers.rate_limiter import DiscogsRateLimiter, RateLimiter
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_requests_are_spaced(self):
+        # 50 requests per second: 5 requests need at least 4 intervals of 0.02 seconds.
+        rate_limiter = RateLimiter(50)
+        start = time.monotonic()
+        for _ in range(5):
+            rate_limiter.wait()
+        elapsed = time.monotonic() - start
+        self.assertGreaterEqual(elapsed, 0.08)
+
+    def test_first_request_does_not_wait(self):
+        rate_limiter = RateLimiter(0.1)
+        start = time.monotonic()
+        rate_limiter.wait()
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_invalid_rate(self):
+        with self.assertRaises(ValueError):
+            RateLimiter(0)
+
+
+class TestDiscogsRateLimiter(unittest.TestCase):
+    def test_full_rate_when_plenty_remaining(self):
+        rate_limiter = DiscogsRateLimiter(10)
+        rate_limiter.update_from_headers(rate_limit="60", remaining="55")
+        self.assertAlmostEqual(rate_limiter.requests_per_second, 1.0)
+
+    def test_slows_down_when_few_remaining(self):
+        rate_limiter = DiscogsRateLimiter(10)
+        rate_limiter.update_from_headers(rate_limit="60", remaining="6")
+        self.assertAlmostEqual(rate_limiter.requests_per_second, 0.1)
+
+    def test_never_exceeds_configured_rate(self):
+        rate_limiter = DiscogsRateLimiter(0.5)
+        rate_limiter.update_from_headers(rate_limit="60", remaining="60")
+        self.assertAlmostEqual(rate_limiter.requests_per_second, 0.5)
+
+    def test_missing_headers_are_ignored(self):
+        rate_limiter = DiscogsRateLimiter(0.5)
+        rate_limiter.update_from_headers(rate_limit=None, remaining=None)
+        self.assertAlmostEqual(rate_limiter.requests_per_second, 0.5)
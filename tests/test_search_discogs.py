@@ -1,6 +1,9 @@
-from searchers.discogs import DiscogsClient
+from discogs_client import Client
+from searchers.discogs import DiscogsClient, barcode_matches
+from urllib.parse import parse_qs, urlparse
 import json
 import unittest
+import unittest.mock
 
 
 class TestSearchDiscogs(unittest.TestCase):
@@ -22,7 +25,96 @@ class TestSearchDiscogs(unittest.TestCase):
         self.assertEqual(result[0]["publisher_number"], "7 72600-2")
         self.assertEqual(result[0]["full_json"], self.data)
 
+    def test_parse_discogs_search_result(self):
+        search_result = {
+            "id": 1234,
+            "title": "They Might Be Giants - Lincoln",
+            "catno": "7 72600-2",
+            "barcode": ["0 18777-26002 2"],
+        }
+        result = self.discogs_client.parse_data([search_result])
+        self.assertEqual(result[0]["id"], 1234)
+        self.assertEqual(result[0]["title"], "Lincoln")
+        self.assertEqual(result[0]["artist"], "They Might Be Giants")
+        self.assertEqual(result[0]["publisher_number"], "7 72600-2")
+        self.assertIsNone(result[0]["full_json"])
+
     def test_parse_discogs_data_no_result(self):
         # get_full_discogs_releases returns an empty list if no results
         result = self.discogs_client.parse_data([])
         self.assertEqual(result, [])
+
+
+class FakeReleaseDiscogsClient(DiscogsClient):
+    """Return fake release data instead of calling Discogs."""
+
+    def get_full_release(self, release_id: int) -> dict | None:
+        # Simulate Discogs "Release not found" for negative ids.
+        if release_id < 0:
+            return None
+        return {"id": release_id}
+
+
+class TestFullDataDiscogs(unittest.TestCase):
+    def test_get_full_data_skips_missing(self):
+        discogs_client = FakeReleaseDiscogsClient(user_token="fake_token")
+        # Only full_json is None matters here; other data comes from the release.
+        data_list = [{"id": -1, "full_json": None}, {"id": 5, "full_json": None}]
+        with unittest.mock.patch.object(
+            discogs_client, "parse_data", lambda releases: releases
+        ):
+            self.assertEqual(discogs_client.get_full_data(data_list), {"id": 5})
+            self.assertIsNone(discogs_client.get_full_data(data_list[:1]))
+
+
+class FakeSearchDiscogsClient(DiscogsClient):
+    """Return pages of fake search results instead of calling Discogs:
+    250 results, only every other one with the barcode searched for.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.urls = []
+        self._client = Client(self._user_agent, user_token=self._token)
+        self._client._get = self.get_page
+
+    def get_page(self, url: str) -> dict:
+        self.urls.append(url)
+        params = parse_qs(urlparse(url).query)
+        page, per_page = int(params["page"][0]), int(params["per_page"][0])
+        ids = range((page - 1) * per_page, min(page * per_page, 250))
+        return {
+            "pagination": {"pages": -(-250 // per_page), "items": 250},
+            "results": [
+                {
+                    "type": "release",
+                    "id": id,
+                    "barcode": [
+                        "0 18777-26002 2" if id % 2 == 0 else "0 18777-26003 9",
+                        "LC 1234",
+                    ],
+                }
+                for id in ids
+            ],
+        }
+
+
+class TestSearchIdsDiscogs(unittest.TestCase):
+    def test_get_ids_by_upc_stops_at_cap(self):
+        discogs_client = FakeSearchDiscogsClient(
+            user_token="fake_token", max_search_results=150
+        )
+        release_ids = discogs_client.get_ids_by_upc("018777260022")
+        self.assertEqual(release_ids, list(range(0, 150, 2)))
+        # Only the pages needed for the first 150 results are requested.
+        self.assertEqual(len(discogs_client.urls), 2)
+        params = parse_qs(urlparse(discogs_client.urls[0]).query)
+        self.assertEqual(params["barcode"], ["018777260022"])
+        self.assertEqual(params["per_page"], ["100"])
+        self.assertNotIn("q", params)
+
+    def test_barcode_matches(self):
+        self.assertTrue(barcode_matches("018777260022", ["0 18777-26002 2"]))
+        self.assertTrue(barcode_matches("18777260022", ["LC 1234", "018777260022"]))
+        self.assertFalse(barcode_matches("018777260022", ["LC 1234"]))
+        self.assertFalse(barcode_matches("018777260022", []))
@@ -1,6 +1,7 @@
-from searchers.musicbrainz import MusicbrainzClient
+from searchers.musicbrainz import MusicbrainzClient, split_releases
 import json
 import unittest
+import unittest.mock
 
 
 class TestSearchMusicbrainz(unittest.TestCase):
@@ -40,3 +41,79 @@ class TestSearchMusicbrainz(unittest.TestCase):
         self.assertEqual(result[4]["title"], "Flood")
         self.assertEqual(result[4]["artist"], "They Might Be Giants")
         self.assertEqual(result[4]["publisher_number"], "E2 60907")
+
+
+class FakeMusicbrainzClient(MusicbrainzClient):
+    """Return sample releases instead of calling MusicBrainz."""
+
+    def __init__(self, data: dict) -> None:
+        super().__init__()
+        self.data = data
+        self.queries = []
+
+    def search_releases(
+        self, query: str, limit: int | None = None, offset: int = 0
+    ) -> dict:
+        self.queries.append((query, offset))
+        releases = [
+            release
+            for upc, upc_releases in self.data.items()
+            if f'"{upc}"' in query
+            for release in upc_releases
+        ]
+        end = len(releases) if limit is None else offset + limit
+        return {"release-list": releases[offset:end], "release-count": len(releases)}
+
+
+class TestSearchByUpcs(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open("tests/sample_data/musicbrainz_samples.data") as f:
+            cls.data = json.load(f)
+
+    def setUp(self):
+        self.musicbrainz_client = FakeMusicbrainzClient(self.data)
+
+    def test_search_by_upcs_splits_results(self):
+        upcs = ["075596090728", "018777260022", "ZZZZZZZZZZZZZ"]
+        # Return two releases per page, to exercise paging.
+        with unittest.mock.patch("searchers.musicbrainz.SEARCH_LIMIT", 2):
+            results = self.musicbrainz_client.search_by_upcs(upcs)
+        self.assertEqual(results, {upc: self.data[upc] for upc in upcs})
+        # One query, with one request per page of results.
+        self.assertEqual(
+            {query for query, _ in self.musicbrainz_client.queries},
+            {
+                'barcode:("075596090728" OR "018777260022" OR "ZZZZZZZZZZZZZ")'
+                ' AND format:"CD"'
+            },
+        )
+        self.assertEqual(len(self.musicbrainz_client.queries), 3)
+
+    def test_search_by_upcs_falls_back_to_single_searches(self):
+        # Sample release without a barcode can't be assigned to a UPC.
+        self.musicbrainz_client.data = {
+            "018777260022": [{"title": "Lincoln"}],
+            "020282009621": self.data["020282009621"],
+        }
+        results = self.musicbrainz_client.search_by_upcs(
+            ["018777260022", "020282009621"]
+        )
+        self.assertEqual(results["018777260022"], [{"title": "Lincoln"}])
+        self.assertEqual(len(self.musicbrainz_client.queries), 3)
+
+    def test_search_by_upcs_falls_back_when_results_are_incomplete(self):
+        upcs = ["075596090728", "018777260022"]
+        # Fewer releases are retrieved than the query finds.
+        with unittest.mock.patch("searchers.musicbrainz.RESULTS_PER_UPC", 1):
+            results = self.musicbrainz_client.search_by_upcs(upcs)
+        self.assertEqual(results, {upc: self.data[upc] for upc in upcs})
+        self.assertEqual(len(self.musicbrainz_client.queries), 3)
+
+    def test_split_releases_by_normalized_barcode(self):
+        releases = [{"barcode": "0 18777-26002 2"}, {"barcode": "20282009621"}]
+        self.assertEqual(
+            split_releases(releases, ["018777260022", "020282009621"]),
+            {"018777260022": releases[:1], "020282009621": releases[1:]},
+        )
+        self.assertIsNone(split_releases(releases, ["018777260022", "123"]))
@@ -1,6 +1,18 @@
 import json
+import tempfile
 import unittest
-from searchers.worldcat import WorldcatClient
+import unittest.mock
+from io import BytesIO
+from pathlib import Path
+from data_evaluator import triage_brief_records
+from pymarc import MARCReader, parse_xml_to_array
+from searchers import worldcat
+from searchers.cache import ResponseCache
+from searchers.worldcat import (
+    WorldcatCandidate,
+    WorldcatClient,
+    normalize_standard_number,
+)
 
 
 class TestSearchWorldcat(unittest.TestCase):
@@ -26,6 +38,14 @@ class TestSearchWorldcat(unittest.TestCase):
         oclc_numbers = self.worldcat_client.get_oclc_numbers(response)
         self.assertEqual(len(oclc_numbers), 2)
 
+    def test_get_brief_records(self):
+        no_records = self.worldcat_client.get_brief_records(self.data["790168505522"])
+        self.assertEqual(no_records, [])
+        brief_records = self.worldcat_client.get_brief_records(
+            self.data["881626300329"]
+        )
+        self.assertEqual(brief_records[0]["generalFormat"], "Music")
+
 
 class TestMarcXmlConversion(unittest.TestCase):
     @classmethod
@@ -43,3 +63,296 @@ class TestMarcXmlConversion(unittest.TestCase):
         record = self.worldcat_client.convert_xml_to_marc(xml)
         # Basic access to MARC data via pymarc is enough
         self.assertEqual(record.title, "Pretty hate machine /")
+
+
+class TestWorldcatCandidate(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open("tests/sample_data/1011080915.xml", "rb") as f:
+            cls.xml = f.read()
+
+    def assert_same_data(self, candidate, expected):
+        for name in WorldcatCandidate.__slots__:
+            if not name.startswith("_"):
+                self.assertEqual(getattr(candidate, name), getattr(expected, name))
+
+    def test_candidate_from_xml(self):
+        candidate = WorldcatCandidate.from_xml(self.xml)
+        self.assertEqual(candidate.oclc_number, "1011080915")
+        self.assertEqual(candidate.title, "Pretty hate machine /")
+        self.assertEqual(candidate.record_type, "j")
+        self.assertEqual(candidate.cataloging_language, "eng")
+        # Full record isn't created until needed.
+        self.assertIsNone(candidate._record)
+        self.assertEqual(candidate.record.title, "Pretty hate machine /")
+
+    def test_xml_converts_like_pymarc(self):
+        record = parse_xml_to_array(BytesIO(self.xml))[0]
+        candidate = WorldcatCandidate.from_xml(self.xml)
+        self.assertEqual(candidate.as_marc21(), record.as_marc21())
+        self.assert_same_data(candidate, WorldcatCandidate.from_record(record))
+
+    def test_non_ascii_xml_converts_like_pymarc(self):
+        xml = """<?xml version="1.0" encoding="UTF-8"?>
+            <record xmlns="http://www.loc.gov/MARC21/slim">
+              <leader>00000cjm  2200000 i 4500</leader>
+              <controlfield tag="001">ocm00012345</controlfield>
+              <datafield tag="245" ind1="1">
+                <subfield code="a">Die Walküre.</subfield>
+                <subfield code="n">Erster Aufzug /</subfield>
+                <subfield code="c">Wagner.</subfield>
+              </datafield>
+            </record>""".encode()
+        record = parse_xml_to_array(BytesIO(xml))[0]
+        candidate = WorldcatCandidate.from_xml(xml)
+        self.assertEqual(candidate.as_marc21(), record.as_marc21())
+        self.assertEqual(candidate.oclc_number, "12345")
+        self.assertEqual(candidate.full_title, "Die Walküre. Erster Aufzug /")
+        self.assertEqual(candidate.short_title, "Die Walküre.")
+        self.assertIsNone(candidate.form_of_item)
+        self.assertFalse(candidate.has_040)
+
+    def test_candidate_from_marc(self):
+        with open("tests/sample_data/1011080915.mrc", "rb") as f:
+            marc = f.read()
+        record = next(MARCReader(BytesIO(marc)))
+        candidate = WorldcatCandidate.from_marc(marc)
+        self.assert_same_data(candidate, WorldcatCandidate.from_record(record))
+        self.assertEqual(candidate.record.as_marc21(), record.as_marc21())
+
+    def test_candidate_standard_numbers(self):
+        candidate = WorldcatCandidate.from_xml(self.xml)
+        self.assertEqual(candidate.standard_numbers, ["00602527567730", "602527567730"])
+        self.assertEqual(
+            {normalize_standard_number(n) for n in candidate.standard_numbers},
+            {"602527567730"},
+        )
+
+
+class FakeXmlWorldcatClient(WorldcatClient):
+    """Return sample MARC XML instead of calling Worldcat."""
+
+    def get_xml(self, oclc_number: str) -> bytes:
+        # Simulate a failed request for one specific number.
+        if oclc_number == "666":
+            raise ConnectionError("Simulated network failure")
+        with open("tests/sample_data/1011080915.xml", "rb") as f:
+            return f.read()
+
+
+class TestGetRecords(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Create client for testing; fake values, only for initialization
+        cls.worldcat_client = FakeXmlWorldcatClient(
+            "fake_client_id",
+            "fake_client_secret",
+        )
+
+    def test_get_records_concurrently(self):
+        records = self.worldcat_client.get_records(["1", "2", "3"], max_workers=3)
+        self.assertEqual(len(records), 3)
+        self.assertEqual(records[0].title, "Pretty hate machine /")
+
+    def test_get_candidates(self):
+        with self.assertLogs(level="WARNING"):
+            candidates = self.worldcat_client.get_candidates(["1", "666", "3"])
+        self.assertEqual([c.oclc_number for c in candidates], ["1011080915"] * 2)
+
+    def test_get_records_skips_failures(self):
+        with self.assertLogs(level="WARNING"):
+            records = self.worldcat_client.get_records(["1", "666", "3"])
+        self.assertEqual(len(records), 2)
+
+
+class FakeBatchWorldcatClient(WorldcatClient):
+    """Return brief records and full records (with the UPC given here in
+    each 024) instead of calling Worldcat.
+    """
+
+    # UPC in each fake record, keyed on OCLC number.
+    upcs = {"1": "602527567730", "2": "881626300329", "3": "881626300329"}
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.queries = []
+        self.retrieved = []
+        # Other brief record data, keyed on OCLC number.
+        self.brief_data = {}
+
+    def _search(
+        self, query: str, offset: int = 1, limit: int = worldcat.SEARCH_LIMIT
+    ) -> dict:
+        self.queries.append((query, offset))
+        oclc_numbers = [
+            number
+            for number, upc in self.upcs.items()
+            if f"sn:{upc}" in query or f"sn:0{upc}" in query
+        ]
+        page = oclc_numbers[offset - 1 : offset - 1 + limit]
+        return {
+            "numberOfRecords": len(oclc_numbers),
+            "briefRecords": [
+                {"oclcNumber": number, **self.brief_data.get(number, {})}
+                for number in page
+            ],
+        }
+
+    def get_xml(self, oclc_number: str) -> bytes:
+        self.retrieved.append(oclc_number)
+        with open("tests/sample_data/1011080915.xml", "rb") as f:
+            xml = f.read()
+        upc = self.upcs.get(oclc_number, "999999999999")
+        return xml.replace(b"602527567730", upc.encode())
+
+
+class TestSearchMany(unittest.TestCase):
+    def setUp(self):
+        # Create client for testing; fake values, only for initialization
+        self.worldcat_client = FakeBatchWorldcatClient(
+            "fake_client_id",
+            "fake_client_secret",
+        )
+
+    def get_oclc_numbers(self, results: dict) -> dict:
+        return {
+            term: self.worldcat_client.get_oclc_numbers(search_results)
+            for term, search_results in results.items()
+        }
+
+    def test_search_many_splits_results(self):
+        # Return one record per page, to exercise paging.
+        with unittest.mock.patch("searchers.worldcat.SEARCH_PAGE_SIZE", 1):
+            results = self.worldcat_client.search_many(
+                ["881626300329", "602527567730", "790168505522"], "sn"
+            )
+        self.assertEqual(
+            self.get_oclc_numbers(results),
+            {"881626300329": ["2", "3"], "602527567730": ["1"], "790168505522": []},
+        )
+        self.assertEqual(results["881626300329"]["numberOfRecords"], 2)
+        # One query, with one request per page of results.
+        self.assertEqual(
+            {query for query, _ in self.worldcat_client.queries},
+            {"sn:881626300329 OR sn:602527567730 OR sn:790168505522"},
+        )
+        self.assertEqual(len(self.worldcat_client.queries), 3)
+
+    def test_search_many_with_leading_zero(self):
+        results = self.worldcat_client.search_many(
+            ["0602527567730", "881626300329"], "sn"
+        )
+        self.assertEqual(
+            self.get_oclc_numbers(results),
+            {"0602527567730": ["1"], "881626300329": ["2", "3"]},
+        )
+
+    def test_search_many_falls_back_to_single_searches(self):
+        # Record 4 has a UPC which wasn't searched for, so can't be assigned.
+        self.worldcat_client.upcs = {"1": "602527567730", "4": "602527567730"}
+        with unittest.mock.patch.object(
+            self.worldcat_client,
+            "get_xml",
+            lambda n: FakeBatchWorldcatClient.get_xml(
+                self.worldcat_client, "5" if n == "4" else n
+            ),
+        ):
+            results = self.worldcat_client.search_many(
+                ["602527567730", "881626300329"], "sn"
+            )
+        self.assertEqual(
+            self.get_oclc_numbers(results),
+            {"602527567730": ["1", "4"], "881626300329": []},
+        )
+        self.assertEqual(
+            [query for query, _ in self.worldcat_client.queries],
+            [
+                "sn:602527567730 OR sn:881626300329",
+                "sn:602527567730",
+                "sn:881626300329",
+            ],
+        )
+
+    def test_search_many_triages_before_splitting(self):
+        self.worldcat_client.brief_data = {"2": {"generalFormat": "Book"}}
+        with self.assertLogs(level="INFO"):
+            results = self.worldcat_client.search_many(
+                ["881626300329", "602527567730"], "sn", triage_brief_records
+            )
+        self.assertEqual(
+            self.get_oclc_numbers(results),
+            {"881626300329": ["3"], "602527567730": ["1"]},
+        )
+        # Record 2 is rejected, so isn't retrieved.
+        self.assertEqual(sorted(self.worldcat_client.retrieved), ["1", "3"])
+
+    def test_search_many_caches_triaged_results_separately(self):
+        self.worldcat_client.brief_data = {"2": {"generalFormat": "Book"}}
+        with tempfile.TemporaryDirectory() as temp_dir:
+            self.worldcat_client.cache = ResponseCache(
+                str(Path(temp_dir, "cache.sqlite3"))
+            )
+            with self.assertLogs(level="INFO"):
+                self.worldcat_client.search_many(
+                    ["881626300329", "602527567730"], "sn", triage_brief_records
+                )
+            # A single search still finds the rejected record.
+            results = self.worldcat_client.search("881626300329", "sn")
+            self.assertEqual(self.worldcat_client.get_oclc_numbers(results), ["2", "3"])
+            # Triaged results are cached, though.
+            queries = len(self.worldcat_client.queries)
+            self.worldcat_client.search_many(
+                ["881626300329", "602527567730"], "sn", triage_brief_records
+            )
+            self.assertEqual(len(self.worldcat_client.queries), queries)
+            self.worldcat_client.cache.close()
+
+    def test_search_many_keeps_retrieved_records(self):
+        self.worldcat_client.search_many(["881626300329", "602527567730"], "sn")
+        self.assertEqual(sorted(self.worldcat_client.retrieved), ["1", "2", "3"])
+        candidates = self.worldcat_client.get_candidates(["2", "3"])
+        self.assertEqual(len(candidates), 2)
+        # Records retrieved to split the results aren't retrieved again.
+        self.assertEqual(len(self.worldcat_client.retrieved), 3)
+
+    def test_search_many_falls_back_when_results_are_incomplete(self):
+        # More records than are retrieved for two terms.
+        self.worldcat_client.upcs = {
+            str(number): "881626300329" for number in range(1, 22)
+        } | {"22": "602527567730"}
+        results = self.worldcat_client.search_many(
+            ["881626300329", "602527567730"], "sn"
+        )
+        self.assertEqual(len(results["881626300329"]["briefRecords"]), 10)
+        self.assertEqual(results["881626300329"]["numberOfRecords"], 21)
+        self.assertEqual(
+            [query for query, _ in self.worldcat_client.queries],
+            [
+                "sn:881626300329 OR sn:602527567730",
+                "sn:881626300329",
+                "sn:602527567730",
+            ],
+        )
+        self.assertEqual(self.worldcat_client.retrieved, [])
+
+    def test_search_many_single_term(self):
+        self.worldcat_client.search_many(["602527567730"], "sn")
+        self.assertEqual(self.worldcat_client.queries, [("sn:602527567730", 1)])
+
+    def test_search_any(self):
+        # Return one record per page, to exercise paging.
+        with unittest.mock.patch("searchers.worldcat.SEARCH_PAGE_SIZE", 1):
+            results = self.worldcat_client.search_any(
+                {"mn": ["ABC123"], "sn": ["881626300329", "0881626300329"]}
+            )
+        # Records found by more than one term are only included once.
+        self.assertEqual(self.worldcat_client.get_oclc_numbers(results), ["2", "3"])
+        self.assertEqual(
+            {query for query, _ in self.worldcat_client.queries},
+            {"mn:ABC123 OR sn:881626300329 OR sn:0881626300329"},
+        )
+
+    def test_search_any_no_terms(self):
+        results = self.worldcat_client.search_any({"mn": ["", " "], "sn": []})
+        self.assertEqual(self.worldcat_client.get_oclc_numbers(results), [])
+        self.assertEqual(self.worldcat_client.queries, [])
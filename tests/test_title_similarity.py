@@ -0,0 +1,47 @@
+import random
+import unittest
+from strsimpy import NormalizedLevenshtein
+from strsimpy.levenshtein import Levenshtein
+from title_similarity import levenshtein_distance, normalized_similarity, normalize
+
+
+class TestTitleSimilarity(unittest.TestCase):
+    def setUp(self):
+        self.titles = [
+            "",
+            "Symphonies nos. 4 & 7",
+            "Symphonie Nr. 4 B-Dur, op. 60 ; Symphonie Nr. 7 A-Dur, op. 92",
+            "Die Walküre. Erster Aufzug / Richard Wagner",
+            "Die Walkure",
+            "Goldberg variations, BWV 988 : aria mit verschiedenen Veränderungen",
+            "Goldberg-Variationen",
+            "Le nozze di Figaro. Atto secondo. Porgi amor",
+            "Noël",
+            "NOEL",
+        ]
+
+    def test_distance_matches_levenshtein(self):
+        levenshtein = Levenshtein()
+        rng = random.Random(16)
+        for _ in range(2000):
+            s0 = "".join(rng.choices("ABCD", k=rng.randint(0, 100)))
+            s1 = "".join(rng.choices("ABCD", k=rng.randint(0, 100)))
+            self.assertEqual(
+                levenshtein_distance(s0, s1), levenshtein.distance(s0, s1), (s0, s1)
+            )
+
+    def test_similarity_matches_strsimpy(self):
+        comparator = NormalizedLevenshtein()
+        for title_1 in self.titles:
+            for title_2 in self.titles:
+                s0, s1 = normalize(title_1), normalize(title_2)
+                # Exactly equal, not just close: scores are compared to thresholds.
+                self.assertEqual(
+                    normalized_similarity(s0, s1), comparator.similarity(s0, s1)
+                )
+
+    def test_long_strings(self):
+        # Longer than any machine word, to exercise big bit vectors.
+        s0 = "SYMPHONIE" * 30
+        s1 = "SYMFONIE" * 31
+        self.assertEqual(levenshtein_distance(s0, s1), Levenshtein().distance(s0, s1))
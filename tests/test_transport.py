@@ -0,0 +1,60 @@
+import gzip
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from searchers.transport import HttpTransport
+
+BODY = b"music-cd-batch " * 100
+
+
+class GzipHandler(BaseHTTPRequestHandler):
+    """Serve a fixed body, gzipped if the client asks for it,
+    with keep-alive connections."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        content = BODY
+        self.send_response(200)
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            content = gzip.compress(BODY)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        # Keep test output quiet.
+        pass
+
+
+class TestHttpTransport(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), GzipHandler)
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}/"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_connections_are_reused(self):
+        transport = HttpTransport()
+        for _ in range(3):
+            transport.get(self.url)
+        stats = transport.stats()
+        transport.close()
+        self.assertEqual(stats["requests"], 3)
+        self.assertEqual(stats["connections_opened"], 1)
+        self.assertEqual(stats["connections_reused"], 2)
+
+    def test_gzip_is_negotiated(self):
+        transport = HttpTransport()
+        response = transport.get(self.url)
+        stats = transport.stats()
+        transport.close()
+        self.assertEqual(response.content, BODY)
+        self.assertEqual(stats["bytes_decoded"], len(BODY))
+        self.assertLess(stats["bytes_received"], len(BODY))
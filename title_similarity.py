@@ -0,0 +1,120 @@
+"""Title normalization and similarity scoring, for comparing MARC titles
+with titles from Discogs, MusicBrainz and the music library's data.
+
+Scores are the same as strsimpy's NormalizedLevenshtein similarity on
+normalized titles, but computed much faster: normalization tables are built
+once, normalized titles and scores are memoized, and Levenshtein distance
+uses a bit-parallel algorithm instead of filling in the full table.
+"""
+
+import string
+from functools import lru_cache
+
+# Translation tables, built once instead of on every call.
+_REMOVE_PUNCTUATION = str.maketrans("", "", string.punctuation)
+_REMOVE_WHITESPACE = str.maketrans("", "", string.whitespace)
+
+# Maximum number of normalized strings and scores to remember.
+# Titles are compared repeatedly within a row, rarely across rows.
+CACHE_SIZE = 4096
+
+
+def strip_punctuation(input: str) -> str:
+    """Remove all punctuation from a string."""
+    return input.translate(_REMOVE_PUNCTUATION)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def normalize(input: str) -> str:
+    """Fully normalize a string for comparison with other strings.
+    Strip punctuation, remove spaces, and force to upper case.
+    """
+    new_string = input.translate(_REMOVE_WHITESPACE)
+    return strip_punctuation(new_string.upper())
+
+
+def levenshtein_distance(s0: str, s1: str) -> int:
+    """Return the Levenshtein (edit) distance between two strings.
+
+    Uses Myers' bit-parallel algorithm, as adapted for edit distance by Hyyrö:
+    each column of the dynamic programming table is held as bit vectors in
+    Python ints, so the shorter string can be any length.
+    """
+    if s0 == s1:
+        return 0
+    # Use the shorter string as the pattern, to keep the bit vectors small.
+    if len(s0) > len(s1):
+        s0, s1 = s1, s0
+    if not s0:
+        return len(s1)
+
+    # Bit i of match_masks[c] is set if s0[i] is c.
+    match_masks = {}
+    for i, c in enumerate(s0):
+        match_masks[c] = match_masks.get(c, 0) | (1 << i)
+
+    all_bits = (1 << len(s0)) - 1
+    last_bit = 1 << (len(s0) - 1)
+    # Vertical deltas (+1 / -1) between adjacent cells of the current column.
+    positive_vertical = all_bits
+    negative_vertical = 0
+    distance = len(s0)
+    for c in s1:
+        matches = match_masks.get(c, 0)
+        x_vertical = matches | negative_vertical
+        x_horizontal = (
+            ((matches & positive_vertical) + positive_vertical) ^ positive_vertical
+        ) | matches
+        positive_horizontal = negative_vertical | (
+            ~(x_horizontal | positive_vertical) & all_bits
+        )
+        negative_horizontal = positive_vertical & x_horizontal
+        if positive_horizontal & last_bit:
+            distance += 1
+        elif negative_horizontal & last_bit:
+            distance -= 1
+        positive_horizontal = ((positive_horizontal << 1) | 1) & all_bits
+        negative_horizontal = (negative_horizontal << 1) & all_bits
+        positive_vertical = negative_horizontal | (
+            ~(x_vertical | positive_horizontal) & all_bits
+        )
+        negative_vertical = positive_horizontal & x_vertical
+    return distance
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def normalized_similarity(s0: str, s1: str) -> float:
+    """Return similarity of two (already normalized) strings, from 0.0
+    (completely different) to 1.0 (identical): 1 - distance / longer length,
+    exactly as strsimpy's NormalizedLevenshtein calculates it.
+    """
+    if s0 == s1:
+        return 1.0
+    max_length = max(len(s0), len(s1))
+    return 1.0 - levenshtein_distance(s0, s1) / max_length
+
+
+def normalized_similarity_upper_bound(s0: str, s1: str) -> float:
+    """Return the highest similarity two (already normalized) strings could
+    have, from their lengths alone: at least the difference in length must be
+    inserted or deleted.  Calculated the same way as normalized_similarity(),
+    so the bound holds exactly, not just approximately, for float results.
+    """
+    if s0 == s1:
+        return 1.0
+    max_length = max(len(s0), len(s1))
+    return 1.0 - (max_length - min(len(s0), len(s1))) / max_length
+
+
+def title_similarity(title_1: str, title_2: str) -> float:
+    """Return similarity score for two titles, after normalizing them.
+    Similarity score ranges from 0.0 (completely different) to 1.0 (identical).
+    """
+    return normalized_similarity(normalize(title_1), normalize(title_2))
+
+
+def title_similarity_upper_bound(title_1: str, title_2: str) -> float:
+    """Return the highest similarity score two titles could have, without
+    calculating it; title_similarity() is never more than this.
+    """
+    return normalized_similarity_upper_bound(normalize(title_1), normalize(title_2))